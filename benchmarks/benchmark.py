@@ -0,0 +1,243 @@
+"""Micro-benchmarks of the per-notification hot paths
+
+Usage: python benchmarks/benchmark.py [-o results.json] [-r REPEAT] [-k SUBSTRING]
+
+Each benchmark reports the best per-call latency over several runs and the corresponding
+calls (events) per second. The results are written as JSON so that they can be compared over time.
+"""
+import argparse
+import json
+import platform
+import sys
+import timeit
+from datetime import datetime
+from itertools import cycle
+from typing import Any, Callable, Dict, List, Tuple
+
+from tomotoio.constants import UUIDs
+from tomotoio.cube import Cube, Peer
+from tomotoio.data import Light, Note
+from tomotoio.filters import DeadBand
+from tomotoio.geo import Vector, normalized
+from tomotoio.messages import *
+from tomotoio.navigator import CircleCommand, MoveCommand, Navigator
+
+BENCHMARKS: List[Tuple[str, Callable[[], Callable[[], Any]]]] = list()
+
+POSITION_ID = bytes([0x01, 0xc5, 0x02, 0x7f, 0x01, 0x32, 0x01, 0xbc, 0x02, 0x82, 0x01, 0x33, 0x01])
+STANDARD_ID = bytes([0x02, 0x00, 0x00, 0x38, 0x00, 0x15, 0x00])
+MISSED_ID = bytes([0x03])
+MOTION = bytes([0x01, 0x01, 0x00, 0x00, 0x01])
+BUTTON = bytes([0x01, 0x80])
+
+
+def benchmark(name: str):
+    """Registers a function that sets up a benchmark and returns the operation to measure."""
+    def register(setup: Callable[[], Callable[[], Any]]):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return register
+
+
+class NullPeer(Peer):
+    def disconnect(self):
+        pass
+
+    def read(self, uuid) -> bytes:
+        return POSITION_ID
+
+    def write(self, uuid, data: bytes, withResponse=False):
+        pass
+
+    def enableNotification(self, uuid, value: bool = True):
+        pass
+
+    def addListener(self, listener):
+        pass
+
+
+@benchmark("messages.decodeToioID.position")
+def _():
+    return lambda: decodeToioID(POSITION_ID)
+
+
+@benchmark("messages.decodeToioID.standard")
+def _():
+    return lambda: decodeToioID(STANDARD_ID)
+
+
+@benchmark("messages.decodeToioID.missed")
+def _():
+    return lambda: decodeToioID(MISSED_ID)
+
+
+@benchmark("messages.decodeMotion")
+def _():
+    return lambda: decodeMotion(MOTION)
+
+
+@benchmark("messages.decodeButton")
+def _():
+    return lambda: decodeButton(BUTTON)
+
+
+@benchmark("messages.encodeMotor")
+def _():
+    return lambda: encodeMotor(80, -40, 1.5)
+
+
+@benchmark("messages.encodeLight")
+def _():
+    return lambda: encodeLight(255, 128, 0, 0.5)
+
+
+@benchmark("messages.encodeLightPattern")
+def _():
+    lights = [Light(255, 0, 0, 0.2), Light(0, 0, 0, 0.1)]
+    return lambda: encodeLightPattern(lights, 3)
+
+
+@benchmark("messages.encodeSound")
+def _():
+    return lambda: encodeSound(3, 255)
+
+
+@benchmark("messages.encodeSoundByNotes")
+def _():
+    notes = [Note(60, 0.1), Note(64, 0.1), Note(67, 0.1)]
+    return lambda: encodeSoundByNotes(notes, 1)
+
+
+def _dispatch(listenerCount: int):
+    cube = Cube(NullPeer(), "bench")
+    for _ in range(listenerCount):
+        cube.toioID.addListener(lambda e: None)
+    return lambda: cube._handleNotification(UUIDs.TOIO_ID, POSITION_ID)
+
+
+for n in (0, 1, 10):
+    benchmark("cube.handleNotification.listeners=%d" % n)(lambda n=n: _dispatch(n))
+
+
+@benchmark("cube.handleNotification.deadBand")
+def _():
+    # The position jitters by 1 unit, so the listener is filtered out before decoding
+    cube = Cube(NullPeer(), "bench")
+    cube.toioID.addListener(lambda e: None, filter=DeadBand())
+    jittered = bytes([POSITION_ID[0], POSITION_ID[1] + 1]) + POSITION_ID[2:]
+    nextPosition = cycle([POSITION_ID, jittered]).__next__
+    return lambda: cube._handleNotification(UUIDs.TOIO_ID, nextPosition())
+
+
+@benchmark("geo.Vector.construct")
+def _():
+    return lambda: Vector(1.5, 2.5)
+
+
+@benchmark("geo.Vector.constructFromPoint")
+def _():
+    p = decodeToioID(POSITION_ID)
+    return lambda: Vector(p)
+
+
+@benchmark("geo.Vector.add")
+def _():
+    (a, b) = (Vector(1.5, 2.5), Vector(3.5, 4.5))
+    return lambda: a + b
+
+
+@benchmark("geo.Vector.sub")
+def _():
+    (a, b) = (Vector(1.5, 2.5), Vector(3.5, 4.5))
+    return lambda: a - b
+
+
+@benchmark("geo.Vector.mul")
+def _():
+    a = Vector(1.5, 2.5)
+    return lambda: a * 3
+
+
+@benchmark("geo.Vector.magnitude")
+def _():
+    a = Vector(1.5, 2.5)
+    return a.magnitude
+
+
+@benchmark("geo.Vector.normalize")
+def _():
+    a = Vector(1.5, 2.5)
+    return a.normalize
+
+
+@benchmark("geo.Vector.transform")
+def _():
+    a = Vector(1.5, 2.5)
+    m = (1, -0.5, 0.5, 1)
+    return lambda: a.transform(m)
+
+
+@benchmark("geo.Vector.iadd")
+def _():
+    (a, b) = (Vector(1.5, 2.5), Vector(0, 0))
+    return lambda: a.__iadd__(b)
+
+
+@benchmark("geo.normalized")
+def _():
+    return lambda: normalized(1.5, 2.5)
+
+
+@benchmark("navigator.MoveCommand.handleNotification")
+def _():
+    nav = Navigator(Cube(NullPeer(), "bench"))
+    command = MoveCommand(nav, 250, 250, 10)
+    e = decodeToioID(POSITION_ID)
+    return lambda: command.handleNotification(e)
+
+
+@benchmark("navigator.CircleCommand.handleNotification")
+def _():
+    nav = Navigator(Cube(NullPeer(), "bench"))
+    command = CircleCommand(nav, 250, 250, 100)
+    e = decodeToioID(POSITION_ID)
+    return lambda: command.handleNotification(e)
+
+
+def measure(op: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    timer = timeit.Timer(op)
+    (number, _) = timer.autorange()
+    best = min(timer.repeat(repeat, number)) / number
+    return {"perCallSeconds": best, "eventsPerSecond": 1 / best, "number": number}
+
+
+def run(repeat: int = 5, filter: str = None) -> Dict[str, Any]:
+    results = dict()
+    for (name, setup) in BENCHMARKS:
+        if filter and filter not in name:
+            continue
+        results[name] = r = measure(setup(), repeat)
+        print("%-48s %10.3f us %14.0f /s" % (name, r["perCallSeconds"] * 1e6, r["eventsPerSecond"]), file=sys.stderr)
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', dest='output', help="Output JSON file (stdout if omitted)")
+    parser.add_argument('-r', dest='repeat', type=int, default=5, help="Number of runs to take the best of")
+    parser.add_argument('-k', dest='filter', help="Run only the benchmarks whose name contains this")
+    args = parser.parse_args()
+
+    report = run(args.repeat, args.filter)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
@@ -1,7 +1,7 @@
 import logging as log
 from math import hypot
-from time import sleep
 
+from tomotoio.fleet import Fleet, Tick
 from tomotoio.geo import Vector
 from utils import createCubes, createNavigators, releaseCubes
 
@@ -9,19 +9,24 @@ cubes = createCubes()
 navs = createNavigators(cubes)
 
 (chaser, target) = (navs[0], navs[1])
+fleet = Fleet(navs, rate=10)
 
 center = None
 
+
+def tick(t: Tick):
+    global center
+
+    (cp, tp) = (t.positions[0], t.positions[1])
+    if cp and tp:
+        if center is None or Vector(center, tp).magnitude() > 10:
+            center = tp
+            t.circle(0, tp.x, tp.y, Vector(tp, cp).magnitude())
+            t.call(chaser.cube.setSoundEffect, 3)
+
+
 try:
-    while True:
-        sleep(0.1)
-
-        (cp, tp) = (chaser.lastPosition, target.lastPosition)
-        if cp and tp:
-            if center is None or Vector(center, tp).magnitude() > 10:
-                center = tp
-                chaser.circle(tp.x, tp.y, Vector(tp, cp).magnitude())
-                chaser.cube.setSoundEffect(3)
+    fleet.run(tick)
 
 finally:
     releaseCubes(cubes)
@@ -11,42 +11,41 @@ Note:
 import logging as log
 from functools import partial
 from random import randint, random
-from time import sleep, time
+from time import sleep
 from typing import Optional
 
 from pymouse import PyMouse
 
 from tomotoio.data import Motion, PositionID
+from tomotoio.executor import ListenerExecutor
+from tomotoio.filters import MinInterval
 from tomotoio.geo import angleDiff
 from utils import Cube, createCubes, releaseCubes
 
 mouse = PyMouse()
 
-cubes = createCubes()
+# Move the mouse off the notification thread; stale positions are skipped while it is busy
+cubes = createCubes(listenerExecutor=ListenerExecutor(workers=1))
 cube = cubes[0]
 lastPosition: Optional[PositionID] = None
-lastTime = time()
 
 try:
     def positionListener(e):
-        global lastPosition, lastTime
+        global lastPosition
         if isinstance(e, PositionID):
-            if time() - lastTime > 0.05: # throttling
-                lastTime = time()
-                
-                if lastPosition:
-                    p = mouse.position()
-                    (dx, dy) = (e.x - lastPosition.x, e.y - lastPosition.y)
-                    mouse.move(p[0] + dx * 10, p[1] + dy * 10)
-                    
-                    k0 = lastPosition.angle // 5
-                    k1 = e.angle // 5
-                    k = (k1 - k0 + 36) % 72 - 36
-                    
-                    if abs(k) >= 2:
-                        mouse.scroll(vertical=-k)
-                    
-                lastPosition = e
+            if lastPosition:
+                p = mouse.position()
+                (dx, dy) = (e.x - lastPosition.x, e.y - lastPosition.y)
+                mouse.move(p[0] + dx * 10, p[1] + dy * 10)
+
+                k0 = lastPosition.angle // 5
+                k1 = e.angle // 5
+                k = (k1 - k0 + 36) % 72 - 36
+
+                if abs(k) >= 2:
+                    mouse.scroll(vertical=-k)
+
+            lastPosition = e
         else:
             lastPosition = None
 
@@ -57,7 +56,7 @@ try:
             cube.setSoundEffect(1)
             cube.setMotor(100, 100, 0.2)
 
-    cube.toioID.addListener(positionListener)
+    cube.toioID.addListener(positionListener, filter=MinInterval(0.05))
     cube.toioID.enableNotification()
     cube.motion.addListener(clickListener)
     cube.motion.enableNotification()
@@ -1,11 +1,12 @@
 import logging as log
 from enum import Enum
 from random import random
-from time import sleep, time
+from time import monotonic, sleep, time
 from typing import cast
 
 from tomotoio.data import Motion, Note, PositionID
 from tomotoio.geo import Vector
+from tomotoio.history import historySizeFor
 from tomotoio.navigator import NavigationCommandBase, RotateCommand
 from utils import createCubes, createNavigators, releaseCubes
 
@@ -17,6 +18,10 @@ PLAYER_MOVE_SOUND = [
 ]
 PLAYER_BACK_SOUND = [Note(76, 0.05), Note(82, 0.05)]
 
+# The player backs off if the ball has not moved this many seconds while it is pushing it
+STALL_WINDOW = 2.0
+STALL_TOLERANCE = 5
+
 
 class BallCommand(NavigationCommandBase):
     class State(Enum):
@@ -74,13 +79,13 @@ class BallCommand(NavigationCommandBase):
 
 
 cubes = createCubes()
-navs = createNavigators(cubes)
+navs = createNavigators(cubes, historySize=historySizeFor(STALL_WINDOW))
 (player, ball) = (navs[0], navs[1])
 
 ball.setCommand(BallCommand(ball))
 
 try:
-    playerTrace = list()
+    moveSince = None
     moveSound = 0
     while True:
         sleep(0.1)
@@ -94,22 +99,20 @@ try:
                 a = abs(bpp.angle(cbp))
                 if m < 100 and a > 45:
                     player.circle(bp.x, bp.y, 30)
+                    moveSince = None
                 else:
                     player.move(bp.x, bp.y, 20, fixedSpeed=True, moveRotateThreshold=30)
                     player.cube.setMusic(PLAYER_MOVE_SOUND[moveSound], 0)
                     moveSound = (moveSound + 1) % len(PLAYER_MOVE_SOUND)
 
-                    playerTrace.append(bp)
-                    if len(playerTrace) > 20:
-                        playerTrace = playerTrace[-20:]
-                        dx = max([p.x for p in playerTrace]) - min([p.x for p in playerTrace])
-                        dy = max([p.y for p in playerTrace]) - min([p.y for p in playerTrace])
-                        if dx < 5 and dy < 5:
-                            player.setCommand(None)
-                            player.cube.setMotor(-60, -60, 0.2)
-                            player.cube.setMusic(PLAYER_BACK_SOUND, 5)
-                            sleep(0.2)
-                            playerTrace = list()
+                    if moveSince is None:
+                        moveSince = monotonic()
+                    if ball.history.isStalled(STALL_WINDOW, STALL_TOLERANCE, since=moveSince):
+                        player.setCommand(None)
+                        player.cube.setMotor(-60, -60, 0.2)
+                        player.cube.setMusic(PLAYER_BACK_SOUND, 5)
+                        sleep(0.2)
+                        moveSince = None
 
             else:
                 if player.command and bpp.magnitude() < 40:
@@ -1,5 +1,4 @@
-from time import sleep
-
+from tomotoio.fleet import Fleet, Tick
 from tomotoio.navigator import Mat
 from utils import createCubes, createNavigators, releaseCubes
 
@@ -7,21 +6,26 @@ cubes = createCubes()
 navs = createNavigators(cubes)
 
 (chaser, target) = (navs[0], navs[1])
+fleet = Fleet(navs, rate=10)
 
 isComplete = False
 
-try:
-    while True:
-        sleep(0.1)
 
-        tp = target.lastPosition
-        if tp:
-            p = target.mat.center * 2 - tp
-            chaser.move(p.x, p.y, 10)
+def tick(t: Tick):
+    global isComplete
+
+    tp = t.positions[1]
+    if tp:
+        p = target.mat.center * 2 - tp
+        t.move(0, p.x, p.y, 10)
 
-        if chaser.command and chaser.command.complete != isComplete:
-            isComplete = chaser.command.complete
-            chaser.cube.setSoundEffect(6 if isComplete else 3)
+    if chaser.command and chaser.command.complete != isComplete:
+        isComplete = chaser.command.complete
+        t.call(chaser.cube.setSoundEffect, 6 if isComplete else 3)
+
+
+try:
+    fleet.run(tick)
 
 finally:
     releaseCubes(cubes)
@@ -1,18 +1,42 @@
 import logging as log
+from concurrent.futures import ThreadPoolExecutor
 from time import sleep
-from typing import Iterable, List
+from typing import Iterable, List, Optional
 
 from tomotoio.cube import Cube
 from tomotoio.data import Light, Note
-from tomotoio.factory import createCubesFromFile
+from tomotoio.executor import ListenerExecutor
+from tomotoio.factory import connectCubesFromFile, connectCubesSharded, readAddresses
+from tomotoio.handlecache import HandleCache
 from tomotoio.navigator import Navigator
 
 
 def createCubes(logLevel: int = log.DEBUG, cubesFile: str = "toio-cubes.txt",
-                initialReport: bool = True, iface: int = 0) -> List[Cube]:
+                initialReport: bool = True, iface: int = 0, sharedReactor: bool = False,
+                listenerExecutor: Optional[ListenerExecutor] = None,
+                ifaces: Optional[List[int]] = None,
+                handleCacheFile: Optional[str] = "toio-handles.json", allowPartial: bool = False) -> List[Cube]:
+    """Connects to the cubes listed in cubesFile.
+
+    The examples give the cubes roles by their order, so unless allowPartial is set, a cube failing
+    to connect disconnects the others and raises ConnectionError.
+    """
     log.basicConfig(level=logLevel)
+    handleCache = HandleCache(handleCacheFile) if handleCacheFile else None
 
-    cubes = createCubesFromFile(cubesFile, iface=iface)
+    if ifaces:
+        # Spread the cubes over several adapters
+        result = connectCubesSharded(readAddresses(cubesFile), ifaces, sharedReactor=sharedReactor,
+                                     listenerExecutor=listenerExecutor, handleCache=handleCache)
+    else:
+        result = connectCubesFromFile(cubesFile, iface=iface, sharedReactor=sharedReactor,
+                                      listenerExecutor=listenerExecutor, handleCache=handleCache)
+    for address, ex in result.failures.items():
+        log.error("Failed to connect to %s: %s", address, ex)
+    cubes = result.cubes
+    if result.failures and not allowPartial:
+        releaseCubes(cubes)
+        raise ConnectionError("Failed to connect to %s" % ", ".join(result.failures))
 
     sleep(0.5)
 
@@ -33,15 +57,21 @@ def runInitialReport(cubes: Iterable[Cube]):
         Light(255, 0, 255, onDuration),
     ]
 
-    for i, c in enumerate(cubes):
+    def report(i: int, c: Cube):
         log.info("Cube %d: Battery=%d", i + 1, c.battery.get())
         c.setLightPattern([colors[i % len(colors)], Light(0, 0, 0, offDuration)], repeat)
         c.setMusic([Note(80, 0.1), Note(Note.REST, 0.05)], i + 1)
+
+    # All the cubes identify themselves at once; each one beeps as many times as its number
+    cubes = list(cubes)
+    if cubes:
+        with ThreadPoolExecutor(max_workers=len(cubes)) as executor:
+            list(executor.map(report, range(len(cubes)), cubes))
         sleep(1)
 
 
-def createNavigators(cubes: Iterable[Cube]) -> List[Navigator]:
-    return [Navigator(c) for c in cubes]
+def createNavigators(cubes: Iterable[Cube], historySize: int = 128) -> List[Navigator]:
+    return [Navigator(c, historySize) for c in cubes]
 
 
 def releaseCubes(cubes: Iterable[Cube]):
@@ -1,7 +1,12 @@
 file=toio-cubes.txt
+cachefile=toio-cubes-cache.json
 tmpfile=/tmp/$file.tmp
 
-if (sudo `which python` tomotoio/scanner.py $* > $tmpfile)
+# With a cube list from before, the scan ends as soon as all of those cubes are seen
+known=
+[ -f $file ] && known="-k $file"
+
+if (sudo `which python` tomotoio/scanner.py $known -c $cachefile $* > $tmpfile)
 then
   if [ -s $tmpfile ]
   then
@@ -0,0 +1,106 @@
+import asyncio
+import unittest
+from threading import current_thread
+
+from tomotoio.asynccube import AsyncCube, AsyncNavigator, AsyncPeer
+from tomotoio.simpeer import SIM_PROTOCOL_VERSION, SimPeer
+
+
+class VersionRecordingPeer(SimPeer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.protocolVersion = None
+        self.protocolVersionThread = None
+
+    def setProtocolVersion(self, version: str):
+        self.protocolVersion = version
+        self.protocolVersionThread = current_thread()
+
+
+async def simulate(peer: SimPeer, duration: float):
+    # Steps the simulation while letting the loop deliver the notifications and run the writes
+    for _ in range(int(round(duration / peer.notificationInterval))):
+        peer.step(peer.notificationInterval)
+        await asyncio.sleep(0.001)
+
+
+async def connect(peer: SimPeer):
+    cube = AsyncCube(AsyncPeer(peer), "sim")
+    nav = AsyncNavigator(cube)
+    await asyncio.sleep(0.01)  # For enableNotification to run on the peer thread
+    return (cube, nav)
+
+
+class TestAsyncCube(unittest.TestCase):
+    def testPeerNeedsRunningLoop(self):
+        self.assertRaises(RuntimeError, AsyncPeer, SimPeer(timeScale=None))
+
+    def testMoveReturnsTrueWhenReached(self):
+        async def main():
+            peer = SimPeer(200, 250, 0, timeScale=None)
+            (cube, nav) = await connect(peer)
+            move = asyncio.ensure_future(nav.move(260, 250, 10))
+            await simulate(peer, 5)
+            self.assertTrue(await asyncio.wait_for(move, 1))
+            self.assertLess(abs(peer.x - 260), 15)
+
+        asyncio.run(main())
+
+    def testSupersededMoveReturnsFalse(self):
+        async def main():
+            peer = SimPeer(200, 250, 0, timeScale=None)
+            (cube, nav) = await connect(peer)
+            first = asyncio.ensure_future(nav.move(400, 250, 10))
+            await simulate(peer, 0.1)
+            second = asyncio.ensure_future(nav.rotate(90, 10))
+            await simulate(peer, 0.1)
+            self.assertFalse(await asyncio.wait_for(first, 1))
+            self.assertFalse(second.done())
+
+            third = asyncio.ensure_future(nav.rotate(180, 10))
+            await simulate(peer, 0.1)
+            # An updated target supersedes the same kind of command too
+            self.assertFalse(await asyncio.wait_for(second, 1))
+            await simulate(peer, 5)
+            self.assertTrue(await asyncio.wait_for(third, 1))
+
+        asyncio.run(main())
+
+    def testMoveTimesOut(self):
+        async def main():
+            peer = SimPeer(200, 250, 0, timeScale=None)
+            (cube, nav) = await connect(peer)
+            with self.assertRaises(asyncio.TimeoutError):
+                await nav.move(400, 250, 10, timeout=0.05)
+
+        asyncio.run(main())
+
+    def testProtocolVersionIsRecordedOffLoop(self):
+        async def main():
+            peer = VersionRecordingPeer(timeScale=None)
+            cube = AsyncCube(AsyncPeer(peer), "sim")
+            self.assertEqual(await cube.getConfigProtocolVersion(), SIM_PROTOCOL_VERSION)
+            self.assertEqual(peer.protocolVersion, SIM_PROTOCOL_VERSION)
+            # The handle cache of a BlePeer writes its file here, which must not block the loop
+            self.assertIsNot(peer.protocolVersionThread, current_thread())
+
+        asyncio.run(main())
+
+    def testTryWritesAndRelease(self):
+        async def main():
+            peer = SimPeer(200, 250, 0, timeScale=None)
+            asyncPeer = AsyncPeer(peer)
+            cube = AsyncCube(asyncPeer, "sim")
+            self.assertTrue(await cube.trySetMotor(50, 60))
+            self.assertEqual(peer.motor, (50, 60))
+            peer.tryWrite = lambda uuid, data, withResponse=False: False  # As with a full write queue
+            self.assertFalse(await cube.trySetLight(255, 0, 0))
+            await cube.release()
+            # The worker thread is shut down with the peer
+            self.assertRaises(RuntimeError, asyncPeer.read, None)
+
+        asyncio.run(main())
+
+
+if __name__ == '__main__':
+    unittest.main()
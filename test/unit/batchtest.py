@@ -0,0 +1,56 @@
+import unittest
+
+import tomotoio.data as td
+import tomotoio.messages as tm
+
+try:
+    import numpy as np
+    import tomotoio.batch as tb
+except ImportError:
+    np = None  # NumPy is an optional dependency
+
+POSITION_ID = bytes([0x01, 0xc5, 0x02, 0x7f, 0x01, 0x32, 0x01, 0xbc, 0x02, 0x82, 0x01, 0x33, 0x01])
+STANDARD_ID = bytes([0x02, 0x00, 0x00, 0x38, 0x00, 0x15, 0x00])
+
+
+@unittest.skipUnless(np, "numpy not installed")
+class TestBatch(unittest.TestCase):
+    def testDecodePositionIDBuffer(self):
+        a = tb.decodePositionIDBuffer(POSITION_ID * 3)
+        self.assertEqual(len(a), 3)
+        p = tm.decodeToioID(POSITION_ID)
+        for f in ['x', 'y', 'angle', 'sensorX', 'sensorY', 'sensorAngle']:
+            self.assertTrue(np.all(a[f] == getattr(p, f)))
+        self.assertTrue(np.all(a['type'] == td.ToioIDType.POSITION.value))
+
+    def testDecodePositionIDBufferRejectsWrongLength(self):
+        self.assertRaises(ValueError, tb.decodePositionIDBuffer, POSITION_ID + b'\x01')
+
+    def testDecodeToioIDsOfMixedTypes(self):
+        a = tb.decodeToioIDs([POSITION_ID, STANDARD_ID, bytes([0x03]), bytes([0x04]), bytes([0xff, 0x01, 0x02])])
+        self.assertEqual(list(a['type']), [1, 2, 3, 3, 3])
+        self.assertEqual(list(a['fromType'][2:]), [td.ToioIDType.POSITION.value, td.ToioIDType.STANDARD.value,
+                                                   td.ToioIDType.INVALID.value])
+        self.assertEqual((a[0]['x'], a[0]['y'], a[0]['angle']), (709, 383, 306))
+        self.assertEqual((a[1]['value'], a[1]['angle']), (3670016, 21))
+        self.assertEqual(a[1]['x'], 0)
+
+    def testDecodeToioIDsRejectsInvalidMessages(self):
+        self.assertRaises(ValueError, tb.decodeToioIDs, [bytes([0x05])])
+        self.assertRaises(ValueError, tb.decodeToioIDs, [bytes([0x01, 0x01, 0x02])])
+
+    def testEncodeMotorsMatchesEncodeMotor(self):
+        left = [100, -100, 0, 55.7]
+        right = [-20, 20, 0, -3.2]
+        a = tb.encodeMotors(left, right, [0, 0.1, 5, 1.5])
+        for i in range(len(left)):
+            self.assertEqual(a[i].tobytes(), tm.encodeMotor(int(left[i]), int(right[i]), [0, 0.1, 5, 1.5][i]))
+
+    def testEncodeMotorsBroadcastsScalars(self):
+        a = tb.encodeMotors([10, 20], 30)
+        self.assertEqual(a.shape, (2, 8))
+        self.assertEqual(a[1].tobytes(), tm.encodeMotor(20, 30))
+
+
+if __name__ == '__main__':
+    unittest.main()
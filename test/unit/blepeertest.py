@@ -0,0 +1,180 @@
+import os
+import unittest
+from threading import Event, current_thread
+from unittest.mock import patch
+
+from bluepy.btle import BTLEDisconnectError
+
+from tomotoio.blepeer import BlePeer, BleReactor
+from tomotoio.factory import AdapterPool
+
+
+class PipePeer:
+    """Stands for a BlePeer, with a pipe in place of the bluepy helper."""
+
+    def __init__(self, failure: Exception = None):
+        (self.reader, self.writer) = os.pipe()
+        self.failure = failure
+        self.registered = True
+        self.connected = True
+        self.notified = Event()
+        self.written = Event()
+        self.threads = set()
+
+    def fileno(self) -> int:
+        return self.reader
+
+    def notify(self):
+        os.write(self.writer, b'n')
+
+    def _processNotification(self):
+        os.read(self.reader, 1)
+        self.threads.add(current_thread())
+        if self.failure:
+            raise self.failure
+        self.notified.set()
+
+    def _processWrites(self):
+        self.threads.add(current_thread())
+        self.written.set()
+
+    def close(self):
+        os.close(self.reader)
+        os.close(self.writer)
+
+
+def isOpen(fd: int) -> bool:
+    try:
+        os.fstat(fd)
+        return True
+    except OSError:
+        return False
+
+
+class TestBleReactor(unittest.TestCase):
+    def setUp(self):
+        self.reactor = BleReactor("Test reactor")
+        self.peers = list()
+
+    def tearDown(self):
+        self.reactor.close()
+        for p in self.peers:
+            p.close()
+
+    def addPeer(self, failure: Exception = None) -> PipePeer:
+        peer = PipePeer(failure)
+        self.peers.append(peer)
+        self.reactor.add(peer)
+        return peer
+
+    def testWakesUpOnNotificationAndWrite(self):
+        peer = self.addPeer()
+        peer.notify()
+        self.assertTrue(peer.notified.wait(1))
+        self.reactor.requestWrite(peer)
+        self.assertTrue(peer.written.wait(1))
+        self.assertEqual(peer.threads, {self.reactor.thread})
+
+    def testRemoveWaitsUntilUnregistered(self):
+        (a, b) = (self.addPeer(), self.addPeer())
+        a.notify()
+        self.assertTrue(a.notified.wait(1))
+        self.reactor.remove(a)
+        self.assertNotIn(a, self.reactor.registeredPeers)
+        self.assertIsNotNone(self.reactor.thread)
+
+        thread = self.reactor.thread
+        self.reactor.remove(b)
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(self.reactor.thread)
+
+    def testDisconnectedPeerDoesNotStopOthers(self):
+        failing = self.addPeer(BTLEDisconnectError("gone"))
+        other = self.addPeer()
+        with self.assertLogs(level='ERROR'):
+            failing.notify()
+            other.notify()
+            self.assertTrue(other.notified.wait(1))
+            with self.reactor.lock:
+                while failing in self.reactor.registeredPeers:
+                    self.reactor.updated.wait(1)
+        self.assertFalse(failing.connected)
+        self.assertFalse(failing.registered)
+        other.notified.clear()
+        other.notify()
+        self.assertTrue(other.notified.wait(1))
+
+    def testCloseStopsThreadAndReleasesDescriptors(self):
+        self.addPeer()
+        thread = self.reactor.thread
+        fds = (self.reactor.wakeupReader, self.reactor.wakeupWriter)
+        self.reactor.close()
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(any(isOpen(fd) for fd in fds))
+        self.assertRaises(RuntimeError, self.reactor.add, PipePeer())
+        self.reactor.close()
+
+    def testCloseWithoutThread(self):
+        fds = (self.reactor.wakeupReader, self.reactor.wakeupWriter)
+        self.reactor.close()
+        self.assertFalse(any(isOpen(fd) for fd in fds))
+
+
+class FakePeripheral:
+    def __init__(self):
+        self.disconnected = False
+
+    def withDelegate(self, delegate):
+        return self
+
+    def getCharacteristics(self, startHnd=1, endHnd=0xFFFF):
+        return list()
+
+    def disconnect(self):
+        self.disconnected = True
+
+
+class TestBlePeer(unittest.TestCase):
+    def connect(self, reactor=None) -> BlePeer:
+        with patch('tomotoio.blepeer.Peripheral', lambda *args: FakePeripheral()):
+            return BlePeer("D0:00:00:00:00:01", reactor=reactor)
+
+    def testDisconnectClosesPrivateReactor(self):
+        peer = self.connect()
+        fd = peer.reactor.wakeupReader
+        peer.disconnect()
+        self.assertTrue(peer.reactor.closed)
+        self.assertTrue(peer.peripheral.disconnected)
+        self.assertFalse(isOpen(fd))
+
+    def testDisconnectKeepsSharedReactor(self):
+        reactor = BleReactor()
+        peer = self.connect(reactor)
+        peer.disconnect()
+        self.assertFalse(reactor.closed)
+        reactor.close()
+
+    def testSharedReactorClosesWithLastPeer(self):
+        reactor = BleReactor(closeWhenUnused=True)
+        (a, b) = (self.connect(reactor), self.connect(reactor))
+        fds = (reactor.wakeupReader, reactor.wakeupWriter)
+        a.disconnect()
+        a.disconnect()  # Releases the reactor only once
+        self.assertFalse(reactor.closed)
+        b.disconnect()
+        self.assertTrue(reactor.closed)
+        self.assertFalse(any(isOpen(fd) for fd in fds))
+
+    def testPoolClosesItsReactors(self):
+        pool = AdapterPool([0, 1], sharedReactor=True)
+        peer = self.connect(pool.reactors[0])
+        pool.add(0, peer)
+        peer.disconnect()
+        self.assertFalse(pool.reactors[0].closed)
+        pool.close()
+        self.assertTrue(all(r.closed for r in pool.reactors.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,216 @@
+import unittest
+from queue import Full
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from tomotoio.blepeer import BlePeer
+from tomotoio.constants import UUIDs
+from tomotoio.cube import MOTOR_REFRESH_MARGIN, Cube, Peer
+from tomotoio.data import PositionID
+from tomotoio.executor import ListenerExecutor
+from tomotoio.filters import OnChange
+from tomotoio.writequeue import OverflowPolicy
+
+POSITION_ID = bytes([0x01, 0x2c, 0x01, 0x5e, 0x01, 0x5a, 0x00, 0x2c, 0x01, 0x5e, 0x01, 0x5a, 0x00])
+
+
+class ListenerPeer(Peer):
+    def __init__(self):
+        self.listeners = list()
+
+    def addListener(self, listener):
+        self.listeners.append(listener)
+
+    def notify(self, uuid, data):
+        for listener in self.listeners:
+            listener(uuid, data)
+
+
+class WritePeer(Peer):
+    def __init__(self):
+        self.writes = list()
+
+    def write(self, uuid, data, withResponse=False):
+        self.writes.append((uuid, data))
+
+
+class TestCube(unittest.TestCase):
+    def testDecodesOnceForAllListeners(self):
+        peer = ListenerPeer()
+        cube = Cube(peer, "test")
+        decoded = list()
+        cube.registerDecoder(UUIDs.TOIO_ID, lambda data: decoded.append(data) or data[0])
+
+        peer.notify(UUIDs.TOIO_ID, POSITION_ID)
+        self.assertEqual(decoded, [])  # No listeners, no decoding
+
+        (a, b) = (list(), list())
+        cube.toioID.addListener(a.append)
+        cube.toioID.addListener(b.append)
+        peer.notify(UUIDs.TOIO_ID, POSITION_ID)
+        peer.notify(UUIDs.MOTION, b'\x01\x01\x00\x00\x01')
+        self.assertEqual(len(decoded), 1)
+        self.assertEqual((a, b), ([0x01], [0x01]))
+
+    def testDefaultDecoders(self):
+        peer = ListenerPeer()
+        cube = Cube(peer, "test")
+        (ids, levels, configs) = (list(), list(), list())
+        cube.toioID.addListener(ids.append)
+        cube.battery.addListener(levels.append)
+        cube.addListener(UUIDs.CONFIG, configs.append)
+        peer.notify(UUIDs.TOIO_ID, POSITION_ID)
+        peer.notify(UUIDs.BATTERY, b'\x50')
+        peer.notify(UUIDs.CONFIG, b'\x81\x00')
+        self.assertEqual(ids, [PositionID(300, 350, 90, 300, 350, 90)])
+        self.assertEqual(levels, [80])
+        self.assertEqual(configs, [b'\x81\x00'])
+
+    def testFilterSkipsDecoding(self):
+        peer = ListenerPeer()
+        cube = Cube(peer, "test")
+        decoded = list()
+        cube.registerDecoder(UUIDs.TOIO_ID, lambda data: decoded.append(data) or data)
+        (every, changes) = (list(), list())
+        cube.toioID.addListener(changes.append, filter=OnChange())
+        peer.notify(UUIDs.TOIO_ID, POSITION_ID)
+        peer.notify(UUIDs.TOIO_ID, POSITION_ID)
+        self.assertEqual((len(decoded), len(changes)), (1, 1))
+
+        cube.toioID.addListener(every.append)
+        peer.notify(UUIDs.TOIO_ID, POSITION_ID)
+        self.assertEqual((len(decoded), len(changes), len(every)), (2, 1, 1))
+        cube.toioID.removeListener(every.append)
+        cube.toioID.removeListener(changes.append)
+        self.assertFalse(cube.dispatchers[UUIDs.TOIO_ID].filtered)
+
+    def testListenerOnExecutor(self):
+        peer = ListenerPeer()
+        executor = ListenerExecutor()
+        cube = Cube(peer, "test", executor=executor)
+        ids = list()
+        cube.toioID.addListener(ids.append)
+        peer.notify(UUIDs.TOIO_ID, POSITION_ID)
+        executor.shutdown()
+        self.assertEqual(ids, [PositionID(300, 350, 90, 300, 350, 90)])
+        cube.toioID.removeListener(ids.append)
+        self.assertEqual(cube.dispatchers[UUIDs.TOIO_ID].listeners, [])
+
+
+class TestMotorSuppression(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = patch('tomotoio.cube.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.peer = WritePeer()
+
+    def testSuppressesIdenticalCommand(self):
+        cube = Cube(self.peer, "test", suppressRedundantMotor=True)
+        cube.setMotor(50, 50)
+        self.now += 10
+        cube.setMotor(50, 50)
+        self.assertEqual(len(self.peer.writes), 1)
+        self.assertEqual(cube.suppressedWriteCount, 1)
+
+    def testSendsChangedCommand(self):
+        cube = Cube(self.peer, "test", suppressRedundantMotor=True)
+        cube.setMotor(50, 50)
+        cube.setMotor(60, 50)
+        cube.setMotor(50, 50)
+        self.assertEqual(len(self.peer.writes), 3)
+        self.assertEqual(cube.suppressedWriteCount, 0)
+
+    def testResendsTimedCommandBeforeItExpires(self):
+        cube = Cube(self.peer, "test", suppressRedundantMotor=True)
+        cube.setMotor(50, 50, 1)
+        self.now += 1 - MOTOR_REFRESH_MARGIN - 0.01
+        cube.setMotor(50, 50, 1)
+        self.assertEqual(len(self.peer.writes), 1)
+        self.now += 0.02
+        cube.setMotor(50, 50, 1)
+        self.assertEqual(len(self.peer.writes), 2)
+        self.assertEqual(cube.suppressedWriteCount, 1)
+
+    def testSendsEverythingWhenDisabled(self):
+        cube = Cube(self.peer, "test")
+        for _ in range(3):
+            cube.setMotor(50, 50)
+        self.assertEqual(len(self.peer.writes), 3)
+        self.assertEqual(cube.suppressedWriteCount, 0)
+
+
+class QueuePeripheral:
+    def __init__(self):
+        self.characteristics = [SimpleNamespace(uuid=u, handle=h - 1, valHandle=h, getHandle=lambda h=h: h)
+                                for (u, h) in ((UUIDs.MOTOR, 11), (UUIDs.SOUND, 21))]
+
+    def withDelegate(self, delegate):
+        return self
+
+    def getCharacteristics(self, startHnd=1, endHnd=0xFFFF):
+        return self.characteristics
+
+    def disconnect(self):
+        pass
+
+
+class TestMotorSuppressionOnOverflow(unittest.TestCase):
+    """A motor command the write queue of BlePeer did not send must not suppress the next identical one."""
+
+    def connect(self, policy: OverflowPolicy, timeout: float = None) -> Cube:
+        with patch('tomotoio.blepeer.Peripheral', lambda *args: QueuePeripheral()):
+            peer = BlePeer("D0:00:00:00:00:01", writePolicy=policy, writeTimeout=timeout)
+        self.addCleanup(peer.disconnect)
+        peer.registered = True  # Queue the writes as if the reactor were running
+        peer.reactor.requestWrite = lambda p: None
+        return Cube(peer, "test", suppressRedundantMotor=True)
+
+    def fill(self, cube: Cube):
+        for _ in range(cube.peer.writeQueue.maxsize - len(cube.peer.writeQueue)):
+            cube.setSoundEffect(1)
+
+    def sentMotor(self, cube: Cube) -> int:
+        q = cube.peer.writeQueue
+        count = 0
+        while len(q):
+            count += q.get()[0] == 11
+        return count
+
+    def testDropNewest(self):
+        cube = self.connect(OverflowPolicy.DROP_NEWEST)
+        self.fill(cube)
+        cube.setMotor(50, 50)
+        self.assertEqual(self.sentMotor(cube), 0)
+        cube.setMotor(50, 50)
+        self.assertEqual(self.sentMotor(cube), 1)
+
+    def testRaise(self):
+        cube = self.connect(OverflowPolicy.RAISE)
+        self.fill(cube)
+        self.assertRaises(Full, cube.setMotor, 50, 50)
+        self.assertEqual(self.sentMotor(cube), 0)
+        cube.setMotor(50, 50)
+        self.assertEqual(self.sentMotor(cube), 1)
+
+    def testBlockTimeout(self):
+        cube = self.connect(OverflowPolicy.BLOCK, 0.01)
+        self.fill(cube)
+        self.assertRaises(Full, cube.setMotor, 50, 50)
+        self.assertEqual(self.sentMotor(cube), 0)
+        cube.setMotor(50, 50)
+        self.assertEqual(self.sentMotor(cube), 1)
+
+    def testDropOldestEvictsMotor(self):
+        cube = self.connect(OverflowPolicy.DROP_OLDEST)
+        cube.setMotor(50, 50)
+        self.fill(cube)
+        cube.setSoundEffect(1)  # Evicts the motor command
+        self.assertEqual(self.sentMotor(cube), 0)
+        cube.setMotor(50, 50)
+        self.assertEqual(self.sentMotor(cube), 1)
+        self.assertEqual(cube.suppressedWriteCount, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
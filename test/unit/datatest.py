@@ -0,0 +1,26 @@
+import unittest
+import tomotoio.data as td
+
+
+class TestData(unittest.TestCase):
+    def testPositionIDIsCompactAndImmutable(self):
+        p = td.PositionID(1, 2, 3, 4, 5, 6)
+        self.assertFalse(hasattr(p, '__dict__'))
+        self.assertRaises(AttributeError, setattr, p, 'x', 10)
+        self.assertEqual((p.x, p.y, p.angle, p.sensorX, p.sensorY, p.sensorAngle), (1, 2, 3, 4, 5, 6))
+
+    def testTypeHelpers(self):
+        self.assertTrue(td.PositionID(1, 2, 3, 4, 5, 6).isPosition())
+        self.assertTrue(td.StandardID(1, 2).isStandard())
+        self.assertTrue(td.MissedID(td.ToioIDType.POSITION).isMissed())
+        self.assertFalse(td.MissedID(td.ToioIDType.POSITION).isPosition())
+
+    def testStr(self):
+        self.assertEqual(str(td.StandardID(1, 2)), str({'type': td.ToioIDType.STANDARD, 'value': 1, 'angle': 2}))
+        self.assertEqual(str(td.Motion(True, False, False, td.Orientation.STRAIGHT_UP)),
+                         str({'isLevel': True, 'collision': False, 'doubleTap': False,
+                              'orientation': td.Orientation.STRAIGHT_UP}))
+
+
+if __name__ == '__main__':
+    unittest.main()
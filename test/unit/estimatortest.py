@@ -0,0 +1,53 @@
+import unittest
+
+from tomotoio.data import MissedID, PositionID, ToioIDType
+from tomotoio.estimator import PoseEstimator
+from tomotoio.navigator import calcPoseAfter
+
+
+class TestPoseEstimator(unittest.TestCase):
+    def testExtrapolatesWithLatency(self):
+        est = PoseEstimator(latency=0.05)
+        est.recordMotor(0, 50, 50)
+        est.update(1.0, 100, 100, 0)
+        (x, y, a) = est.predict(1.2)
+        self.assertAlmostEqual(x, calcPoseAfter(100, 100, 0, 50, 50, 0.25)[0])
+        self.assertAlmostEqual(y, 100)
+        self.assertAlmostEqual(a, 0)
+
+    def testFollowsCommandsAndDurations(self):
+        est = PoseEstimator(latency=0, maxDeadReckoning=1)
+        est.update(0, 100, 100, 0)
+        est.recordMotor(0.1, 50, -50, 0.2)
+        est.recordMotor(0.2, 50, 50)
+        (x, y, a) = est.predict(0.4)
+        (ex, ey, ea) = calcPoseAfter(100, 100, 0, 50, -50, 0.1)
+        (ex, ey, ea) = calcPoseAfter(ex, ey, ea, 50, 50, 0.2)
+        self.assertAlmostEqual(x, ex)
+        self.assertAlmostEqual(y, ey)
+        self.assertAlmostEqual(a, ea)
+
+        est.recordMotor(0.5, 50, 50, 0.1)
+        self.assertAlmostEqual(est.predict(0.7)[0], est.predict(0.6)[0])
+
+    def testDeadReckoningThroughMisses(self):
+        est = PoseEstimator(latency=0, maxDeadReckoning=0.5)
+        est.recordMotor(0, 50, 50)
+        est.update(0, 100, 100, 0)
+        missed = MissedID(ToioIDType.POSITION)
+        e = est.predictPositionID(0.3, missed)
+        self.assertIsInstance(e, PositionID)
+        self.assertGreater(e.x, 100)
+        self.assertIs(est.predictPositionID(0.6, missed), missed)
+
+    def testBlendsWithGain(self):
+        est = PoseEstimator(latency=0, gain=0.5)
+        est.update(0, 100, 100, 350)
+        est.update(0.1, 110, 100, 10)
+        (x, y, a) = est.predict(0.1)
+        self.assertAlmostEqual(x, 105)
+        self.assertAlmostEqual(a, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
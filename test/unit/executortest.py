@@ -0,0 +1,101 @@
+import unittest
+from queue import Full
+from threading import Event
+
+from tomotoio.data import Motion, PositionID
+from tomotoio.executor import ListenerExecutor
+from tomotoio.writequeue import OverflowPolicy
+
+
+def position(x):
+    return PositionID(x, 0, 0, x, 0, 0)
+
+
+class TestListenerExecutor(unittest.TestCase):
+    def setUp(self):
+        self.executor = ListenerExecutor(workers=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def testConflatesPositionsButKeepsEdges(self):
+        (started, release) = (Event(), Event())
+        events = list()
+
+        def listener(e):
+            if not started.is_set():
+                started.set()
+                release.wait(5)
+            events.append(e)
+
+        mailbox = self.executor.wrap(listener)
+        mailbox(position(0))
+        started.wait(5)
+        motion = Motion(True, True, False, None)
+        for e in (position(1), position(2), motion, position(3), position(4)):
+            mailbox(e)
+        self.assertEqual(mailbox.conflatedCount, 2)
+        release.set()
+        self.executor.shutdown()
+        self.assertEqual(events, [position(0), position(2), motion, position(4)])
+
+    def testBoundDropsOldestPositionFirst(self):
+        mailbox = ListenerExecutor(workers=1, mailboxSize=3).wrap(lambda e: None)
+        mailbox.scheduled = True  # Hold the events in the mailbox
+        motion = Motion(True, True, False, None)
+        for e in (position(1), motion, position(2), motion, position(3)):
+            mailbox(e)
+        self.assertEqual(list(mailbox.events), [motion, motion, position(3)])
+        self.assertEqual(mailbox.droppedCount, 2)
+
+    def testBoundOfEdgesFollowsPolicy(self):
+        def fill(policy):
+            mailbox = ListenerExecutor(workers=1, mailboxSize=2, policy=policy, timeout=0.01).wrap(lambda e: None)
+            mailbox.scheduled = True
+            mailbox(1)
+            mailbox(2)
+            return mailbox
+
+        mailbox = fill(OverflowPolicy.DROP_OLDEST)
+        mailbox(3)
+        self.assertEqual((list(mailbox.events), mailbox.droppedCount), ([2, 3], 1))
+        mailbox = fill(OverflowPolicy.DROP_NEWEST)
+        mailbox(3)
+        self.assertEqual((list(mailbox.events), mailbox.droppedCount), ([1, 2], 1))
+        for policy in (OverflowPolicy.RAISE, OverflowPolicy.BLOCK):
+            mailbox = fill(policy)
+            self.assertRaises(Full, mailbox, 3)
+            self.assertEqual((list(mailbox.events), mailbox.rejectedCount), ([1, 2], 1))
+
+    def testDropsEventsAfterShutdown(self):
+        events = list()
+        mailbox = self.executor.wrap(events.append)
+        self.executor.shutdown()
+        mailbox(position(1))
+        self.assertEqual((events, mailbox.droppedCount), ([], 1))
+
+        # Shut down between the post and the scheduling
+        mailbox = ListenerExecutor(workers=1).wrap(events.append)
+        mailbox.executor.pool.shutdown()
+        mailbox(position(2))
+        self.assertEqual((events, len(mailbox), mailbox.droppedCount), ([], 0, 1))
+        self.assertFalse(mailbox.scheduled)
+
+    def testListenersRunInOrderOffThread(self):
+        done = Event()
+        events = list()
+
+        def listener(e):
+            events.append(e)
+            if len(events) == 50:
+                done.set()
+
+        mailbox = self.executor.wrap(listener, conflatable=lambda e: False)
+        for i in range(50):
+            mailbox(i)
+        self.assertTrue(done.wait(5))
+        self.assertEqual(events, list(range(50)))
+
+
+if __name__ == '__main__':
+    unittest.main()
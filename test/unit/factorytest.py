@@ -0,0 +1,127 @@
+import unittest
+from threading import Event
+from time import sleep
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from tomotoio.factory import AdapterPool, ShardingStrategy, connectCube, connectCubes
+
+
+def fakePeer(connected=True, notifications=0):
+    return SimpleNamespace(connected=connected, notificationCount=notifications, notificationBytes=notifications * 13,
+                           writeCount=0, writeBytes=0)
+
+
+class TestAdapterPool(unittest.TestCase):
+    def testRoundRobin(self):
+        pool = AdapterPool([0, 1])
+        self.assertEqual(pool.assign(['a', 'b', 'c']), dict(a=0, b=1, c=0))
+        self.assertEqual(pool.assign(['d']), dict(d=1))
+
+    def testLeastLoaded(self):
+        pool = AdapterPool([0, 1, 2])
+        pool.add(0, fakePeer())
+        pool.add(0, fakePeer())
+        pool.add(1, fakePeer(notifications=100))
+        pool.add(2, fakePeer(connected=False))
+        assignment = pool.assign(['a', 'b', 'c'], ShardingStrategy.LEAST_LOADED)
+        self.assertEqual(assignment, dict(a=2, b=2, c=1))
+
+    def testBestRSSI(self):
+        pool = AdapterPool([0, 1])
+        rssi = {0: dict(a=-50, b=-40, c=-45), 1: dict(a=-60, b=-70)}
+        assignment = pool.assign(['a', 'b', 'c', 'd'], ShardingStrategy.BEST_RSSI, rssi, maxPerAdapter=2)
+        self.assertEqual(assignment, dict(a=0, b=0, c=1, d=1))
+
+    def testStats(self):
+        pool = AdapterPool([0, 1])
+        pool.add(0, fakePeer(notifications=10))
+        pool.add(0, fakePeer(connected=False, notifications=5))
+        stats = pool.stats()
+        self.assertEqual((stats[0]['connections'], stats[0]['notificationCount']), (1, 15))
+        self.assertEqual(stats[1]['connections'], 0)
+
+
+
+class ScriptedPeer:
+    """Stands for BlePeer; each connection attempt to an address takes the next step of its script.
+
+    A step is None to connect, an exception to raise, or an Event to wait for before connecting.
+    """
+    scripts = dict()
+    attempts = dict()
+    created = list()
+
+    def __init__(self, address, iface=0, reactor=None, **kwargs):
+        ScriptedPeer.attempts[address] = ScriptedPeer.attempts.get(address, 0) + 1
+        script = ScriptedPeer.scripts.get(address, [])
+        step = script.pop(0) if script else None
+        if isinstance(step, Exception):
+            raise step
+        if isinstance(step, Event):
+            step.wait(5)
+        self.address = address
+        self.disconnected = Event()
+        ScriptedPeer.created.append(self)
+
+    def disconnect(self):
+        self.disconnected.set()
+
+
+class TestConnect(unittest.TestCase):
+    def setUp(self):
+        ScriptedPeer.scripts = dict()
+        ScriptedPeer.attempts = dict()
+        ScriptedPeer.created = list()
+        patcher = patch('tomotoio.factory.BlePeer', ScriptedPeer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testRetriesFailedAttempts(self):
+        ScriptedPeer.scripts['a'] = [OSError("first"), OSError("second")]
+        with self.assertLogs(level='WARNING'):
+            cube = connectCube('a', retries=2, retryInterval=0)
+        self.assertEqual(cube.peer.address, 'a')
+        self.assertEqual(ScriptedPeer.attempts['a'], 3)
+
+    def testRaisesLastErrorAfterRetries(self):
+        ScriptedPeer.scripts['a'] = [OSError("first"), OSError("second"), OSError("third")]
+        with self.assertLogs(level='WARNING'), self.assertRaisesRegex(OSError, "second"):
+            connectCube('a', retries=1, retryInterval=0)
+        self.assertEqual(ScriptedPeer.attempts['a'], 2)
+
+    def testDisconnectsPeerConnectedAfterTimeout(self):
+        late = Event()
+        ScriptedPeer.scripts['a'] = [late]
+        with self.assertRaises(TimeoutError):
+            connectCube('a', timeout=0.05, retries=0)
+        late.set()
+        for _ in range(100):
+            if ScriptedPeer.created:
+                break
+            sleep(0.01)
+        self.assertTrue(ScriptedPeer.created[0].disconnected.wait(1))
+
+    def testTimedOutAttemptIsRetried(self):
+        late = Event()
+        ScriptedPeer.scripts['a'] = [late]
+        with self.assertLogs(level='WARNING'):
+            cube = connectCube('a', timeout=0.05, retries=1, retryInterval=0)
+        self.assertEqual(ScriptedPeer.attempts['a'], 2)
+        late.set()
+        self.assertFalse(cube.peer.disconnected.is_set())
+
+    def testCollectsCubesAndFailures(self):
+        error = OSError("unreachable")
+        ScriptedPeer.scripts['b'] = [error, error]
+        with self.assertLogs(level='WARNING'):
+            result = connectCubes(['a', 'b', 'c'], retries=1)
+        self.assertEqual([c.peer.address for c in result.cubes], ['a', 'c'])
+        self.assertEqual([c.name for c in result.cubes], ['Cube #1', 'Cube #3'])
+        self.assertEqual(result.failures, dict(b=error))
+        self.assertFalse(result.isComplete())
+        self.assertTrue(connectCubes(['d']).isComplete())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+from unittest.mock import patch
+
+from tomotoio.filters import DeadBand, MinInterval, OnChange
+
+MISSED_ID = bytes([0x03])
+
+
+def position(x, y, angle):
+    return bytes([0x01]) + bytes(b for v in (x, y, angle, x, y, angle) for b in v.to_bytes(2, 'little'))
+
+
+class TestFilters(unittest.TestCase):
+    def testMinInterval(self):
+        f = MinInterval(0.05)
+        with patch('tomotoio.filters.monotonic') as monotonic:
+            results = list()
+            for (t, data) in [(1.0, position(1, 1, 0)), (1.01, position(2, 1, 0)), (1.02, MISSED_ID),
+                              (1.03, position(3, 1, 0)), (1.06, position(4, 1, 0))]:
+                monotonic.return_value = t
+                results.append(f(data))
+        self.assertEqual(results, [True, False, True, True, False])
+
+    def testDeadBand(self):
+        f = DeadBand(distance=2, angle=3)
+        self.assertEqual([f(position(100, 100, 359)), f(position(101, 99, 0)), f(position(102, 100, 0)),
+                          f(position(102, 100, 4)), f(position(102, 100, 4))],
+                         [True, False, True, True, False])
+
+    def testOnChange(self):
+        f = OnChange()
+        self.assertEqual([f(b'\x01\x00'), f(b'\x01\x00'), f(b'\x01\x80'), f(b'\x01\x00')], [True, False, True, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
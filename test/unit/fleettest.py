@@ -0,0 +1,43 @@
+import unittest
+from time import sleep
+
+from tomotoio.cube import Cube
+from tomotoio.fleet import Fleet
+from tomotoio.navigator import Navigator
+from tomotoio.simpeer import SimPeer
+
+
+class TestFleet(unittest.TestCase):
+    def setUp(self):
+        self.peers = [SimPeer(100, 100, 0, timeScale=None), SimPeer(200, 200, 0, timeScale=None)]
+        self.navs = [Navigator(Cube(p, "sim")) for p in self.peers]
+        for p in self.peers:
+            p.step(0.02)
+
+    def testTicksAtFixedRateWithSnapshotAndBatch(self):
+        fleet = Fleet(self.navs, rate=100)
+        seen = list()
+
+        def tick(t):
+            seen.append([(p.x, p.y) for p in t.positions])
+            t.setMotor(0, 50, 50)
+            if t.index == 0:
+                # Nothing is sent until the tick returns
+                self.assertEqual(self.peers[0].motor[0], 0)
+            return t.index < 9
+
+        fleet.run(tick)
+        self.assertEqual(fleet.tickCount, 10)
+        self.assertEqual(seen[0], [(100, 100), (200, 200)])
+        self.assertEqual(self.peers[0].motor[0], 50)
+        self.assertEqual(fleet.stats()['lateness']['count'], 10)
+
+    def testCountsOverruns(self):
+        fleet = Fleet(self.navs, rate=100)
+        fleet.run(lambda t: sleep(0.025) if t.index == 1 else None, duration=0.1)
+        self.assertGreaterEqual(fleet.overrunCount, 1)
+        self.assertGreaterEqual(fleet.skippedTickCount, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
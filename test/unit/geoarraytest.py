@@ -0,0 +1,48 @@
+import unittest
+
+import tomotoio.data as td
+from tomotoio.geo import Vector, angleDiff
+from tomotoio.navigator import Mat
+
+try:
+    import numpy as np
+    import tomotoio.geoarray as ga
+except ImportError:
+    np = None  # NumPy is an optional dependency
+
+POSITIONS = [td.PositionID(100, 100, 0, 0, 0, 0), td.PositionID(130, 140, 90, 0, 0, 0),
+             td.PositionID(400, 50, 300, 0, 0, 0)]
+
+
+@unittest.skipUnless(np, "numpy not installed")
+class TestGeoArray(unittest.TestCase):
+    def testPositionsToArrays(self):
+        (xs, ys, angles) = ga.positionsToArrays(POSITIONS + [None])
+        self.assertEqual(list(xs[:3]), [100, 130, 400])
+        self.assertEqual(list(angles[:3]), [0, 90, 300])
+        self.assertTrue(np.isnan(ys[3]))
+
+    def testPairwiseMatchesGeo(self):
+        (xs, ys, angles) = ga.positionsToArrays(POSITIONS)
+        distances = ga.pairwiseDistances(xs, ys)
+        bearings = ga.pairwiseDirections(xs, ys)
+        relative = ga.pairwiseRelativeBearings(xs, ys, angles)
+        for (i, p) in enumerate(POSITIONS):
+            for (j, q) in enumerate(POSITIONS):
+                v = Vector(p, q)
+                self.assertAlmostEqual(distances[i, j], v.magnitude())
+                self.assertAlmostEqual(bearings[i, j], v.direction())
+                self.assertAlmostEqual(relative[i, j], angleDiff(v.direction() - p.angle))
+
+    def testAngleDiffs(self):
+        self.assertEqual(list(ga.angleDiffs([190, -190, 0, 180])), [-170, 170, 0, -180])
+
+    def testMatMargins(self):
+        mat = Mat()
+        (xs, ys, _) = ga.positionsToArrays(POSITIONS)
+        margins = ga.matMargins(mat, xs, ys)
+        self.assertEqual(list(margins), [mat.margin(p.x, p.y) for p in POSITIONS])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+import tomotoio.data as td
+from tomotoio.geo import Vector, angleDiff, normalized
+
+
+class TestGeo(unittest.TestCase):
+    def testVectorConstructors(self):
+        p1 = td.PositionID(10, 20, 0, 10, 20, 0)
+        p2 = td.PositionID(13, 24, 0, 13, 24, 0)
+        v = Vector(1.5, 2)
+        self.assertEqual((v.x, v.y), (1.5, 2))
+        v = Vector(p1)
+        self.assertEqual((v.x, v.y), (10, 20))
+        v = Vector(p1, p2)
+        self.assertEqual((v.x, v.y), (3, 4))
+        self.assertEqual(v.magnitude(), 5)
+
+    def testVectorHasNoDict(self):
+        self.assertFalse(hasattr(Vector(1, 2), '__dict__'))
+
+    def testInPlaceOperatorsUpdateSameVector(self):
+        v = Vector(1, 2)
+        w = v
+        v += Vector(3, 4)
+        v -= Vector(1, 1)
+        v *= 2
+        self.assertIs(v, w)
+        self.assertEqual((v.x, v.y), (6, 10))
+
+    def testNormalized(self):
+        (x, y) = normalized(3, 4, 10)
+        self.assertAlmostEqual(x, 6)
+        self.assertAlmostEqual(y, 8)
+        self.assertEqual(normalized(0, 0), (0, 0))
+
+    def testAngleDiff(self):
+        self.assertEqual(angleDiff(190), -170)
+        self.assertEqual(angleDiff(-190), 170)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import json
+import os
+import unittest
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from bluepy.btle import BTLEGattError
+
+from tomotoio.blepeer import BlePeer
+from tomotoio.constants import UUIDs
+from tomotoio.handlecache import HandleCache
+
+ADDRESS = "D0:00:00:00:00:01"
+
+
+def characteristics(offset=0):
+    # A GAP characteristic, then the Toio ones, as discovered by bluepy
+    result = [SimpleNamespace(uuid=UUIDs.SERVICE, handle=2, valHandle=3)]
+    for i, u in enumerate([UUIDs.TOIO_ID, UUIDs.MOTOR, UUIDs.LIGHT, UUIDs.SOUND, UUIDs.MOTION, UUIDs.BUTTON,
+                           UUIDs.BATTERY, UUIDs.CONFIG]):
+        result.append(SimpleNamespace(uuid=u, handle=10 + offset + i * 3, valHandle=11 + offset + i * 3))
+    for c in result:
+        c.getHandle = (lambda c: lambda: c.valHandle)(c)
+    return result
+
+
+class FakePeripheral:
+    def __init__(self, chars):
+        self.chars = chars
+        self.ranges = list()
+
+    def withDelegate(self, delegate):
+        return self
+
+    def getCharacteristics(self, startHnd=1, endHnd=0xFFFF):
+        self.ranges.append((startHnd, endHnd))
+        return [c for c in self.chars if startHnd <= c.handle <= endHnd]
+
+    def disconnect(self):
+        pass
+
+
+class RangeFailingPeripheral(FakePeripheral):
+    """Fails the discovery of any range but the whole table, like a cube whose handles moved away."""
+
+    def getCharacteristics(self, startHnd=1, endHnd=0xFFFF):
+        if (startHnd, endHnd) != (1, 0xFFFF):
+            self.ranges.append((startHnd, endHnd))
+            raise BTLEGattError("Bluetooth command failed")
+        return super().getCharacteristics(startHnd, endHnd)
+
+
+class TestHandleCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "handles.json")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def connect(self, peripheral, cache):
+        with patch('tomotoio.blepeer.Peripheral', lambda *args: peripheral):
+            return BlePeer(ADDRESS, handleCache=cache)
+
+    def testPersistsHandlesAndVersion(self):
+        cache = HandleCache(self.path)
+        cache.put(ADDRESS, {str(UUIDs.MOTOR): (13, 14)})
+        cache.setProtocolVersion(ADDRESS, "2.1.0")
+        cache = HandleCache(self.path)
+        self.assertEqual(cache.get(ADDRESS.lower()), {str(UUIDs.MOTOR): (13, 14)})
+        self.assertEqual(cache.getProtocolVersion(ADDRESS), "2.1.0")
+        # The same handles keep the version, new ones forget it
+        cache.put(ADDRESS, {str(UUIDs.MOTOR): (13, 14)})
+        self.assertEqual(cache.getProtocolVersion(ADDRESS), "2.1.0")
+        cache.put(ADDRESS, {str(UUIDs.MOTOR): (16, 17)})
+        self.assertIsNone(cache.getProtocolVersion(ADDRESS))
+
+    def testSkipsFullDiscoveryWithValidCache(self):
+        cache = HandleCache(self.path)
+        first = FakePeripheral(characteristics())
+        self.assertEqual(self.connect(first, cache).uuidHandleMap[UUIDs.MOTOR], 14)
+        self.assertEqual(first.ranges, [(1, 0xFFFF)])
+
+        second = FakePeripheral(characteristics())
+        peer = self.connect(second, HandleCache(self.path))
+        self.assertEqual(second.ranges, [(10, 32)])
+        self.assertEqual(peer.uuidHandleMap[UUIDs.MOTOR], 14)
+        self.assertEqual(peer.handleUUIDMap[32], UUIDs.CONFIG)
+
+    def testFallsBackToDiscoveryWhenHandlesMoved(self):
+        cache = HandleCache(self.path)
+        self.connect(FakePeripheral(characteristics()), cache)
+
+        moved = FakePeripheral(characteristics(offset=1))
+        peer = self.connect(moved, cache)
+        self.assertEqual(moved.ranges, [(10, 32), (1, 0xFFFF)])
+        self.assertEqual(peer.uuidHandleMap[UUIDs.MOTOR], 15)
+        self.assertEqual(cache.get(ADDRESS)[str(UUIDs.MOTOR)], (14, 15))
+
+    def testFallsBackToDiscoveryWhenRangedLookupFails(self):
+        cache = HandleCache(self.path)
+        self.connect(FakePeripheral(characteristics()), cache)
+
+        moved = RangeFailingPeripheral(characteristics(offset=1))
+        with self.assertLogs(level='INFO'):
+            peer = self.connect(moved, cache)
+        self.assertEqual(moved.ranges, [(10, 32), (1, 0xFFFF)])
+        self.assertEqual(peer.uuidHandleMap[UUIDs.MOTOR], 15)
+        self.assertEqual(HandleCache(self.path).get(ADDRESS)[str(UUIDs.MOTOR)], (14, 15))
+
+    def testMalformedEntryIsCacheMiss(self):
+        for entry in (dict(characteristics={}), dict(characteristics={str(UUIDs.MOTOR): [13]}), [], dict()):
+            with open(self.path, 'w') as f:
+                json.dump({ADDRESS.lower(): entry}, f)
+            cache = HandleCache(self.path)
+            with self.assertLogs(level='INFO'):
+                self.assertIsNone(cache.get(ADDRESS))
+            self.assertIsNone(cache.get(ADDRESS))
+            with open(self.path) as f:
+                self.assertEqual(json.load(f), {})
+
+        with open(self.path, 'w') as f:
+            json.dump({ADDRESS.lower(): dict(characteristics={})}, f)
+        peripheral = FakePeripheral(characteristics())
+        with self.assertLogs(level='INFO'):
+            peer = self.connect(peripheral, HandleCache(self.path))
+        self.assertEqual(peripheral.ranges, [(1, 0xFFFF)])
+        self.assertEqual(peer.uuidHandleMap[UUIDs.MOTOR], 14)
+        self.assertEqual(HandleCache(self.path).get(ADDRESS)[str(UUIDs.MOTOR)], (13, 14))
+
+    def testUnreadableFileIsIgnored(self):
+        with open(self.path, 'w') as f:
+            f.write("{")
+        with self.assertLogs(level='WARNING'):
+            cache = HandleCache(self.path)
+        self.assertIsNone(cache.get(ADDRESS))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from unittest.mock import patch
+
+from tomotoio.cube import Cube
+from tomotoio.history import PositionHistory, historySizeFor
+from tomotoio.navigator import Navigator
+from tomotoio.simpeer import SimPeer
+
+
+class TestPositionHistory(unittest.TestCase):
+    def testKeepsOnlyNewestSamples(self):
+        h = PositionHistory(4)
+        for i in range(10):
+            h.append(i, i * 10, 0, 0)
+        self.assertEqual(len(h), 4)
+        self.assertEqual(h.latest(), (9, 90, 0, 0))
+        self.assertAlmostEqual(h.velocity(100)[0], 10)
+
+    def testVelocityOverWindow(self):
+        h = PositionHistory()
+        for i in range(20):
+            h.append(i * 0.1, 100 if i < 10 else 100 + (i - 10) * 2, 200 - i, 0)
+        (vx, vy) = h.velocity(0.5)
+        self.assertAlmostEqual(vx, 20)
+        self.assertAlmostEqual(vy, -10)
+        self.assertIsNone(PositionHistory().velocity(1))
+
+    def testAngularVelocityAcrossZero(self):
+        h = PositionHistory()
+        for (i, a) in enumerate([350, 355, 0, 5, 10]):
+            h.append(i * 0.1, 0, 0, a)
+        self.assertAlmostEqual(h.angularVelocity(1), 50)
+
+    def testIsStalled(self):
+        h = PositionHistory()
+        for i in range(10):
+            h.append(i * 0.1, 100 + (i % 2), 100, 0)
+        self.assertFalse(h.isStalled(2, 5))
+        for i in range(10, 25):
+            h.append(i * 0.1, 100 + (i % 2), 100, 0)
+        self.assertTrue(h.isStalled(2, 5))
+        self.assertFalse(h.isStalled(2, 1))
+        self.assertFalse(h.isStalled(2, 5, since=1.0))
+        h.clear()
+        self.assertFalse(h.isStalled(2, 5))
+
+
+    def testSoccerStallOnStationaryCube(self):
+        # The condition of examples/soccer.py, with the history time following the simulation
+        def standStill(historySize: int) -> Navigator:
+            peer = SimPeer(250, 250, 0, timeScale=None)
+            with patch('tomotoio.navigator.monotonic', lambda: peer.time):
+                ball = Navigator(Cube(peer, "ball"), historySize)
+                peer.run(5)
+            return ball
+
+        self.assertGreaterEqual(historySizeFor(2.0), 300)
+        self.assertTrue(standStill(historySizeFor(2.0)).history.isStalled(2.0, 5, since=0))
+        # The default size covers only about 1.3 seconds of notifications
+        self.assertFalse(standStill(128).history.isStalled(2.0, 5, since=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -69,6 +69,15 @@ class TestMessages(unittest.TestCase):
         self.assertEqual(tm.encodeLight(20, 30, 40, 0.16),
                          bytes([0x03, 0x10, 0x01, 0x01, 0x14, 0x1e, 0x28]))
 
+    def testEncodeRaisesValueErrorOutOfRange(self):
+        self.assertRaises(ValueError, tm.encodeMotor, 300, 0)
+        self.assertRaises(ValueError, tm.encodeMotor, 0, -256)
+        self.assertRaises(ValueError, tm.encodeLight, 256, 0, 0)
+        self.assertRaises(ValueError, tm.encodeLight, 0, 0, 0, -1)
+
+    def testDecodeToioIDReturnsNewMissedID(self):
+        self.assertIsNot(tm.decodeToioID(bytes([0x03])), tm.decodeToioID(bytes([0x03])))
+
     def testEncodeLightPattern(self):
         self.assertEqual(tm.encodeLightPattern([td.Light(20, 30, 40, 0.3), td.Light(40, 60, 80, 0.6)], 3),
                          bytes([0x04, 0x03, 0x02, 0x1e, 0x01, 0x01, 0x14, 0x1e, 0x28, 0x3c, 0x01, 0x01, 0x28, 0x3c, 0x50]))
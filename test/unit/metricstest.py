@@ -0,0 +1,91 @@
+import json
+import unittest
+from threading import Event
+from time import sleep
+
+from tomotoio.constants import UUIDs
+from tomotoio.cube import Cube, Peer
+from tomotoio.executor import ListenerExecutor
+from tomotoio.metrics import CubeMetrics, Histogram
+from tomotoio.writequeue import WriteQueue
+
+
+class ListenerPeer(Peer):
+    def __init__(self):
+        self.listeners = list()
+        self.metrics = None
+
+    def addListener(self, listener):
+        self.listeners.append(listener)
+
+    def setMetrics(self, metrics):
+        self.metrics = metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def testHistogram(self):
+        h = Histogram((0.01, 0.1))
+        for v in (0.005, 0.01, 0.05, 1):
+            h.add(v)
+        s = h.snapshot()
+        self.assertEqual(s['counts'], [2, 1, 1])
+        self.assertEqual((s['min'], s['max'], s['count']), (0.005, 1, 4))
+        self.assertIsNone(Histogram().snapshot()['mean'])
+
+    def testNotificationsAndMissedRatio(self):
+        m = CubeMetrics()
+        m.setKeyName(13, 'TOIO_ID')
+        for data in (b'\x01', b'\x01', b'\x03', b'\x02'):
+            m.recordNotification(13, data)
+        m.recordNotification(20, b'\x01')
+        m.recordQueueDepth(3)
+        m.recordQueueDepth(1)
+        s = m.snapshot()
+        self.assertEqual(s['toioID'], dict(count=4, missed=1, missedRatio=0.25))
+        self.assertEqual(s['notificationIntervals']['TOIO_ID']['count'], 3)
+        self.assertNotIn('20', s['notificationIntervals'])
+        self.assertEqual(s['queueHighWater'], 3)
+        json.dumps(s)
+
+    def testCubeListenerTimes(self):
+        peer = ListenerPeer()
+        cube = Cube(peer, "test")
+        cube.motion.addListener(lambda e: None)
+        metrics = cube.enableMetrics()
+        self.assertIs(peer.metrics, metrics)
+        for listener in peer.listeners:
+            listener(UUIDs.MOTION, b'\x01\x01\x00\x00\x01')
+        self.assertEqual(metrics.snapshot()['listenerTimes']['MOTION']['count'], 1)
+
+        cube.disableMetrics()
+        self.assertIsNone(peer.metrics)
+        for listener in peer.listeners:
+            listener(UUIDs.MOTION, b'\x01\x01\x00\x00\x01')
+        self.assertEqual(metrics.snapshot()['listenerTimes']['MOTION']['count'], 1)
+
+    def testListenerTimesOnExecutor(self):
+        peer = ListenerPeer()
+        executor = ListenerExecutor(workers=1)
+        self.addCleanup(executor.shutdown)
+        cube = Cube(peer, "test", executor=executor)
+        done = Event()
+        cube.motion.addListener(lambda e: sleep(0.02) or done.set())
+        metrics = cube.enableMetrics()
+        for listener in peer.listeners:
+            listener(UUIDs.MOTION, b'\x01\x01\x00\x00\x01')
+        self.assertTrue(done.wait(1))
+        executor.shutdown()
+        # Measures the listener itself, not the post to its mailbox
+        self.assertGreaterEqual(metrics.snapshot()['listenerTimes']['MOTION']['min'], 0.02)
+
+    def testWriteQueueStampsOnlyWhenTimed(self):
+        q = WriteQueue(10, [1])
+        q.put(1, b'a')
+        self.assertEqual(q.getTimed()[1], 0.0)
+        q.timed = True
+        q.put(1, b'b')
+        self.assertGreater(q.getTimed()[1], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
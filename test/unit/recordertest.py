@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+from tomotoio.constants import UUIDs
+from tomotoio.cube import Cube
+from tomotoio.recorder import NOTIFICATION, WRITE, RecordingPeer, ReplayPeer, readRecording
+from tomotoio.simpeer import SimPeer
+
+
+class TestRecorder(unittest.TestCase):
+    def setUp(self):
+        (fd, self.path) = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def record(self):
+        sim = SimPeer(250, 250, 0, timeScale=None)
+        cube = Cube(RecordingPeer(sim, self.path), "recorded")
+        events = list()
+        cube.toioID.addListener(events.append)
+        cube.toioID.enableNotification()
+        cube.setMotor(50, 50)
+        sim.run(0.1)
+        cube.release()
+        return events
+
+    def testRecordsNotificationsAndWrites(self):
+        self.record()
+        recorded = list(readRecording(self.path))
+        self.assertEqual(recorded[0].kind, WRITE)
+        self.assertEqual(recorded[0].uuid, UUIDs.MOTOR)
+        notifications = [e for e in recorded if e.kind == NOTIFICATION]
+        self.assertEqual(len(notifications), 10)
+        self.assertTrue(all(e.uuid == UUIDs.TOIO_ID for e in notifications))
+        self.assertEqual(sorted(e.time for e in recorded), [e.time for e in recorded])
+
+    def testReplaysThroughCube(self):
+        original = self.record()
+        peer = ReplayPeer(self.path, speed=None)
+        cube = Cube(peer, "replayed")
+        events = list()
+        cube.toioID.addListener(events.append)
+        peer.replay()
+        self.assertEqual([str(e) for e in events], [str(e) for e in original])
+        self.assertEqual(peer.read(UUIDs.TOIO_ID)[0], 0x01)
+
+    def testReadsFirstValueBeforeReplay(self):
+        self.record()
+        peer = ReplayPeer(self.path, speed=None)
+        first = next(e.data for e in readRecording(self.path) if e.kind == NOTIFICATION)
+        self.assertEqual(peer.read(UUIDs.TOIO_ID), first)
+        self.assertRaises(ValueError, peer.read, UUIDs.BATTERY)
+
+    def testDelegatesToPeer(self):
+        sim = SimPeer(250, 250, 0, timeScale=None)
+        calls = list()
+        sim.setMetrics = lambda metrics: calls.append(('metrics', metrics))
+        sim.setProtocolVersion = lambda version: calls.append(('version', version))
+        sim.addCharacteristicListener = lambda uuid, listener: calls.append(('listener', uuid))
+        peer = RecordingPeer(sim, self.path)
+        peer.setMetrics(None)
+        peer.setProtocolVersion("2.3.0")
+        peer.addCharacteristicListener(UUIDs.BATTERY, print)
+        peer.disconnect()
+        self.assertEqual(calls, [('metrics', None), ('version', "2.3.0"), ('listener', UUIDs.BATTERY)])
+
+    def testRejectsOtherFiles(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'garbage')
+        self.assertRaises(ValueError, list, readRecording(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
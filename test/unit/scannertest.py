@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from tomotoio.constants import UUIDs
+from tomotoio.scanner import ScanCache, streamCubes
+
+
+def device(addr, rssi, cube=True):
+    data = [(0x07, "Complete 128b Services", str(UUIDs.SERVICE) if cube else "0000180f-0000-1000-8000-00805f9b34fb")]
+    return SimpleNamespace(addr=addr, rssi=rssi, getScanData=lambda: data)
+
+
+class FakeScanner:
+    """Reports one advertisement per process() call."""
+
+    def __init__(self, iface=0):
+        self.devices = [device("aa", -50), device("xx", -40, cube=False), device("bb", -60), device("cc", -70)]
+        self.processCount = 0
+        self.stopped = False
+
+    def withDelegate(self, delegate):
+        self.delegate = delegate
+        return self
+
+    def start(self):
+        pass
+
+    def process(self, timeout):
+        if self.processCount < len(self.devices):
+            self.delegate.handleDiscovery(self.devices[self.processCount], True, True)
+        self.processCount += 1
+
+    def stop(self):
+        self.stopped = True
+
+
+class TestScanCache(unittest.TestCase):
+    def testRecentAndPersistence(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "cache.json")
+            cache = ScanCache(path)
+            cache.update("aa:aa", -50, seen=1)
+            cache.update("bb:bb", -60)
+            cache.update("cc:cc", -70)
+            cache.entries["cc:cc"]["lastSeen"] -= 10
+            self.assertEqual(cache.recent(3600), ["bb:bb", "cc:cc"])
+            cache.save()
+            loaded = ScanCache(path)
+            self.assertEqual(loaded.entries["bb:bb"]["rssi"], -60)
+            self.assertEqual(loaded.recent(5), ["bb:bb"])
+
+    def testCorruptFileIsEmptyCache(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "cache.json")
+            for content in ('{"aa:aa": {"lastSeen"', '["aa:aa"]'):
+                with open(path, 'w') as f:
+                    f.write(content)
+                with self.assertLogs(level='WARNING'):
+                    cache = ScanCache(path)
+                self.assertEqual(cache.entries, dict())
+                cache.update("aa:aa", -50)
+                cache.save()
+                self.assertEqual(os.listdir(d), ["cache.json"])
+                self.assertEqual(ScanCache(path).recent(5), ["aa:aa"])
+
+            # Malformed entries are skipped
+            with open(path, 'w') as f:
+                f.write('{"aa:aa": {"rssi": -50}, "bb:bb": 3, "cc:cc": {"lastSeen": 100, "rssi": -60}}')
+            self.assertEqual(list(ScanCache(path).entries), ["cc:cc"])
+
+
+class TestStreamCubes(unittest.TestCase):
+    def scan(self, **kwargs):
+        scanners = list()
+        with patch('tomotoio.scanner.Scanner', lambda iface: scanners.append(FakeScanner(iface)) or scanners[-1]):
+            result = list(streamCubes(timeout=5, **kwargs))
+        self.assertTrue(scanners[0].stopped)
+        return (result, scanners[0].processCount)
+
+    def testStopsAtExpectedCount(self):
+        self.assertEqual(self.scan(expectedCount=2), ([("aa", -50), ("bb", -60)], 3))
+
+    def testStopsWhenKnownFound(self):
+        (result, count) = self.scan(knownAddresses=["BB"])
+        self.assertEqual((len(result), count), (2, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
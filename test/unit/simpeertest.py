@@ -0,0 +1,56 @@
+import unittest
+
+from tomotoio.cube import Cube
+from tomotoio.navigator import Navigator, calcPoseAfter
+from tomotoio.simpeer import SimPeer
+
+
+class TestSimPeer(unittest.TestCase):
+    def testCalcPoseAfterMovesStraight(self):
+        (x, y, a) = calcPoseAfter(100, 100, 90, 50, 50, 1)
+        self.assertAlmostEqual(x, 100)
+        self.assertGreater(y, 100)
+        self.assertAlmostEqual(a, 90)
+
+    def testCalcPoseAfterRotatesClockwiseWhenLeftIsFaster(self):
+        (x, y, a) = calcPoseAfter(100, 100, 0, 30, -30, 0.1)
+        self.assertAlmostEqual(x, 100)
+        self.assertAlmostEqual(y, 100)
+        self.assertGreater(a, 0)
+        self.assertLess(a, 180)
+
+    def testMotorDurationStopsCube(self):
+        peer = SimPeer(250, 250, 0, timeScale=None)
+        cube = Cube(peer, "sim")
+        cube.setMotor(50, 50, 0.5)
+        peer.run(0.5)
+        x = peer.x
+        self.assertGreater(x, 250)
+        peer.run(0.5)
+        self.assertEqual(peer.x, x)
+
+    def testNotifiesPositionsAndMissedIDOnce(self):
+        peer = SimPeer(440, 250, 0, timeScale=None, notificationInterval=0.01)
+        cube = Cube(peer, "sim")
+        events = list()
+        cube.toioID.addListener(events.append)
+        cube.toioID.enableNotification()
+        peer.run(0.1)
+        self.assertEqual(len(events), 10)
+        self.assertTrue(all(e.isPosition() for e in events))
+        cube.setMotor(100, 100)
+        peer.run(1)
+        self.assertTrue(events[-1].isMissed())
+        self.assertEqual(len([e for e in events if e.isMissed()]), 1)
+
+    def testNavigatorReachesTarget(self):
+        peer = SimPeer(100, 100, 0, timeScale=None)
+        nav = Navigator(Cube(peer, "sim"))
+        nav.move(300, 350, 10)
+        peer.run(5)
+        self.assertTrue(nav.command.complete)
+        self.assertLess(abs(peer.x - 300) + abs(peer.y - 350), 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
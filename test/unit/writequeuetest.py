@@ -0,0 +1,85 @@
+import unittest
+from queue import Full
+from threading import Thread
+
+from tomotoio.writequeue import OverflowPolicy, WriteQueue
+
+
+class TestWriteQueue(unittest.TestCase):
+    def drain(self, q):
+        result = list()
+        while True:
+            w = q.get()
+            if w is None:
+                return result
+            result.append(w)
+
+    def testGetReturnsNoneWhenEmpty(self):
+        self.assertIsNone(WriteQueue().get())
+
+    def testKeepsOrderOfNonCoalescingWrites(self):
+        q = WriteQueue(10, [1])
+        q.put(2, b'a')
+        q.put(3, b'b', True)
+        q.put(2, b'c')
+        self.assertEqual(self.drain(q), [(2, b'a', False), (3, b'b', True), (2, b'c', False)])
+
+    def testCoalescesPendingWritesToSameHandle(self):
+        q = WriteQueue(10, [1])
+        q.put(1, b'a')
+        q.put(2, b'b')
+        q.put(1, b'c')
+        q.put(1, b'd')
+        self.assertEqual(len(q), 2)
+        self.assertEqual(q.coalescedCount, 2)
+        self.assertEqual(self.drain(q), [(1, b'd', False), (2, b'b', False)])
+
+    def testDoesNotCoalesceWithWriteAlreadyTaken(self):
+        q = WriteQueue(10, [1])
+        q.put(1, b'a')
+        self.assertEqual(q.get(), (1, b'a', False))
+        q.put(1, b'b')
+        self.assertEqual(self.drain(q), [(1, b'b', False)])
+
+    def testCoalescedWriteDoesNotBlockWhenFull(self):
+        q = WriteQueue(2, [1])
+        q.put(1, b'a')
+        q.put(2, b'b')
+        q.put(1, b'c')
+        self.assertEqual(len(q), 2)
+
+    def testPutBlocksWhileFull(self):
+        q = WriteQueue(1)
+        q.put(2, b'a')
+        t = Thread(target=q.put, args=(2, b'b'))
+        t.start()
+        t.join(0.05)
+        self.assertTrue(t.is_alive())
+        self.assertEqual(q.get(), (2, b'a', False))
+        t.join(1)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(q.get(), (2, b'b', False))
+
+    def testBlockTimesOut(self):
+        q = WriteQueue(1, policy=OverflowPolicy.BLOCK, timeout=0.01)
+        q.put(2, b'a')
+        self.assertRaises(Full, q.put, 2, b'b')
+        self.assertEqual(q.rejectedCount, 1)
+
+    def testDropPolicies(self):
+        q = WriteQueue(2, [1], policy=OverflowPolicy.DROP_OLDEST)
+        for (h, d) in [(1, b'a'), (2, b'b'), (3, b'c')]:
+            self.assertTrue(q.put(h, d))
+        self.assertEqual(q.droppedOldestCount, 1)
+        self.assertFalse(q.put(4, b'd', policy=OverflowPolicy.DROP_NEWEST))
+        self.assertFalse(q.tryPut(4, b'd'))
+        self.assertEqual(q.droppedNewestCount, 2)
+        self.assertRaises(Full, q.put, 4, b'd', policy=OverflowPolicy.RAISE)
+        self.assertEqual(self.drain(q), [(2, b'b', False), (3, b'c', False)])
+        # The dropped write no longer coalesces
+        q.put(1, b'e')
+        self.assertEqual(self.drain(q), [(1, b'e', False)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,260 @@
+"""asyncio front end for cubes
+
+AsyncPeer adapts any thread-based Peer to an event loop: notifications are handed over
+to the loop thread, and reads and writes run on a single worker thread per peer so that
+they keep their order and never block the loop. AsyncCube and AsyncNavigator mirror
+Cube and Navigator on top of it.
+"""
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Generic, List, Optional, TypeVar, Union
+
+from bluepy.btle import UUID
+
+from .constants import UUIDs
+from .cube import DEFAULT_DECODERS, CubeListenerFunc, DecoderFunc, Peer, PeerListenerFunc
+from .estimator import PoseEstimator
+from .messages import *
+from .navigator import Navigator
+
+T = TypeVar('T')
+
+
+class AsyncPeer:
+    """Must be created in a coroutine on the loop to use, unless the loop is given."""
+
+    def __init__(self, peer: Peer, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.peer = peer
+        self.loop = loop if loop else asyncio.get_running_loop()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.listeners: List[PeerListenerFunc] = list()
+
+        peer.addListener(self._handleNotification)
+
+    def _handleNotification(self, uuid: UUID, data: bytes):
+        # Called on the I/O thread of the peer
+        self.loop.call_soon_threadsafe(self._dispatch, uuid, data)
+
+    def _dispatch(self, uuid: UUID, data: bytes):
+        for listener in self.listeners:
+            listener(uuid, data)
+
+    def _run(self, func: Callable, *args) -> Awaitable:
+        return self.loop.run_in_executor(self.executor, func, *args)
+
+    def disconnect(self) -> Awaitable:
+        done = self._run(self.peer.disconnect)
+        # The worker thread still runs the disconnect, then exits
+        self.executor.shutdown(wait=False)
+        return done
+
+    def read(self, uuid: UUID) -> Awaitable[bytes]:
+        return self._run(self.peer.read, uuid)
+
+    def write(self, uuid: UUID, data: bytes, withResponse: bool = False) -> Awaitable:
+        return self._run(self.peer.write, uuid, data, withResponse)
+
+    def tryWrite(self, uuid: UUID, data: bytes, withResponse: bool = False) -> Awaitable[bool]:
+        return self._run(self.peer.tryWrite, uuid, data, withResponse)
+
+    def enableNotification(self, uuid: UUID, value: bool = True) -> Awaitable:
+        return self._run(self.peer.enableNotification, uuid, value)
+
+    def setProtocolVersion(self, version: str) -> Awaitable:
+        return self._run(self.peer.setProtocolVersion, version)
+
+    def addListener(self, listener: PeerListenerFunc):
+        self.listeners.append(listener)
+
+
+class NotificationStream(Generic[T]):
+    """Async iterator over the notifications of a property.
+
+    When the consumer falls behind by more than maxsize events, the oldest ones are dropped.
+    """
+
+    def __init__(self, prop: 'AsyncReadableProperty[T]', maxsize: int):
+        self.prop = prop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        prop.addListener(self._put)
+
+    def _put(self, e: T):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(e)
+
+    def close(self):
+        self.prop.removeListener(self._put)
+
+    def __aiter__(self) -> 'NotificationStream[T]':
+        return self
+
+    async def __anext__(self) -> T:
+        return await self.queue.get()
+
+
+class AsyncReadableProperty(Generic[T]):
+    def __init__(self, cube: 'AsyncCube', uuid: UUID, decoder: Callable[[bytes], T]):
+        self.cube = cube
+        self.uuid = uuid
+        self.decoder = decoder
+
+    async def get(self) -> T:
+        return self.decoder(await self.cube.peer.read(self.uuid))
+
+    def enableNotification(self, value=True) -> Awaitable:
+        return self.cube.peer.enableNotification(self.uuid, value)
+
+    def addListener(self, listener: CubeListenerFunc):
+        self.cube.addListener(self.uuid, listener)
+
+    def removeListener(self, listener: CubeListenerFunc):
+        self.cube.removeListener(self.uuid, listener)
+
+    def stream(self, maxsize: int = 100) -> NotificationStream[T]:
+        return NotificationStream(self, maxsize)
+
+
+class AsyncCube:
+    """Cube whose reads are coroutines and whose writes return awaitables.
+
+    Writes are scheduled immediately, so awaiting them is optional. Listeners run on the event loop.
+    """
+
+    def __init__(self, peer: AsyncPeer, name: str):
+        self.peer = peer
+        self.name = name
+        self.listeners: Dict[UUID, List[CubeListenerFunc]] = defaultdict(lambda: list())
+        self.decoders: Dict[UUID, DecoderFunc] = dict(DEFAULT_DECODERS)
+        self.toioID = AsyncReadableProperty[Union[PositionID, StandardID, MissedID]](self, UUIDs.TOIO_ID, decodeToioID)
+        self.motion = AsyncReadableProperty[Motion](self, UUIDs.MOTION, decodeMotion)
+        self.button = AsyncReadableProperty[bool](self, UUIDs.BUTTON, decodeButton)
+        self.battery = AsyncReadableProperty[int](self, UUIDs.BATTERY, decodeBattery)
+
+        peer.addListener(self._handleNotification)
+
+    def _read(self, uuid: UUID) -> Awaitable[bytes]:
+        return self.peer.read(uuid)
+
+    def _write(self, uuid: UUID, data: bytes, withResponse: bool = False) -> Awaitable:
+        return self.peer.write(uuid, data, withResponse)
+
+    def _handleNotification(self, uuid: UUID, data: bytes):
+        listeners = self.listeners.get(uuid)
+        if not listeners:
+            return
+
+        decoder = self.decoders.get(uuid)
+        e = decoder(data) if decoder else data
+        for listener in list(listeners):
+            listener(e)
+
+    def release(self) -> Awaitable:
+        return self.peer.disconnect()
+
+    def addListener(self, uuid: UUID, listener: CubeListenerFunc):
+        self.listeners[uuid].append(listener)
+
+    def removeListener(self, uuid: UUID, listener: CubeListenerFunc):
+        self.listeners[uuid].remove(listener)
+
+    def registerDecoder(self, uuid: UUID, decoder: Optional[DecoderFunc]):
+        """Sets how the notifications of a characteristic are decoded; None passes them as raw bytes."""
+        self.decoders[uuid] = decoder
+
+    async def getConfigProtocolVersion(self) -> str:
+        await self._write(UUIDs.CONFIG, encodeConfigProtocolVersionRequest(), True)
+        await asyncio.sleep(0.1)
+        version = decodeConfigProtocolVersionResponse(await self._read(UUIDs.CONFIG))
+        await self.peer.setProtocolVersion(version)
+        return version
+
+    def setMotor(self, left: float, right: float, duration: float = 0) -> Awaitable:
+        return self._write(UUIDs.MOTOR, encodeMotor(int(left), int(right), duration))
+
+    def trySetMotor(self, left: float, right: float, duration: float = 0) -> Awaitable[bool]:
+        """Same as setMotor, but results in False instead of waiting when the write queue is full."""
+        return self.peer.tryWrite(UUIDs.MOTOR, encodeMotor(int(left), int(right), duration))
+
+    def setLight(self, r: int, g: int, b: int, duration: float = 0) -> Awaitable:
+        return self._write(UUIDs.LIGHT, encodeLight(r, g, b, duration))
+
+    def trySetLight(self, r: int, g: int, b: int, duration: float = 0) -> Awaitable[bool]:
+        """Same as setLight, but results in False instead of waiting when the write queue is full."""
+        return self.peer.tryWrite(UUIDs.LIGHT, encodeLight(r, g, b, duration))
+
+    def setLightPattern(self, lights: List[Light], repeat: int = 0) -> Awaitable:
+        return self._write(UUIDs.LIGHT, encodeLightPattern(lights, repeat))
+
+    def setSoundEffect(self, id: int, volume: int = 255) -> Awaitable:
+        return self._write(UUIDs.SOUND, encodeSound(id, volume))
+
+    def setMusic(self, notes: List[Note], repeat=0) -> Awaitable:
+        return self._write(UUIDs.SOUND, encodeSoundByNotes(notes, repeat))
+
+    def setConfigCollisionThreshold(self, value: int) -> Awaitable:
+        return self._write(UUIDs.CONFIG, encodeConfigCollisionThreshold(value))
+
+    def setConfigLevelThreshold(self, angle: int) -> Awaitable:
+        return self._write(UUIDs.CONFIG, encodeConfigLevelThreshold(angle))
+
+    def setConfigDoubleTapTiming(self, value: int) -> Awaitable:
+        return self._write(UUIDs.CONFIG, encodeConfigDoubleTapTiming(value))
+
+
+class AsyncNavigator(Navigator):
+    """Navigator whose commands are coroutines that finish when the target is reached.
+
+    The navigation commands themselves are shared with Navigator; they run on the event loop
+    because AsyncCube calls its listeners there. move() and rotate() return True when the target
+    is reached, or False when another command supersedes them first.
+    """
+
+    def __init__(self, cube: AsyncCube, historySize: int = 128, estimator: Optional[PoseEstimator] = None):
+        self.waiter: Optional[asyncio.Future] = None
+        super().__init__(cube, historySize, estimator)
+
+    def _handleNotification(self, e):
+        super()._handleNotification(e)
+
+        if self.waiter and self.command and self.command.complete:
+            self._resolveWaiter(True)
+
+    def _resolveWaiter(self, complete: bool):
+        if self.waiter and not self.waiter.done():
+            self.waiter.set_result(complete)
+
+    def setCommand(self, command):
+        # Not cancelled, so that the caller can tell it from the cancellation of its own task
+        self._resolveWaiter(False)
+        super().setCommand(command)
+
+    async def _waitForCompletion(self, timeout: Optional[float]) -> bool:
+        # An updated target supersedes the wait for the previous one as well
+        self._resolveWaiter(False)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiter = waiter
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        finally:
+            if self.waiter is waiter:
+                self.waiter = None
+
+    async def move(self, targetX: float, targetY: float, tolerance: float, moveRotateThreshold: float = 30,
+                   fixedSpeed: bool = False, timeout: Optional[float] = None) -> bool:
+        super().move(targetX, targetY, tolerance, moveRotateThreshold, fixedSpeed)
+        return await self._waitForCompletion(timeout)
+
+    async def rotate(self, targetAngle, tolerance, timeout: Optional[float] = None) -> bool:
+        super().rotate(targetAngle, tolerance)
+        return await self._waitForCompletion(timeout)
+
+    async def circle(self, centerX, centerY, radius, duration: Optional[float] = None):
+        """Starts circling. With duration, keeps circling for that many seconds and then stops."""
+        super().circle(centerX, centerY, radius)
+        if duration is not None:
+            await asyncio.sleep(duration)
+            self.setCommand(None)
+            await self.cube.setMotor(0, 0)
@@ -0,0 +1,131 @@
+"""Vectorized bulk decoder/encoder functions using NumPy
+
+These are meant for processing recorded traces and other large batches of messages.
+The per-event functions in messages remain the ones used for live notifications.
+NumPy is an optional dependency (pip install tomotoio[numpy]).
+"""
+from typing import Iterable, Union
+
+import numpy as np
+
+from .data import ToioIDType
+
+# One row per ID. Fields that do not apply to the type of the row are zero.
+TOIO_ID_DTYPE = np.dtype([
+    ('type', 'u1'),
+    ('fromType', 'u1'),
+    ('x', '<u2'),
+    ('y', '<u2'),
+    ('angle', '<u2'),
+    ('sensorX', '<u2'),
+    ('sensorY', '<u2'),
+    ('sensorAngle', '<u2'),
+    ('value', '<u4'),
+])
+
+POSITION_ID_SIZE = 13
+
+# Layouts of the ID messages, padded to the size of the largest one
+_positionLayout = np.dtype({
+    'names': ['kind', 'x', 'y', 'angle', 'sensorX', 'sensorY', 'sensorAngle'],
+    'formats': ['u1', '<u2', '<u2', '<u2', '<u2', '<u2', '<u2'],
+    'offsets': [0, 1, 3, 5, 7, 9, 11],
+    'itemsize': POSITION_ID_SIZE,
+})
+_standardLayout = np.dtype({
+    'names': ['kind', 'value', 'angle'],
+    'formats': ['u1', '<u4', '<u2'],
+    'offsets': [0, 1, 5],
+    'itemsize': POSITION_ID_SIZE,
+})
+
+_POSITION_FIELDS = ['x', 'y', 'angle', 'sensorX', 'sensorY', 'sensorAngle']
+
+# Indexed by the first byte of the message
+_types = np.zeros(256, 'u1')
+_fromTypes = np.zeros(256, 'u1')
+_lengths = np.full(256, -1, 'i2')  # -1 for the unknown kinds; 0 for any length
+for (kind, t, fromType, length) in [
+        (0x01, ToioIDType.POSITION, ToioIDType.INVALID, POSITION_ID_SIZE),
+        (0x02, ToioIDType.STANDARD, ToioIDType.INVALID, 7),
+        (0x03, ToioIDType.MISSED, ToioIDType.POSITION, 0),
+        (0x04, ToioIDType.MISSED, ToioIDType.STANDARD, 0),
+        (0xff, ToioIDType.MISSED, ToioIDType.INVALID, 0)]:
+    _types[kind] = t.value
+    _fromTypes[kind] = fromType.value
+    _lengths[kind] = length
+
+
+def decodePositionIDBuffer(buffer: Union[bytes, bytearray, memoryview]) -> np.ndarray:
+    """Decodes a contiguous buffer of position ID messages (13 bytes each) into a TOIO_ID_DTYPE array."""
+    if len(buffer) % POSITION_ID_SIZE != 0:
+        raise ValueError("Buffer length %d is not a multiple of %d" % (len(buffer), POSITION_ID_SIZE))
+
+    raw = np.frombuffer(buffer, _positionLayout)
+    if np.any(raw['kind'] != 0x01):
+        raise ValueError("Buffer contains messages other than position IDs")
+
+    result = np.zeros(len(raw), TOIO_ID_DTYPE)
+    result['type'] = ToioIDType.POSITION.value
+    for f in _POSITION_FIELDS:
+        result[f] = raw[f]
+    return result
+
+
+def decodeToioIDs(messages: Iterable[bytes]) -> np.ndarray:
+    """Decodes ID messages of any type into a TOIO_ID_DTYPE array, one row per message."""
+    messages = messages if isinstance(messages, list) else list(messages)
+    if any(len(m) == 0 or len(m) > POSITION_ID_SIZE for m in messages):
+        raise ValueError("Messages must be 1 to %d bytes long" % POSITION_ID_SIZE)
+
+    buffer = b''.join([m.ljust(POSITION_ID_SIZE, b'\0') for m in messages])
+    kinds = np.frombuffer(buffer, 'u1')[::POSITION_ID_SIZE]
+    lengths = np.fromiter(map(len, messages), 'i2', len(messages))
+
+    expectedLengths = _lengths[kinds]
+    if np.any(expectedLengths < 0):
+        raise ValueError("Unknown ID types %s" % np.unique(kinds[expectedLengths < 0]))
+    if np.any((expectedLengths > 0) & (expectedLengths != lengths)):
+        raise ValueError("Messages of wrong lengths")
+
+    result = np.zeros(len(messages), TOIO_ID_DTYPE)
+    result['type'] = _types[kinds]
+    result['fromType'] = _fromTypes[kinds]
+
+    isPosition = kinds == 0x01
+    if np.any(isPosition):
+        raw = np.frombuffer(buffer, _positionLayout)[isPosition]
+        for f in _POSITION_FIELDS:
+            result[f][isPosition] = raw[f]
+
+    isStandard = kinds == 0x02
+    if np.any(isStandard):
+        raw = np.frombuffer(buffer, _standardLayout)[isStandard]
+        result['value'][isStandard] = raw['value']
+        result['angle'][isStandard] = raw['angle']
+
+    return result
+
+
+def encodeMotors(left, right, duration=0) -> np.ndarray:
+    """Encodes motor commands like messages.encodeMotor, one row of 8 bytes per command.
+
+    The arguments are array-likes (or scalars) broadcast against each other; speeds are truncated to integers.
+    Use row.tobytes() to get the message of a command.
+    """
+    (left, right, duration) = np.broadcast_arrays(np.trunc(left), np.trunc(right), duration)
+    left = left.astype(np.int64).ravel()
+    right = right.astype(np.int64).ravel()
+    if np.any(np.abs(left) > 255) or np.any(np.abs(right) > 255):
+        raise ValueError("Motor speeds must be within [-255, 255]")
+
+    result = np.empty((len(left), 8), 'u1')
+    result[:, 0] = 2
+    result[:, 1] = 1
+    result[:, 2] = np.where(left >= 0, 1, 2)
+    result[:, 3] = np.abs(left)
+    result[:, 4] = 2
+    result[:, 5] = np.where(right >= 0, 1, 2)
+    result[:, 6] = np.abs(right)
+    result[:, 7] = np.minimum((np.asarray(duration, float).ravel() * 100).astype(np.int64), 255)
+    return result
@@ -1,51 +1,316 @@
+"""Peer of a real cube over Bluetooth LE (bluepy), and the reactor thread servicing its I/O"""
 import logging as log
-from queue import Empty, Queue
-from threading import Thread, currentThread
-from typing import Any, Callable, List, Optional, Mapping
+import os
+import selectors
+from threading import Condition, Lock, Thread, currentThread
+from typing import Any, Callable, Dict, List, Optional, Mapping, Set
 
-from bluepy.btle import (ADDR_TYPE_RANDOM, BTLEInternalError, DefaultDelegate,
+from bluepy.btle import (ADDR_TYPE_RANDOM, BTLEDisconnectError, BTLEException, BTLEInternalError, DefaultDelegate,
                          Peripheral, UUID)
 
-from .cube import Peer, PeerListenerFunc
+from .constants import UUIDs
+from .cube import CharacteristicListenerFunc, Peer, PeerListenerFunc, WriteDropListenerFunc
+from .handlecache import HandleCache, characteristicHandles
+from .metrics import CubeMetrics, characteristicName
+from .writequeue import OverflowPolicy, WriteQueue
+
+# Once the selector reports the helper pipe readable, a notification line is already on its way,
+# so this only bounds how long bluepy waits for the rest of it.
+NOTIFICATION_READ_TIMEOUT = 0.01
+
+# Characteristics whose handles are kept in a HandleCache
+CACHED_CHARACTERISTICS = (UUIDs.TOIO_ID, UUIDs.MOTOR, UUIDs.LIGHT, UUIDs.SOUND, UUIDs.MOTION, UUIDs.BUTTON,
+                          UUIDs.BATTERY, UUIDs.CONFIG)
+
+
+class BleReactor:
+    """Services the notifications and queued writes of any number of BlePeers from a single thread.
+
+    The thread blocks on the bluepy helper pipes of all the registered peers (epoll on Linux)
+    and on a self-pipe that is poked when a write is queued, so it does not wake up while idle.
+    It starts when the first peer is added and ends when the last one is removed.
+    close() releases the selector and the pipe once the reactor is no longer needed. With
+    closeWhenUnused, that happens when the last BlePeer using the reactor disconnects.
+    """
+
+    def __init__(self, name: str = "BLE reactor", closeWhenUnused: bool = False):
+        self.name = name
+        self.closeWhenUnused = closeWhenUnused
+        self.userCount = 0  # BlePeers using the reactor, whether notifying or not
+        self.lock = Lock()
+        self.updated = Condition(self.lock)
+        self.thread: Optional[Thread] = None
+        self.peers: List['BlePeer'] = list()
+        self.registeredPeers: Dict['BlePeer', int] = dict()
+        self.writePendingPeers: Set['BlePeer'] = set()
+        self.selector = selectors.DefaultSelector()
+        self.closed = False
+
+        (self.wakeupReader, self.wakeupWriter) = os.pipe()
+        os.set_blocking(self.wakeupReader, False)
+        os.set_blocking(self.wakeupWriter, False)
+        self.selector.register(self.wakeupReader, selectors.EVENT_READ, None)
+
+    def isReactorThread(self) -> bool:
+        return self.thread == currentThread()
+
+    def add(self, peer: 'BlePeer'):
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("%s is closed" % self.name)
+            self.peers.append(peer)
+            if not self.thread:
+                t = Thread(name=self.name, target=self._run)
+                t.setDaemon(True)
+                self.thread = t
+                t.start()
+        self._wakeup()
+
+    def acquire(self):
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("%s is closed" % self.name)
+            self.userCount += 1
+
+    def release(self):
+        with self.lock:
+            self.userCount -= 1
+            unused = self.userCount == 0 and self.closeWhenUnused
+        if unused:
+            self.close()
+
+    def remove(self, peer: 'BlePeer'):
+        with self.lock:
+            if self.closed:
+                return  # Everything was dropped already
+            if peer in self.peers:
+                self.peers.remove(peer)
+            self.writePendingPeers.discard(peer)
+            if self.isReactorThread():
+                self._updateSelector()
+            else:
+                self._wakeup()
+                while peer in self.registeredPeers:
+                    self.updated.wait()
+
+    def close(self):
+        """Drops all the peers, stops the thread and closes the selector and the wakeup pipe."""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.peers.clear()
+            self.writePendingPeers.clear()
+            t = self.thread
+            if t is None:
+                self._closeResources()
+                return
+            # Still under the lock, so the thread cannot have closed the pipe yet
+            self._wakeup()
+        if t != currentThread():
+            t.join()
+        # Otherwise the thread closes them on its way out
+
+    def _closeResources(self):
+        self.selector.close()
+        os.close(self.wakeupReader)
+        os.close(self.wakeupWriter)
+
+    def requestWrite(self, peer: 'BlePeer'):
+        with self.lock:
+            self.writePendingPeers.add(peer)
+        self._wakeup()
+
+    def _wakeup(self):
+        try:
+            os.write(self.wakeupWriter, b'\0')
+        except BlockingIOError:
+            pass  # The pipe is full, which means a wakeup is already pending
+
+    def _drainWakeups(self):
+        try:
+            while os.read(self.wakeupReader, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _updateSelector(self):
+        # Must be called with the lock held
+        for peer in [p for p in self.registeredPeers if p not in self.peers]:
+            # The helper may be gone already, so unregister with the remembered file descriptor
+            self.selector.unregister(self.registeredPeers.pop(peer))
+        for peer in self.peers:
+            if peer not in self.registeredPeers:
+                fd = peer.fileno()
+                self.selector.register(fd, selectors.EVENT_READ, peer)
+                self.registeredPeers[peer] = fd
+        self.updated.notify_all()
+
+    def _run(self):
+        while True:
+            with self.lock:
+                self._updateSelector()
+                if not self.peers:
+                    self.thread = None
+                    if self.closed:
+                        self._closeResources()
+                    return
+                writePendingPeers = self.writePendingPeers
+                self.writePendingPeers = set()
+
+            for peer in writePendingPeers:
+                self._service(peer, peer._processWrites)
+
+            for (key, _) in self.selector.select():
+                peer = key.data
+                if peer is None:
+                    self._drainWakeups()
+                elif peer in self.registeredPeers:
+                    self._service(peer, peer._processNotification)
+
+    def _service(self, peer: 'BlePeer', func: Callable[[], Any]):
+        # One faulty peer (or listener) must not take down the others sharing this thread
+        try:
+            func()
+        except BTLEDisconnectError as ex:
+            log.error("%s: %s", peer, ex)
+            peer.registered = False
+            peer.connected = False
+            self.remove(peer)
+        except Exception:
+            log.exception("Error while processing %s", peer)
 
 
 class BlePeer(Peer, DefaultDelegate):
-    def __init__(self, address: str, iface: int = 0):
+    def __init__(self, address: str, iface: int = 0, reactor: Optional[BleReactor] = None,
+                 writePolicy: OverflowPolicy = OverflowPolicy.BLOCK, writeTimeout: Optional[float] = None,
+                 handleCache: Optional[HandleCache] = None):
         super().__init__()
+        self.address = address
+        self.handleCache = handleCache
         self.peripheral: Peripheral = Peripheral(address, ADDR_TYPE_RANDOM, iface).withDelegate(self)
         self.listeners: List[PeerListenerFunc] = list()
-        self.notificationThread: Optional[Thread] = None
-        self.writeQueue: Queue = Queue(100)
+        # Listeners of single characteristics, looked up by the handle without mapping it to the UUID
+        self.handleListeners: Dict[int, List[CharacteristicListenerFunc]] = dict()
+        self.writeDropListeners: List[WriteDropListenerFunc] = list()
+        self.reactor = reactor if reactor else BleReactor("Notification for %s" % address, closeWhenUnused=True)
+        self.reactor.acquire()
+        self.usingReactor = True
+        self.registered = False
+        self.metrics: Optional[CubeMetrics] = None
+        # Always counted, as they cost next to nothing; e.g. for the load of an adapter
+        self.notificationCount = 0
+        self.notificationBytes = 0
+        self.writeCount = 0
+        self.writeBytes = 0
         self.uuidHandleMap: Mapping[UUID, int] = dict()
         self.handleUUIDMap: Mapping[int, UUID] = dict()
-        
-        for c in self.peripheral.getCharacteristics():
+
+        try:
+            if not (handleCache and self._useCachedHandles(handleCache)):
+                characteristics = self.peripheral.getCharacteristics()
+                self._setHandles(characteristics)
+                if handleCache:
+                    handleCache.put(address, characteristicHandles(characteristics, CACHED_CHARACTERISTICS))
+        except Exception:
+            # Do not leave the helper process behind, so that the connection can be retried
+            self.peripheral.disconnect()
+            self._releaseReactor()
+            raise
+
+        # Only the latest motor and light commands matter; sound and config writes are sent in order
+        self.writeQueue = WriteQueue(100, [self.uuidHandleMap[u] for u in (UUIDs.MOTOR, UUIDs.LIGHT)
+                                           if u in self.uuidHandleMap], writePolicy, writeTimeout)
+        self.writeQueue.onEvict = self._handleEvictedWrite
+        self.connected = True
+
+    def _setHandles(self, characteristics):
+        for c in characteristics:
             self.uuidHandleMap[c.uuid] = c.getHandle()
             self.handleUUIDMap[c.getHandle()] = c.uuid
 
+    def _useCachedHandles(self, handleCache: HandleCache) -> bool:
+        cached = handleCache.get(self.address)
+        if not cached:
+            return False
+
+        # Discovering just the span of the cached handles costs a request or two instead of the whole table,
+        # and tells whether the firmware has moved any of them
+        start = min(h[0] for h in cached.values())
+        end = max(h[1] for h in cached.values())
+        try:
+            characteristics = self.peripheral.getCharacteristics(start, end)
+        except BTLEDisconnectError:
+            raise
+        except BTLEException as ex:
+            # e.g. nothing left in the range after a firmware update
+            log.info("Cached handles of %s are stale (%s); discovering all the characteristics", self.address, ex)
+            handleCache.remove(self.address)
+            return False
+        if characteristicHandles(characteristics, CACHED_CHARACTERISTICS) != cached:
+            log.info("Cached handles of %s are stale; discovering all the characteristics", self.address)
+            return False
+
+        self._setHandles(characteristics)
+        return True
+
+    def setProtocolVersion(self, version: str):
+        if self.handleCache:
+            self.handleCache.setProtocolVersion(self.address, version)
+
+    def __str__(self) -> str:
+        return "BlePeer(%s)" % self.address
+
     def disconnect(self):
+        if self.registered:
+            self.registered = False
+            self.reactor.remove(self)
+        self._releaseReactor()
+        self.connected = False
         self.peripheral.disconnect()
 
+    def _releaseReactor(self):
+        if self.usingReactor:
+            self.usingReactor = False
+            self.reactor.release()
+
+    def fileno(self) -> int:
+        # bluepy does not expose the helper pipe, but the reactor needs it to block on notifications
+        return self.peripheral._helper.stdout.fileno()
+
     def _read(self, handle: int) -> bytes:
         return self.peripheral.readCharacteristic(handle)
-    
-    def _write(self, handle: int, data: bytes, withResponse: bool = False):
-        if self.notificationThread and self.notificationThread != currentThread():
-            self.writeQueue.put((handle, data, withResponse))
+
+    def _write(self, handle: int, data: bytes, withResponse: bool = False,
+               policy: Optional[OverflowPolicy] = None) -> bool:
+        if self.registered and not self.reactor.isReactorThread():
+            queued = self.writeQueue.put(handle, data, withResponse, policy)
+            if self.metrics is not None:
+                self.metrics.recordQueueDepth(len(self.writeQueue))
+            if queued:
+                self.reactor.requestWrite(self)
+            return queued
         else:
             self.peripheral.writeCharacteristic(handle, data, withResponse)
-    
+            self.writeCount += 1
+            self.writeBytes += len(data)
+            return True
+
     def _enableNotification(self, handle: int, value: bool = True):
-        if value and not self.notificationThread:
-            self._startNotificationThread()
+        if value and not self.registered:
+            self.registered = True
+            self.reactor.add(self)
 
         self._write(handle+1, bytes([int(value), 0]))
-        
+
     def read(self, uuid: UUID) -> bytes:
         return self._read(self.uuidHandleMap[uuid])
 
-    def write(self, uuid: UUID, data: bytes, withResponse: bool = False):
-        self._write(self.uuidHandleMap[uuid], data, withResponse)
+    def write(self, uuid: UUID, data: bytes, withResponse: bool = False) -> bool:
+        return self._write(self.uuidHandleMap[uuid], data, withResponse)
+
+    def tryWrite(self, uuid: UUID, data: bytes, withResponse: bool = False) -> bool:
+        return self._write(self.uuidHandleMap[uuid], data, withResponse, OverflowPolicy.DROP_NEWEST)
 
     def enableNotification(self, uuid: UUID, value: bool = True):
         self._enableNotification(self.uuidHandleMap[uuid], value)
@@ -53,26 +318,56 @@ class BlePeer(Peer, DefaultDelegate):
     def addListener(self, listener: PeerListenerFunc):
         self.listeners.append(listener)
 
+    def addCharacteristicListener(self, uuid: UUID, listener: CharacteristicListenerFunc):
+        self.handleListeners.setdefault(self.uuidHandleMap[uuid], list()).append(listener)
+
+    def addWriteDropListener(self, listener: WriteDropListenerFunc):
+        self.writeDropListeners.append(listener)
+
+    def _handleEvictedWrite(self, handle: int, data: bytes):
+        # Called with the lock of the write queue held
+        uuid = self.handleUUIDMap.get(handle)
+        for listener in self.writeDropListeners:
+            listener(uuid, data)
+
+    def setMetrics(self, metrics: Optional[CubeMetrics]):
+        if metrics is not None:
+            for (handle, uuid) in self.handleUUIDMap.items():
+                metrics.setKeyName(handle, characteristicName(uuid))
+        self.metrics = metrics
+        self.writeQueue.timed = metrics is not None
+
     def handleNotification(self, handle: int, data: bytes):
-        for listener in self.listeners:
-            listener(self.handleUUIDMap[handle], data)
+        self.notificationCount += 1
+        self.notificationBytes += len(data)
+        if self.metrics is not None:
+            self.metrics.recordNotification(handle, data)
 
-    def _startNotificationThread(self):
-        t = Thread(name="Notification for %s" % self, target=self._processNotifications)
-        t.setDaemon(True)
-        self.notificationThread = t
-        t.start()
+        handleListeners = self.handleListeners.get(handle)
+        if handleListeners:
+            for listener in handleListeners:
+                listener(data)
 
-    def _processNotifications(self):
+        if self.listeners:
+            uuid = self.handleUUIDMap[handle]
+            for listener in self.listeners:
+                listener(uuid, data)
+
+    def _processWrites(self):
         while True:
-            try:
-                while True:
-                    writeArgs = self.writeQueue.get(False)
-                    self._write(*writeArgs)
-            except Empty:
-                pass
+            timed = self.writeQueue.getTimed()
+            if timed is None:
+                break
+            self._write(*timed[0])
+            if self.metrics is not None and timed[1]:
+                self.metrics.recordWrite(timed[1])
 
-            try:
-                self.peripheral.waitForNotifications(0.01)
-            except BTLEInternalError as ex:
-                log.warn(ex)
+    def _processNotification(self):
+        try:
+            self.peripheral.waitForNotifications(NOTIFICATION_READ_TIMEOUT)
+        except BTLEInternalError as ex:
+            log.warn(ex)
+            if self.peripheral._helper is None or self.peripheral._helper.poll() is not None:
+                # The helper has gone and its pipe would stay readable at EOF
+                self.registered = False
+                self.reactor.remove(self)
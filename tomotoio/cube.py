@@ -1,12 +1,16 @@
-from collections import defaultdict
-from time import sleep
-from typing import Any, Callable, Dict, Generic, TypeVar, Union
+from time import monotonic, perf_counter, sleep
+from typing import Any, Callable, Dict, Generic, Optional, TypeVar, Union
 from bluepy.btle import UUID
 
 from .constants import UUIDs
+from .executor import ListenerExecutor, Mailbox
+from .filters import Filter
 from .messages import *
+from .metrics import CubeMetrics
 
 PeerListenerFunc = Callable[[UUID, bytes], Any]
+CharacteristicListenerFunc = Callable[[bytes], Any]
+WriteDropListenerFunc = Callable[[UUID, bytes], Any]
 
 
 class Peer:
@@ -16,18 +20,49 @@ class Peer:
     def read(self, handle: int) -> bytes:
         raise NotImplementedError()
 
-    def write(self, uuid: UUID, data: bytes, withResponse=False):
+    def write(self, uuid: UUID, data: bytes, withResponse=False) -> Optional[bool]:
+        """Writes, or queues the write. Peers with a write queue return False if the write was dropped."""
         raise NotImplementedError()
 
+    def tryWrite(self, uuid: UUID, data: bytes, withResponse=False) -> bool:
+        """Writes without waiting for room in a write queue; returns False if the write was dropped instead."""
+        self.write(uuid, data, withResponse)
+        return True
+
     def enableNotification(self, uuid: UUID, value: bool):
         raise NotImplementedError()
 
     def addListener(self, listener: PeerListenerFunc):
         raise NotImplementedError()
 
+    def addCharacteristicListener(self, uuid: UUID, listener: CharacteristicListenerFunc):
+        # Peers that can tell the characteristics apart more cheaply than by UUID should override this
+        self.addListener(lambda u, data: listener(data) if u is uuid or u == uuid else None)
+
+    def setMetrics(self, metrics: Optional[CubeMetrics]):
+        # Peers that can measure the notifications and writes override this
+        pass
+
+    def setProtocolVersion(self, version: str):
+        # Peers that cache anything by the firmware override this
+        pass
+
+    def addWriteDropListener(self, listener: WriteDropListenerFunc):
+        # Peers that can drop a write after queueing it (e.g. by OverflowPolicy.DROP_OLDEST) override this
+        pass
+
 
 T = TypeVar('T')
 CubeListenerFunc = Callable[[Any], Any]
+DecoderFunc = Callable[[bytes], Any]
+
+# Characteristics not in here (e.g. CONFIG, whose responses vary) are passed to the listeners as raw bytes
+DEFAULT_DECODERS: Dict[UUID, DecoderFunc] = {
+    UUIDs.TOIO_ID: decodeToioID,
+    UUIDs.MOTION: decodeMotion,
+    UUIDs.BUTTON: decodeButton,
+    UUIDs.BATTERY: decodeBattery,
+}
 
 
 class ReadableProperty(Generic[T]):
@@ -42,62 +77,229 @@ class ReadableProperty(Generic[T]):
     def enableNotification(self, value=True):
         self.cube.peer.enableNotification(self.uuid, value)
 
-    def addListener(self, listener: CubeListenerFunc):
-        self.cube.addListener(self.uuid, listener)
+    def addListener(self, listener: CubeListenerFunc, executor: Optional[ListenerExecutor] = None,
+                    filter: Optional[Filter] = None):
+        self.cube.addListener(self.uuid, listener, executor, filter)
+
+    def removeListener(self, listener: CubeListenerFunc):
+        self.cube.removeListener(self.uuid, listener)
+
+
+class _FilteredListener:
+    __slots__ = ('filter', 'listener')
+
+    def __init__(self, filter: Filter, listener: CubeListenerFunc):
+        self.filter = filter
+        self.listener = listener
+
+    def __call__(self, e):
+        self.listener(e)
+
+
+def _mailboxOf(listener: CubeListenerFunc) -> Optional[Mailbox]:
+    if isinstance(listener, _FilteredListener):
+        listener = listener.listener
+    return listener if isinstance(listener, Mailbox) else None
+
+
+class _Dispatcher:
+    """Decodes each notification of a characteristic once and passes the result to all its listeners."""
+
+    __slots__ = ('uuid', 'decoder', 'listeners', 'filtered', 'metrics')
+
+    def __init__(self, uuid: UUID, decoder: Optional[DecoderFunc], metrics: Optional[CubeMetrics] = None):
+        self.uuid = uuid
+        self.decoder = decoder
+        self.listeners: List[CubeListenerFunc] = list()
+        # Whether any of the listeners is a _FilteredListener
+        self.filtered = False
+        self.metrics = metrics
+
+    def __call__(self, data: bytes):
+        listeners = self.listeners
+        if self.filtered:
+            listeners = [l for l in listeners if not isinstance(l, _FilteredListener) or l.filter(data)]
+        if listeners:
+            e = self.decoder(data) if self.decoder else data
+            if self.metrics is None:
+                for listener in listeners:
+                    listener(e)
+            else:
+                for listener in listeners:
+                    if _mailboxOf(listener) is not None:
+                        # Only posted here; the mailbox times the listener on its worker
+                        listener(e)
+                        continue
+                    start = perf_counter()
+                    listener(e)
+                    self.metrics.recordListener(self.uuid, perf_counter() - start)
+
+
+# A suppressed motor command is sent again when less than this is left of the running one,
+# so that the cube does not stop for a moment before the next command arrives
+MOTOR_REFRESH_MARGIN = 0.2
 
 
 class Cube:
-    def __init__(self, peer: Peer, name: str):
+    def __init__(self, peer: Peer, name: str, suppressRedundantMotor: bool = False,
+                 executor: Optional[ListenerExecutor] = None):
         self.peer = peer
         self.name = name
-        self.listeners: Dict[int, List[CubeListenerFunc]] = defaultdict(lambda: list())
+        # If given, the listeners run on its workers instead of the notification thread
+        self.executor = executor
+        # When enabled, setMotor skips a payload identical to the one still running
+        self.suppressRedundantMotor = suppressRedundantMotor
+        self.suppressedWriteCount = 0
+        self.lastMotorData: Optional[bytes] = None
+        self.lastMotorExpiry = 0.0
+        if suppressRedundantMotor:
+            peer.addWriteDropListener(self._handleDroppedWrite)
+        self.decoders: Dict[UUID, DecoderFunc] = dict(DEFAULT_DECODERS)
+        # Created on the first listener of each characteristic, so nothing is decoded for the others
+        self.dispatchers: Dict[UUID, _Dispatcher] = dict()
+        self.metrics: Optional[CubeMetrics] = None
         self.toioID = ReadableProperty[Union[PositionID, StandardID, MissedID]](self, UUIDs.TOIO_ID, decodeToioID)
         self.motion = ReadableProperty[Motion](self, UUIDs.MOTION, decodeMotion)
         self.button = ReadableProperty[bool](self, UUIDs.BUTTON, decodeButton)
         self.battery = ReadableProperty[int](self, UUIDs.BATTERY, decodeBattery)
 
-        peer.addListener(self._handleNotification)
-
     def _read(self, uuid: UUID) -> bytes:
         return self.peer.read(uuid)
 
-    def _write(self, uuid: UUID, data: bytes, withResponse: bool = False):
-        self.peer.write(uuid, data, withResponse)
+    def _write(self, uuid: UUID, data: bytes, withResponse: bool = False) -> Optional[bool]:
+        return self.peer.write(uuid, data, withResponse)
 
     def _enableNotification(self, uuid: UUID, value: bool = True):
         self.peer.enableNotification(uuid, value)
 
     def _handleNotification(self, uuid: UUID, data: bytes):
-        e: Any
-        if uuid == UUIDs.MOTION:
-            e = decodeMotion(data)
-        elif uuid == UUIDs.BUTTON:
-            e = decodeButton(data)
-        elif uuid == UUIDs.TOIO_ID:
-            e = decodeToioID(data)
-        else:
-            e = data
-
-        for listener in self.listeners[uuid]:
-            listener(e)
+        dispatcher = self.dispatchers.get(uuid)
+        if dispatcher:
+            dispatcher(data)
 
     def release(self):
         self.peer.disconnect()
 
-    def addListener(self, uuid: UUID, listener: CubeListenerFunc):
-        self.listeners[uuid].append(listener)
+    def addListener(self, uuid: UUID, listener: CubeListenerFunc, executor: Optional[ListenerExecutor] = None,
+                    filter: Optional[Filter] = None):
+        """Adds a listener of the decoded notifications.
+
+        With an executor (or the one given to the cube), the listener runs on its workers through a mailbox.
+        With a filter (see tomotoio.filters), only the notifications it accepts reach the listener.
+        """
+        dispatcher = self.dispatchers.get(uuid)
+        if dispatcher is None:
+            dispatcher = _Dispatcher(uuid, self.decoders.get(uuid), self.metrics)
+            self.dispatchers[uuid] = dispatcher
+            self.peer.addCharacteristicListener(uuid, dispatcher)
+
+        executor = executor if executor else self.executor
+        if executor:
+            listener = executor.wrap(listener)
+            listener.metrics = self.metrics
+            listener.metricsKey = uuid
+        if filter:
+            listener = _FilteredListener(filter, listener)
+            dispatcher.filtered = True
+        dispatcher.listeners.append(listener)
+
+    def removeListener(self, uuid: UUID, listener: CubeListenerFunc):
+        dispatcher = self.dispatchers[uuid]
+        for (i, l) in enumerate(dispatcher.listeners):
+            original = l
+            while isinstance(original, (_FilteredListener, Mailbox)):
+                original = original.listener
+            if original == listener:
+                del dispatcher.listeners[i]
+                dispatcher.filtered = any(isinstance(l, _FilteredListener) for l in dispatcher.listeners)
+                return
+        raise ValueError("%s is not a listener of %s" % (listener, uuid))
+
+    def registerDecoder(self, uuid: UUID, decoder: Optional[DecoderFunc]):
+        """Sets how the notifications of a characteristic are decoded; None passes them as raw bytes."""
+        self.decoders[uuid] = decoder
+        dispatcher = self.dispatchers.get(uuid)
+        if dispatcher:
+            dispatcher.decoder = decoder
+
+    def enableMetrics(self) -> CubeMetrics:
+        """Starts collecting the metrics (see tomotoio.metrics) and returns them; call snapshot() to read."""
+        if self.metrics is None:
+            self._setMetrics(CubeMetrics())
+        return self.metrics
+
+    def disableMetrics(self):
+        self._setMetrics(None)
+
+    def _setMetrics(self, metrics: Optional[CubeMetrics]):
+        self.metrics = metrics
+        for dispatcher in self.dispatchers.values():
+            dispatcher.metrics = metrics
+            for listener in dispatcher.listeners:
+                mailbox = _mailboxOf(listener)
+                if mailbox is not None:
+                    mailbox.metrics = metrics
+        self.peer.setMetrics(metrics)
 
     def getConfigProtocolVersion(self) -> str:
         self._write(UUIDs.CONFIG, encodeConfigProtocolVersionRequest(), True)
         sleep(0.1)
-        return decodeConfigProtocolVersionResponse(self._read(UUIDs.CONFIG))
+        version = decodeConfigProtocolVersionResponse(self._read(UUIDs.CONFIG))
+        self.peer.setProtocolVersion(version)
+        return version
+
+    def _motorData(self, left: float, right: float, duration: float) -> Optional[bytes]:
+        # Returns None if the command is suppressed as redundant
+        data = encodeMotor(int(left), int(right), duration)
+
+        if self.suppressRedundantMotor:
+            now = monotonic()
+            if data == self.lastMotorData and now < self.lastMotorExpiry:
+                self.suppressedWriteCount += 1
+                return None
+
+            # Use the duration as encoded; zero means it runs until the next command
+            encodedDuration = data[7] / 100
+            self.lastMotorData = data
+            self.lastMotorExpiry = now + encodedDuration - MOTOR_REFRESH_MARGIN if encodedDuration else float('inf')
+
+        return data
+
+    def _handleDroppedWrite(self, uuid: UUID, data: bytes):
+        # Called by the peer, possibly on another thread, for a write it evicted from its queue
+        if uuid == UUIDs.MOTOR and data == self.lastMotorData:
+            self.lastMotorData = None
 
     def setMotor(self, left: float, right: float, duration: float = 0):
-        self._write(UUIDs.MOTOR, encodeMotor(int(left), int(right), duration))
+        data = self._motorData(left, right, duration)
+        if not data:
+            return
+        # A command that was not sent must not suppress the next identical one
+        try:
+            sent = self._write(UUIDs.MOTOR, data)
+        except Exception:
+            self.lastMotorData = None
+            raise
+        if sent is False:
+            self.lastMotorData = None
+
+    def trySetMotor(self, left: float, right: float, duration: float = 0) -> bool:
+        """Same as setMotor, but returns False instead of waiting when the write queue is full."""
+        data = self._motorData(left, right, duration)
+        if not data:
+            return True
+        if self.peer.tryWrite(UUIDs.MOTOR, data):
+            return True
+        self.lastMotorData = None  # Not sent, so do not suppress the next one
+        return False
 
     def setLight(self, r: int, g: int, b: int, duration: float = 0):
         self._write(UUIDs.LIGHT, encodeLight(r, g, b, duration))
 
+    def trySetLight(self, r: int, g: int, b: int, duration: float = 0) -> bool:
+        """Same as setLight, but returns False instead of waiting when the write queue is full."""
+        return self.peer.tryWrite(UUIDs.LIGHT, encodeLight(r, g, b, duration))
+
     def setLightPattern(self, lights: List[Light], repeat: int = 0):
         self._write(UUIDs.LIGHT, encodeLightPattern(lights, repeat))
 
@@ -1,3 +1,4 @@
+from collections import namedtuple
 from enum import Enum
 
 
@@ -9,44 +10,41 @@ class ToioIDType(Enum):
 
 
 class ToioID:
-    def __init__(self, type: ToioIDType):
-        self.type = type
+    """Base of the ID notifications.
+
+    The concrete types are immutable named tuples without an instance dictionary, as one is
+    allocated for every notification. The type is a class attribute.
+    """
+    __slots__ = ()
+    type = ToioIDType.INVALID
 
     def isPosition(self):
-        return self.type == ToioIDType.POSITION
+        return self.type is ToioIDType.POSITION
 
     def isStandard(self):
-        return self.type == ToioIDType.STANDARD
+        return self.type is ToioIDType.STANDARD
 
     def isMissed(self):
-        return self.type == ToioIDType.MISSED
+        return self.type is ToioIDType.MISSED
 
     def __str__(self):
-        return str(vars(self))
+        return str(dict(type=self.type, **self._asdict()))
+
 
+class PositionID(ToioID, namedtuple('PositionID', 'x y angle sensorX sensorY sensorAngle')):
+    __slots__ = ()
+    type = ToioIDType.POSITION
 
-class PositionID(ToioID):
-    def __init__(self, x: float, y: float, angle: float, sensorX: float, sensorY: float, sensorAngle: float):
-        super().__init__(ToioIDType.POSITION)
-        self.x = x
-        self.y = y
-        self.angle = angle
-        self.sensorX = sensorX
-        self.sensorY = sensorY
-        self.sensorAngle = sensorAngle
 
+class StandardID(ToioID, namedtuple('StandardID', 'value angle')):
+    __slots__ = ()
+    type = ToioIDType.STANDARD
 
-class StandardID(ToioID):
-    def __init__(self, value: float, angle: float):
-        super().__init__(ToioIDType.STANDARD)
-        self.value = value
-        self.angle = angle
 
+class MissedID(ToioID, namedtuple('MissedID', 'fromType')):
+    __slots__ = ()
+    type = ToioIDType.MISSED
 
-class MissedID(ToioID):
-    def __init__(self, fromType: ToioIDType):
-        super().__init__(ToioIDType.MISSED)
-        self.fromType = fromType
 
 class Orientation(Enum):
     INVALID = 0
@@ -57,15 +55,12 @@ class Orientation(Enum):
     RIGHT_UP = 5
     LEFT_UP = 6
 
-class Motion:
-    def __init__(self, isLevel: bool, collision: bool, doubleTap: bool, orientation: Orientation):
-        self.isLevel = isLevel
-        self.collision = collision
-        self.doubleTap = doubleTap
-        self.orientation = orientation
+
+class Motion(namedtuple('Motion', 'isLevel collision doubleTap orientation')):
+    __slots__ = ()
 
     def __str__(self):
-        return str(vars(self))
+        return str(dict(self._asdict()))
 
 
 class Light:
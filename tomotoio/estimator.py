@@ -0,0 +1,94 @@
+from threading import Lock
+from typing import List, Optional, Tuple
+
+from .data import MissedID, PositionID
+from .geo import angleDiff
+from .navigator import calcPoseAfter
+
+# Rough age of a position by the time it is handled (sensor, radio and notification thread)
+DEFAULT_LATENCY = 0.03
+
+Pose = Tuple[float, float, float]
+
+
+class PoseEstimator:
+    """Estimates the current pose of a cube from its positions and the motor commands issued to it.
+
+    A position is taken as measured latency seconds before it arrived, and the pose is predicted
+    forward by differential-drive kinematics of the motor commands in effect since then. With
+    gain < 1, a new position is blended with the prediction instead of replacing it, which smooths
+    out the sensor noise. The prediction stays valid for maxDeadReckoning seconds after the last
+    position, e.g. to get over a short run of missed IDs.
+    """
+
+    def __init__(self, latency: float = DEFAULT_LATENCY, maxDeadReckoning: float = 0.5, gain: float = 1.0):
+        self.latency = latency
+        self.maxDeadReckoning = maxDeadReckoning
+        self.gain = gain
+        self.lock = Lock()
+        self.anchorTime = 0.0
+        self.anchor: Optional[Pose] = None
+        self.lastUpdateTime = 0.0
+        # (start, left, right, end) in the order of issue
+        self.commands: List[Tuple[float, float, float, float]] = list()
+
+    def recordMotor(self, t: float, left: float, right: float, duration: float = 0):
+        """Records a motor command issued at time t (same arguments as Cube.setMotor)."""
+        with self.lock:
+            self.commands.append((t, int(left), int(right), t + duration if duration else float('inf')))
+
+    def _advance(self, pose: Pose, t0: float, t1: float) -> Pose:
+        (x, y, angle) = pose
+        for (k, (start, left, right, end)) in enumerate(self.commands):
+            nextStart = self.commands[k + 1][0] if k + 1 < len(self.commands) else float('inf')
+            s = max(start, t0)
+            e = min(end, nextStart, t1)
+            if e > s:
+                (x, y, angle) = calcPoseAfter(x, y, angle, left, right, e - s)
+        return (x, y, angle)
+
+    def _prune(self):
+        # Keep the command in effect at the anchor time and the ones after it
+        k = 0
+        while k + 1 < len(self.commands) and self.commands[k + 1][0] <= self.anchorTime:
+            k += 1
+        del self.commands[:k]
+
+    def update(self, t: float, x: float, y: float, angle: float):
+        """Feeds a position that arrived at time t."""
+        with self.lock:
+            measured = t - self.latency
+            if self.anchor and self.gain < 1:
+                (px, py, pa) = self._advance(self.anchor, self.anchorTime, measured)
+                g = self.gain
+                (x, y, angle) = (px + (x - px) * g, py + (y - py) * g, (pa + angleDiff(angle - pa) * g) % 360)
+            self.anchor = (x, y, angle)
+            self.anchorTime = measured
+            self.lastUpdateTime = t
+            self._prune()
+
+    def reset(self):
+        with self.lock:
+            self.anchor = None
+            self.commands = list()
+
+    def predict(self, t: float) -> Optional[Pose]:
+        """Returns the (x, y, angle) predicted for time t, or None if there is no recent enough position."""
+        with self.lock:
+            if not self.anchor or t - self.lastUpdateTime > self.maxDeadReckoning:
+                return None
+            return self._advance(self.anchor, self.anchorTime, t)
+
+    def predictPositionID(self, t: float, e):
+        """Replaces a PositionID (or a MissedID within the dead reckoning time) with the predicted one.
+
+        Any other notification, or one that cannot be predicted, is returned as is.
+        """
+        if not isinstance(e, (PositionID, MissedID)):
+            return e
+        p = self.predict(t)
+        if not p:
+            return e
+        if isinstance(e, PositionID):
+            return PositionID(p[0], p[1], p[2], e.sensorX, e.sensorY, e.sensorAngle)
+        return PositionID(p[0], p[1], p[2], p[0], p[1], p[2])
@@ -0,0 +1,165 @@
+"""Listeners running off the notification thread
+
+A ListenerExecutor gives each listener its own mailbox and runs it on a small worker pool,
+so that a slow listener delays neither the BLE I/O of its cube nor the other listeners.
+A mailbox keeps the events of its listener in order, but conflates state updates such as
+positions: a new one replaces the last one if that is still waiting. When the mailbox is full,
+the oldest state update goes first; edges such as motion, button and missed IDs are dropped only
+if there is none, as the overflow policy says (see OverflowPolicy).
+"""
+import logging as log
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Full
+from threading import Condition, Lock
+from time import perf_counter
+from typing import Any, Callable, Deque, Hashable, Optional
+
+from .data import PositionID
+from .metrics import CubeMetrics
+from .writequeue import OverflowPolicy
+
+# Events handled by a mailbox before it yields its worker to the other mailboxes
+MAILBOX_BATCH_SIZE = 16
+
+
+def isConflatable(e: Any) -> bool:
+    """The default conflation rule: only the latest position matters."""
+    return isinstance(e, PositionID)
+
+
+class Mailbox:
+    """Callable standing in for a listener; posting to it never blocks."""
+
+    def __init__(self, executor: 'ListenerExecutor', listener: Callable[[Any], Any],
+                 maxsize: int, conflatable: Callable[[Any], bool],
+                 policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST, timeout: Optional[float] = None):
+        self.executor = executor
+        self.listener = listener
+        self.maxsize = maxsize
+        self.conflatable = conflatable
+        self.policy = policy
+        self.timeout = timeout
+        self.lock = Lock()
+        self.notFull = Condition(self.lock)
+        self.events: Deque[Any] = deque()
+        self.scheduled = False
+        self.conflatedCount = 0
+        self.droppedCount = 0
+        self.rejectedCount = 0  # Raised queue.Full, either by RAISE or by the timeout of BLOCK
+        # If set, the listener times are recorded here, as measured on the worker
+        self.metrics: Optional[CubeMetrics] = None
+        self.metricsKey: Hashable = None
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def __call__(self, e: Any):
+        with self.lock:
+            if self.executor.closed:
+                self.droppedCount += 1
+                log.debug("Dropped %s posted after shutdown", e)
+                return
+
+            events = self.events
+            if self.conflatable(e) and events and self.conflatable(events[-1]):
+                events[-1] = e
+                self.conflatedCount += 1
+            else:
+                if len(events) >= self.maxsize and not self._makeRoom():
+                    return
+                events.append(e)
+
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.executor._schedule(self)
+
+    def _makeRoom(self) -> bool:
+        # Must be called with the lock held
+        for (i, e) in enumerate(self.events):
+            if self.conflatable(e):
+                del self.events[i]
+                self.droppedCount += 1
+                return True
+
+        # Only edges are waiting
+        if self.policy == OverflowPolicy.BLOCK:
+            if not self.notFull.wait_for(lambda: len(self.events) < self.maxsize, self.timeout):
+                self.rejectedCount += 1
+                raise Full()
+        elif self.policy == OverflowPolicy.DROP_OLDEST:
+            self.events.popleft()
+            self.droppedCount += 1
+        elif self.policy == OverflowPolicy.DROP_NEWEST:
+            self.droppedCount += 1
+            return False
+        else:
+            self.rejectedCount += 1
+            raise Full()
+        return True
+
+    def _discard(self):
+        with self.lock:
+            if self.events:
+                log.debug("Dropped %d events of %s after shutdown", len(self.events), self.listener)
+            self.droppedCount += len(self.events)
+            self.events.clear()
+            self.scheduled = False
+            self.notFull.notify_all()
+
+    def _drain(self):
+        for _ in range(MAILBOX_BATCH_SIZE):
+            with self.lock:
+                if not self.events:
+                    self.scheduled = False
+                    return
+                e = self.events.popleft()
+                self.notFull.notify()
+            try:
+                metrics = self.metrics
+                if metrics is None:
+                    self.listener(e)
+                else:
+                    start = perf_counter()
+                    self.listener(e)
+                    metrics.recordListener(self.metricsKey, perf_counter() - start)
+            except Exception:
+                log.exception("Error in listener %s", self.listener)
+        # Still scheduled; let the other mailboxes run before the rest
+        self.executor._schedule(self)
+
+
+class ListenerExecutor:
+    """Worker pool for listeners, to be given to Cube or to addListener.
+
+    Events posted after shutdown() are dropped.
+
+    Arguments:
+        workers {int} -- Number of worker threads shared by all the listeners
+        mailboxSize {int} -- Number of events a mailbox holds before it drops its oldest conflatable one
+        policy {OverflowPolicy} -- What a mailbox full of edges does with one more event
+        timeout {float} -- How long BLOCK waits for room before raising queue.Full (None for no limit)
+    """
+
+    def __init__(self, workers: int = 2, mailboxSize: int = 100,
+                 policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST, timeout: Optional[float] = None):
+        self.mailboxSize = mailboxSize
+        self.policy = policy
+        self.timeout = timeout
+        self.closed = False
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Listener")
+
+    def wrap(self, listener: Callable[[Any], Any], conflatable: Callable[[Any], bool] = isConflatable) -> Mailbox:
+        return Mailbox(self, listener, self.mailboxSize, conflatable, self.policy, self.timeout)
+
+    def _schedule(self, mailbox: Mailbox):
+        try:
+            self.pool.submit(mailbox._drain)
+        except RuntimeError:
+            # Shut down since the event was posted
+            mailbox._discard()
+
+    def shutdown(self, wait: bool = True):
+        self.closed = True
+        self.pool.shutdown(wait)
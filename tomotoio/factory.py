@@ -1,22 +1,295 @@
+import asyncio
+import logging as log
 import sys
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from threading import Event, Lock, Thread
+from time import monotonic, sleep
+from typing import Any, Dict, List, Optional, TextIO, Tuple
 
-from .blepeer import BlePeer
+from .asynccube import AsyncCube, AsyncPeer
+from .blepeer import BlePeer, BleReactor
 from .cube import Cube
+from .executor import ListenerExecutor
+from .handlecache import HandleCache
+from .scanner import scanCubesWithRSSI
 
 
-def createCube(address: str, name: str = None, iface: int = 0) -> Cube:
-    return Cube(BlePeer(address, iface), name if name else address)
+def createCube(address: str, name: str = None, iface: int = 0, reactor: Optional[BleReactor] = None,
+               handleCache: Optional[HandleCache] = None) -> Cube:
+    return Cube(BlePeer(address, iface, reactor, handleCache=handleCache), name if name else address)
 
 
-def createCubesFromFile(addressesFile: str = None, iface: int = 0) -> List[Cube]:
-    def readAddresses(f) -> List[str]:
+async def createAsyncCube(address: str, name: str = None, iface: int = 0,
+                          reactor: Optional[BleReactor] = None) -> AsyncCube:
+    loop = asyncio.get_running_loop()
+    peer = await loop.run_in_executor(None, BlePeer, address, iface, reactor)
+    return AsyncCube(AsyncPeer(peer, loop), name if name else address)
+
+
+def readAddresses(addressesFile: str = None) -> List[str]:
+    def read(f: TextIO) -> List[str]:
         return [s.strip() for s in f.readlines()]
 
     if addressesFile:
         with open(addressesFile) as f:
-            addresses = readAddresses(f)
+            return read(f)
     else:
-        addresses = readAddresses(sys.stdin)
+        return read(sys.stdin)
+
+
+def createCubesFromFile(addressesFile: str = None, iface: int = 0, sharedReactor: bool = False) -> List[Cube]:
+    """Creates the cubes listed in a file (or stdin) one address per line.
+
+    With sharedReactor=True, all the cubes are serviced by a single I/O thread
+    instead of one thread per cube.
+    """
+    addresses = readAddresses(addressesFile)
+
+    reactor = BleReactor(closeWhenUnused=True) if sharedReactor else None
+
+    cubes = [createCube(a, "Cube #%d" % i, iface, reactor) for i, a in enumerate(addresses, 1)]
+    if reactor and not cubes:
+        reactor.close()  # Not to be closed by any cube
+    return cubes
+
+
+class ConnectResult:
+    """Outcome of a concurrent bring-up. Cubes are in the order of the addresses; failures map address to the last error."""
+
+    def __init__(self):
+        self.cubes: List[Cube] = list()
+        self.failures: Dict[str, Exception] = dict()
+        self.pool: Optional['AdapterPool'] = None  # Set by connectCubesSharded
+
+    def isComplete(self) -> bool:
+        return not self.failures
+
+
+def _connectPeer(address: str, iface: int, reactor: Optional[BleReactor], timeout: float,
+                 handleCache: Optional[HandleCache] = None) -> BlePeer:
+    # bluepy cannot abort a connection attempt, so it is left running in the background
+    # on timeout and the peer is disconnected if it shows up late.
+    lock = Lock()
+    done = Event()
+    state: Dict[str, object] = {'abandoned': False}
+
+    def attempt():
+        try:
+            peer = BlePeer(address, iface, reactor, handleCache=handleCache)
+        except Exception as ex:
+            state['error'] = ex
+            done.set()
+            return
+
+        with lock:
+            abandoned = state['abandoned']
+            state['peer'] = peer
+        done.set()
+        if abandoned:
+            log.debug("%s: connected after timeout, disconnecting", address)
+            peer.disconnect()
+
+    t = Thread(name="Connect to %s" % address, target=attempt)
+    t.setDaemon(True)
+    t.start()
+
+    done.wait(timeout)
+    with lock:
+        if 'peer' in state:
+            return state['peer']
+        if 'error' in state:
+            raise state['error']
+        state['abandoned'] = True
+    raise TimeoutError("Connection to %s timed out after %.1f seconds" % (address, timeout))
+
+
+def connectCube(address: str, name: str = None, iface: int = 0, reactor: Optional[BleReactor] = None,
+                timeout: float = 10, retries: int = 2, retryInterval: float = 0.5,
+                listenerExecutor: Optional[ListenerExecutor] = None,
+                handleCache: Optional[HandleCache] = None) -> Cube:
+    """Creates a cube, giving each connection attempt up to timeout seconds and retrying up to retries times.
+
+    With a handleCache, a cube connected before skips the discovery of its characteristics.
+    """
+    for i in range(retries + 1):
+        try:
+            return Cube(_connectPeer(address, iface, reactor, timeout, handleCache), name if name else address,
+                        executor=listenerExecutor)
+        except Exception as ex:
+            if i == retries:
+                raise
+            log.warning("%s: connection attempt #%d failed (%s), retrying", address, i + 1, ex)
+            sleep(retryInterval)
+
+
+def connectCubes(addresses: List[str], iface: int = 0, sharedReactor: bool = False,
+                 timeout: float = 10, retries: int = 2, maxWorkers: int = None,
+                 listenerExecutor: Optional[ListenerExecutor] = None,
+                 handleCache: Optional[HandleCache] = None) -> ConnectResult:
+    """Connects to the cubes concurrently. A cube failing to connect does not abort the others."""
+    reactor = BleReactor(closeWhenUnused=True) if sharedReactor else None
+    result = ConnectResult()
+    if not addresses:
+        if reactor:
+            reactor.close()
+        return result
+
+    with ThreadPoolExecutor(max_workers=maxWorkers if maxWorkers else len(addresses)) as executor:
+        futures = [executor.submit(connectCube, a, "Cube #%d" % i, iface, reactor, timeout, retries,
+                                   listenerExecutor=listenerExecutor, handleCache=handleCache)
+                   for i, a in enumerate(addresses, 1)]
+
+        for address, future in zip(addresses, futures):
+            try:
+                result.cubes.append(future.result())
+            except Exception as ex:
+                result.failures[address] = ex
+
+    if reactor and not result.cubes:
+        reactor.close()  # Not to be closed by any cube
+    return result
+
+
+def connectCubesFromFile(addressesFile: str = None, iface: int = 0, sharedReactor: bool = False,
+                         timeout: float = 10, retries: int = 2, maxWorkers: int = None,
+                         listenerExecutor: Optional[ListenerExecutor] = None,
+                         handleCache: Optional[HandleCache] = None) -> ConnectResult:
+    return connectCubes(readAddresses(addressesFile), iface, sharedReactor, timeout, retries, maxWorkers,
+                        listenerExecutor, handleCache)
+
+
+class ShardingStrategy(Enum):
+    ROUND_ROBIN = 0  # In turn, in the order of the addresses
+    LEAST_LOADED = 1  # To the adapter with the fewest connections (then the least traffic)
+    BEST_RSSI = 2  # To the adapter that hears the cube best in a scan, up to maxPerAdapter
+
+
+class AdapterPool:
+    """Bluetooth adapters (HCI interface numbers) and the cubes connected through each of them.
+
+    With sharedReactor=True, the cubes of an adapter are serviced by a single I/O thread per adapter,
+    which the pool keeps for more cubes until close().
+    """
+
+    def __init__(self, ifaces: List[int], sharedReactor: bool = False):
+        if not ifaces:
+            raise ValueError("No interfaces given")
+        self.ifaces = list(ifaces)
+        self.reactors: Dict[int, Optional[BleReactor]] = {
+            i: BleReactor("Notification for hci%d" % i) if sharedReactor else None for i in self.ifaces}
+        self.peers: Dict[int, List[BlePeer]] = {i: list() for i in self.ifaces}
+        self.lock = Lock()
+        self.startTime = monotonic()
+        self.nextIndex = 0
+
+    def close(self):
+        """Closes the shared reactors; call after disconnecting the cubes."""
+        for reactor in self.reactors.values():
+            if reactor:
+                reactor.close()
+
+    def add(self, iface: int, peer: BlePeer):
+        with self.lock:
+            self.peers[iface].append(peer)
+
+    def connectionCount(self, iface: int) -> int:
+        with self.lock:
+            return len([p for p in self.peers[iface] if p.connected])
+
+    def _load(self, iface: int, assigned: Dict[int, int]) -> Tuple[int, int]:
+        with self.lock:
+            peers = [p for p in self.peers[iface] if p.connected]
+        traffic = sum(p.notificationBytes + p.writeBytes for p in peers)
+        return (len(peers) + assigned[iface], traffic)
+
+    def assign(self, addresses: List[str], strategy: ShardingStrategy = ShardingStrategy.ROUND_ROBIN,
+               rssi: Optional[Dict[int, Dict[str, int]]] = None, maxPerAdapter: Optional[int] = None) -> Dict[str, int]:
+        """Picks an adapter for each address.
+
+        rssi maps an interface to the RSSI of the addresses it has heard, for BEST_RSSI;
+        a cube not heard by any adapter with room goes to the least loaded one.
+        """
+        assigned = {i: 0 for i in self.ifaces}
+        result: Dict[str, int] = dict()
+
+        def hasRoom(iface: int) -> bool:
+            return maxPerAdapter is None or self._load(iface, assigned)[0] < maxPerAdapter
+
+        for address in addresses:
+            iface: Optional[int] = None
+            if strategy == ShardingStrategy.ROUND_ROBIN:
+                iface = self.ifaces[self.nextIndex % len(self.ifaces)]
+                self.nextIndex += 1
+            elif strategy == ShardingStrategy.BEST_RSSI and rssi:
+                heard = [(rssi[i][address], i) for i in self.ifaces if address in rssi.get(i, {}) and hasRoom(i)]
+                if heard:
+                    iface = max(heard)[1]
+            if iface is None:
+                iface = min(self.ifaces, key=lambda i: self._load(i, assigned))
+            assigned[iface] += 1
+            result[address] = iface
+        return result
+
+    def stats(self) -> Dict[int, Dict[str, Any]]:
+        """Returns the connection count and traffic of each adapter, with the rates since the pool was created."""
+        elapsed = max(monotonic() - self.startTime, 1e-9)
+        result = dict()
+        with self.lock:
+            for (iface, peers) in self.peers.items():
+                notificationCount = sum(p.notificationCount for p in peers)
+                writeCount = sum(p.writeCount for p in peers)
+                result[iface] = dict(
+                    connections=len([p for p in peers if p.connected]),
+                    notificationCount=notificationCount,
+                    notificationBytes=sum(p.notificationBytes for p in peers),
+                    notificationsPerSecond=notificationCount / elapsed,
+                    writeCount=writeCount,
+                    writeBytes=sum(p.writeBytes for p in peers),
+                    writesPerSecond=writeCount / elapsed)
+        return result
+
+
+def scanRSSI(ifaces: List[int], timeout: float) -> Dict[int, Dict[str, int]]:
+    """Scans the cubes through each interface in turn; returns their RSSI by interface and address."""
+    return {i: scanCubesWithRSSI(timeout, i) for i in ifaces}
+
+
+def connectCubesSharded(addresses: List[str], ifaces: List[int],
+                        strategy: ShardingStrategy = ShardingStrategy.ROUND_ROBIN,
+                        pool: Optional[AdapterPool] = None, sharedReactor: bool = False,
+                        maxPerAdapter: Optional[int] = None, scanTimeout: float = 3,
+                        timeout: float = 10, retries: int = 2, maxWorkers: int = None,
+                        listenerExecutor: Optional[ListenerExecutor] = None,
+                        handleCache: Optional[HandleCache] = None) -> ConnectResult:
+    """Connects to the cubes concurrently, spreading them over the adapters by the strategy.
+
+    The pool (created from ifaces if not given) is set to result.pool, e.g. for its stats().
+    BEST_RSSI scans through each adapter for scanTimeout seconds first, which needs root.
+    """
+    pool = pool if pool else AdapterPool(ifaces, sharedReactor)
+    result = ConnectResult()
+    result.pool = pool
+    if not addresses:
+        return result
+
+    rssi = scanRSSI(pool.ifaces, scanTimeout) if strategy == ShardingStrategy.BEST_RSSI else None
+    assignment = pool.assign(addresses, strategy, rssi, maxPerAdapter)
+    for (address, iface) in assignment.items():
+        log.debug("%s: assigned to hci%d", address, iface)
+
+    with ThreadPoolExecutor(max_workers=maxWorkers if maxWorkers else len(addresses)) as executor:
+        futures = [executor.submit(connectCube, a, "Cube #%d" % i, assignment[a], pool.reactors[assignment[a]],
+                                   timeout, retries, listenerExecutor=listenerExecutor, handleCache=handleCache)
+                   for i, a in enumerate(addresses, 1)]
+
+        for address, future in zip(addresses, futures):
+            try:
+                cube = future.result()
+            except Exception as ex:
+                result.failures[address] = ex
+                continue
+            pool.add(assignment[address], cube.peer)
+            result.cubes.append(cube)
 
-    return [createCube(a, "Cube #%d" % i, iface) for i, a in enumerate(addresses, 1)]
+    return result
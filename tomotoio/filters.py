@@ -0,0 +1,96 @@
+"""Filters of notifications for addListener
+
+A filter looks at the raw bytes of a notification before it is decoded, and the listener is
+called only if the filter accepts it. A notification nobody accepts is not decoded at all.
+A filter keeps the state of its listener, so each listener needs its own instance.
+
+A notification of a different type (the first byte) than the last accepted one always passes,
+e.g. a missed ID right after positions, however soon it comes.
+"""
+from struct import Struct
+from time import monotonic
+from typing import Optional
+
+_positionXYAngle = Struct("<HHH")
+
+
+class Filter:
+    def __init__(self):
+        self.lastData: Optional[bytes] = None
+
+    def __call__(self, data: bytes) -> bool:
+        last = self.lastData
+        if last is None or not data or not last or data[0] != last[0] or self.accept(data, last):
+            self.lastData = data
+            return True
+        return False
+
+    def accept(self, data: bytes, last: bytes) -> bool:
+        """Tells whether to pass data, of the same type as the last accepted one."""
+        raise NotImplementedError()
+
+
+class MinInterval(Filter):
+    """Passes at most one notification of a type per interval seconds."""
+
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+        self.lastTime = 0.0
+
+    def __call__(self, data: bytes) -> bool:
+        if super().__call__(data):
+            self.lastTime = monotonic()
+            return True
+        return False
+
+    def accept(self, data: bytes, last: bytes) -> bool:
+        return monotonic() - self.lastTime >= self.interval
+
+
+class DeadBand(Filter):
+    """Passes a position ID only when x or y moves by distance, or the angle by angle, from the last one passed.
+
+    Any other notification passes when its bytes change.
+    """
+
+    def __init__(self, distance: float = 2, angle: float = 2):
+        super().__init__()
+        self.distance = distance
+        self.angle = angle
+        self.lastPose = (0, 0, 0)
+
+    def __call__(self, data: bytes) -> bool:
+        # Specialized for the common case of a position following a position, with the last one unpacked
+        last = self.lastData
+        if data == last:
+            return False
+        if last is not None and len(data) == 13 and data[0] == 0x01 and last[0] == 0x01:
+            (x1, y1, a1) = _positionXYAngle.unpack_from(data, 1)
+            (x0, y0, a0) = self.lastPose
+            if abs(x1 - x0) < self.distance and abs(y1 - y0) < self.distance and \
+                    abs((a1 - a0 + 180) % 360 - 180) < self.angle:
+                return False
+            self.lastData = data
+            self.lastPose = (x1, y1, a1)
+            return True
+
+        if super().__call__(data):
+            if len(data) == 13 and data[0] == 0x01:
+                self.lastPose = _positionXYAngle.unpack_from(data, 1)
+            return True
+        return False
+
+    def accept(self, data: bytes, last: bytes) -> bool:
+        # Reached only for the types other than position
+        return data != last
+
+
+class OnChange(Filter):
+    """Passes a notification only when its bytes differ from the last one passed, e.g. for motion and button."""
+
+    def __call__(self, data: bytes) -> bool:
+        return data != self.lastData and super().__call__(data)
+
+    def accept(self, data: bytes, last: bytes) -> bool:
+        return data != last
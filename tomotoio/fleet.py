@@ -0,0 +1,123 @@
+"""Fixed-rate control loop over a fleet of cubes
+
+Fleet.run() calls a tick function at a fixed rate, on deadlines of the monotonic clock that do
+not drift however long the ticks take. Each tick gets the poses of all the cubes taken at its
+start, and the commands it gives through the Tick are sent together when it returns.
+"""
+from threading import Event
+from time import monotonic
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .data import PositionID
+from .metrics import Histogram
+from .navigator import Navigator
+
+
+class Tick:
+    """A tick of the loop.
+
+    positions[i] is the pose of the i-th cube (predicted if its navigator has an estimator), or None if unknown.
+    The commands refer to the cubes by the same index.
+    """
+
+    def __init__(self, fleet: 'Fleet', index: int, time: float, positions: List[Optional[PositionID]]):
+        self.fleet = fleet
+        self.index = index
+        self.time = time
+        self.positions = positions
+        self.commands: List[Tuple[Callable, tuple, Dict[str, Any]]] = list()
+
+    def call(self, func: Callable, *args, **kwargs):
+        """Defers any call to the flush at the end of the tick."""
+        self.commands.append((func, args, kwargs))
+
+    def setMotor(self, i: int, left: float, right: float, duration: float = 0):
+        self.call(self.fleet._setMotor, i, left, right, duration)
+
+    def move(self, i: int, targetX: float, targetY: float, tolerance: float, **kwargs):
+        self.call(self.fleet.navigators[i].move, targetX, targetY, tolerance, **kwargs)
+
+    def rotate(self, i: int, targetAngle: float, tolerance: float):
+        self.call(self.fleet.navigators[i].rotate, targetAngle, tolerance)
+
+    def circle(self, i: int, centerX: float, centerY: float, radius: float):
+        self.call(self.fleet.navigators[i].circle, centerX, centerY, radius)
+
+    def stop(self, i: int):
+        self.call(self.fleet._stop, i)
+
+    def flush(self):
+        commands = self.commands
+        self.commands = list()
+        for (func, args, kwargs) in commands:
+            func(*args, **kwargs)
+
+
+class Fleet:
+    """Runs tick functions at rate times per second over the cubes of the navigators.
+
+    A tick that ends after the next deadline is an overrun; the deadlines it has passed by a whole
+    interval are skipped instead of being run in a burst. Motor commands use trySetMotor, so a
+    cube with a full write queue does not hold up the loop (the write is counted as dropped).
+    """
+
+    def __init__(self, navigators: List[Navigator], rate: float = 10):
+        self.navigators = navigators
+        self.interval = 1 / rate
+        self.stopped = Event()
+        self.tickCount = 0
+        self.overrunCount = 0
+        self.skippedTickCount = 0
+        self.droppedWriteCount = 0
+        self.lateness = Histogram()  # How long after its deadline each tick started
+
+    def snapshot(self) -> List[Optional[PositionID]]:
+        """Returns the current poses of all the cubes, predicted where the navigator has an estimator."""
+        return [nav.predictPosition() or nav.lastPosition for nav in self.navigators]
+
+    def _setMotor(self, i: int, left: float, right: float, duration: float):
+        nav = self.navigators[i]
+        nav.setCommand(None)
+        if not nav.trySetMotor(left, right, duration):
+            self.droppedWriteCount += 1
+
+    def _stop(self, i: int):
+        self._setMotor(i, 0, 0, 0)
+
+    def run(self, tick: Callable[[Tick], Any], duration: Optional[float] = None):
+        """Calls tick until it returns False, stop() is called, or duration seconds have passed."""
+        self.stopped.clear()
+        start = monotonic()
+        deadline = start
+        while not self.stopped.is_set():
+            now = monotonic()
+            if now < deadline:
+                if self.stopped.wait(deadline - now):
+                    break
+                now = monotonic()
+            if duration is not None and now - start >= duration:
+                break
+
+            self.lateness.add(max(now - deadline, 0))
+            t = Tick(self, self.tickCount, now, self.snapshot())
+            self.tickCount += 1
+            result = tick(t)
+            t.flush()
+            if result is False:
+                break
+
+            deadline += self.interval
+            end = monotonic()
+            if end > deadline:
+                self.overrunCount += 1
+                skipped = int((end - deadline) / self.interval)
+                self.skippedTickCount += skipped
+                deadline += skipped * self.interval
+
+    def stop(self):
+        self.stopped.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(tickCount=self.tickCount, overrunCount=self.overrunCount,
+                    skippedTickCount=self.skippedTickCount, droppedWriteCount=self.droppedWriteCount,
+                    lateness=self.lateness.snapshot())
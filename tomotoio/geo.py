@@ -1,6 +1,6 @@
 from math import atan2, degrees, hypot
 from numbers import Number
-from typing import Any
+from typing import Any, Tuple
 
 
 def direction(dx: float, dy: float) -> float:
@@ -31,7 +31,25 @@ def angleDiff(da: float) -> float:
     return ((da + 180) % 360) - 180
 
 
+def normalized(dx: float, dy: float, n: float = 1.0) -> Tuple[float, float]:
+    """Scales (dx, dy) to the length n without creating a Vector.
+
+    Returns:
+        Tuple[float, float] -- Scaled (dx, dy), or (0, 0) if (dx, dy) is (0, 0)
+    """
+    m = hypot(dx, dy)
+    if m == 0:
+        return (0, 0)
+    else:
+        return (dx / m * n, dy / m * n)
+
+
+_numberTypes = frozenset([int, float])
+
+
 class Vector:
+    __slots__ = ('x', 'y')
+
     @staticmethod
     def isPointish(obj: Any):
         return hasattr(obj, 'x') and hasattr(obj, 'y')
@@ -43,8 +61,12 @@ class Vector:
         Vector(p: Point-ish) -- from an object that has x and y as its properties
         Vector(p1: Point-ish, p2: Point-ish) -- from two objects that have x and y properties
         """
+        if x.__class__ in _numberTypes:
+            # Fast path for the common case
+            self.x = x
+            self.y = y
         # dirty hack
-        if self.isPointish(x):
+        elif self.isPointish(x):
             if y is None:
                 self.x = x.x
                 self.y = x.y
@@ -77,6 +99,21 @@ class Vector:
     def __mul__(self, n) -> 'Vector':
         return Vector(self.x * n, self.y * n)
 
+    def __iadd__(self, other) -> 'Vector':
+        self.x += other.x
+        self.y += other.y
+        return self
+
+    def __isub__(self, other) -> 'Vector':
+        self.x -= other.x
+        self.y -= other.y
+        return self
+
+    def __imul__(self, n) -> 'Vector':
+        self.x *= n
+        self.y *= n
+        return self
+
     def interpolate(self, other, n) -> 'Vector':
         return Vector(self.x * (1 - n) + other.x * n, self.y * (1 - n) + other.y * n)
 
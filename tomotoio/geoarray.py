@@ -0,0 +1,65 @@
+"""Vectorized counterparts of the geo functions using NumPy
+
+They work on arrays of positions and angles of many cubes at once, e.g. all the pairwise
+distances of a fleet in one call. The conventions are the same as in geo
+(east=0 and clockwise in degrees). NumPy is an optional dependency (pip install tomotoio[numpy]).
+"""
+from typing import Any, Iterable, Optional, Tuple
+
+import numpy as np
+
+
+def positionsToArrays(positions: Iterable[Optional[Any]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Converts positions (e.g. Navigator.lastPosition of each cube) into arrays.
+
+    Arguments:
+        positions {Iterable} -- Objects that have x, y and angle as their properties, or None if unknown
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray] -- (xs, ys, angles), NaN where the position is None
+    """
+    rows = [(p.x, p.y, p.angle) if p is not None else (np.nan, np.nan, np.nan) for p in positions]
+    a = np.array(rows, float).reshape(-1, 3)
+    return (a[:, 0], a[:, 1], a[:, 2])
+
+
+def directions(dx: np.ndarray, dy: np.ndarray) -> np.ndarray:
+    """Elementwise geo.direction: angles in degrees from (0, 0) to (dx, dy)."""
+    return np.degrees(np.arctan2(dy, dx))
+
+
+def angleDiffs(da: np.ndarray) -> np.ndarray:
+    """Elementwise geo.angleDiff: fits angle differences into [-180, 180)."""
+    return np.mod(np.asarray(da) + 180, 360) - 180
+
+
+def pairwiseDifferences(xs: np.ndarray, ys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns (dx, dy) matrices where [i, j] is the vector from point i to point j."""
+    (xs, ys) = (np.asarray(xs, float), np.asarray(ys, float))
+    return (xs[np.newaxis, :] - xs[:, np.newaxis], ys[np.newaxis, :] - ys[:, np.newaxis])
+
+
+def pairwiseDistances(xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """Returns the matrix of distances where [i, j] is the distance between point i and point j."""
+    return np.hypot(*pairwiseDifferences(xs, ys))
+
+
+def pairwiseDirections(xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """Returns the matrix of bearings where [i, j] is the direction from point i to point j.
+
+    The diagonal is 0 (as geo.direction(0, 0)).
+    """
+    (dx, dy) = pairwiseDifferences(xs, ys)
+    return directions(dx, dy)
+
+
+def pairwiseRelativeBearings(xs: np.ndarray, ys: np.ndarray, angles: np.ndarray) -> np.ndarray:
+    """Returns the matrix where [i, j] is how much cube i has to turn to face point j, in [-180, 180)."""
+    return angleDiffs(pairwiseDirections(xs, ys) - np.asarray(angles, float)[:, np.newaxis])
+
+
+def matMargins(mat: Any, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """Elementwise Mat.margin: distances from the points to the nearest edge of the mat (negative outside)."""
+    (xs, ys) = (np.asarray(xs, float), np.asarray(ys, float))
+    return np.minimum(np.minimum(xs - mat.topLeft.x, ys - mat.topLeft.y),
+                      np.minimum(mat.bottomRight.x - xs, mat.bottomRight.y - ys))
@@ -0,0 +1,104 @@
+"""Cache of the GATT handles of the cubes, kept in a JSON file
+
+Discovering all the characteristics takes a good part of the connection time, while a cube keeps
+the same handles until its firmware changes. With the cache, BlePeer only checks the handles of
+the Toio characteristics with one discovery over their narrow handle range, and discovers them
+all only if they have changed.
+"""
+import json
+import logging as log
+import os
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+
+# (declaration handle, value handle) by the UUID string of a characteristic
+CharacteristicHandles = Dict[str, Tuple[int, int]]
+
+
+class HandleCache:
+    """Handles of the cubes by address, with their protocol version when known.
+
+    Every change is written to the file right away, so that the cubes connected concurrently
+    by the factory can share a cache.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = Lock()
+        self.entries: Dict[str, Dict[str, Any]] = dict()
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    entries = json.load(f)
+                if isinstance(entries, dict):
+                    self.entries = entries
+                else:
+                    log.warning("Ignoring the handle cache %s, which is not a JSON object", path)
+            except ValueError as ex:
+                log.warning("Ignoring the unreadable handle cache %s: %s", path, ex)
+
+    def get(self, address: str) -> Optional[CharacteristicHandles]:
+        """Returns the cached handles, or None if there are none. An empty or malformed entry is removed."""
+        with self.lock:
+            entry = self.entries.get(address.lower())
+            if entry is None:
+                return None
+            handles = _parseHandles(entry)
+            if not handles:
+                log.info("Removing the malformed handle cache entry of %s", address)
+                del self.entries[address.lower()]
+                self._save()
+            return handles
+
+    def getProtocolVersion(self, address: str) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(address.lower())
+            return entry.get('protocolVersion') if isinstance(entry, dict) else None
+
+    def put(self, address: str, characteristics: CharacteristicHandles):
+        with self.lock:
+            entry = self.entries.get(address.lower())
+            handles = {u: list(h) for (u, h) in characteristics.items()}  # As read back from JSON
+            if isinstance(entry, dict) and entry.get('characteristics') == handles:
+                return
+            # New handles mean new firmware, so the version is unknown until read again
+            self.entries[address.lower()] = dict(characteristics=handles, protocolVersion=None)
+            self._save()
+
+    def setProtocolVersion(self, address: str, version: str):
+        with self.lock:
+            entry = self.entries.get(address.lower())
+            if isinstance(entry, dict) and entry.get('protocolVersion') != version:
+                entry['protocolVersion'] = version
+                self._save()
+
+    def remove(self, address: str):
+        with self.lock:
+            if self.entries.pop(address.lower(), None):
+                self._save()
+
+    def _save(self):
+        # Replace the file at once so that a crash does not leave it half written
+        tmpPath = self.path + ".tmp"
+        with open(tmpPath, 'w') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmpPath, self.path)
+
+
+def _parseHandles(entry: Any) -> Optional[CharacteristicHandles]:
+    # Returns None unless the entry has at least one characteristic with a pair of integer handles
+    characteristics = entry.get('characteristics') if isinstance(entry, dict) else None
+    if not isinstance(characteristics, dict) or not characteristics:
+        return None
+    handles = dict()
+    for (u, h) in characteristics.items():
+        if not isinstance(h, list) or len(h) != 2 or not all(type(i) is int for i in h):
+            return None
+        handles[u] = (h[0], h[1])
+    return handles
+
+
+def characteristicHandles(characteristics, uuids) -> CharacteristicHandles:
+    """Picks the handles of the characteristics (as bluepy returns them) of the given UUIDs."""
+    wanted = set(uuids)
+    return {str(c.uuid): (c.handle, c.valHandle) for c in characteristics if c.uuid in wanted}
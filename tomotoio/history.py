@@ -0,0 +1,128 @@
+from array import array
+from math import hypot
+from threading import Lock
+from typing import List, Optional, Tuple
+
+from .geo import angleDiff
+
+# A cube on the mat notifies its position about every 10 ms
+POSITION_NOTIFICATION_INTERVAL = 0.01
+
+
+def historySizeFor(window: float, interval: float = POSITION_NOTIFICATION_INTERVAL, margin: float = 1.5) -> int:
+    """Returns a history size whose samples cover window seconds of notifications every interval, with margin."""
+    return max(int(window / interval * margin) + 1, 2)
+
+
+class PositionHistory:
+    """Fixed-size ring buffer of timestamped poses.
+
+    The samples live in preallocated arrays, so appending is O(1) and allocates nothing.
+    Windowed queries look at the samples within the given number of seconds before the newest one,
+    so a window longer than the size covers (see historySizeFor) is never complete.
+    """
+
+    def __init__(self, size: int = 128):
+        self.size = size
+        self.times = array('d', bytes(8 * size))
+        self.xs = array('d', bytes(8 * size))
+        self.ys = array('d', bytes(8 * size))
+        self.angles = array('d', bytes(8 * size))
+        self.count = 0
+        self.next = 0
+        self.lock = Lock()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, t: float, x: float, y: float, angle: float):
+        with self.lock:
+            i = self.next
+            self.times[i] = t
+            self.xs[i] = x
+            self.ys[i] = y
+            self.angles[i] = angle
+            self.next = (i + 1) % self.size
+            if self.count < self.size:
+                self.count += 1
+
+    def clear(self):
+        with self.lock:
+            self.count = 0
+
+    def latest(self) -> Optional[Tuple[float, float, float, float]]:
+        """Returns the newest sample as (t, x, y, angle)."""
+        with self.lock:
+            if self.count == 0:
+                return None
+            i = (self.next - 1) % self.size
+            return (self.times[i], self.xs[i], self.ys[i], self.angles[i])
+
+    def _window(self, window: float, since: Optional[float] = None) -> Tuple[List[int], bool]:
+        # Returns the indices of the samples in the window (and not older than since) from old to new,
+        # and whether they cover the whole window. Must be called with the lock held.
+        indices: List[int] = list()
+        covered = False
+        if self.count:
+            newest = (self.next - 1) % self.size
+            start = self.times[newest] - window
+            for k in range(self.count):
+                i = (newest - k) % self.size
+                t = self.times[i]
+                if since is not None and t < since:
+                    break
+                indices.append(i)
+                if t <= start:
+                    covered = True
+                    break
+            indices.reverse()
+        return (indices, covered)
+
+    def velocity(self, window: float) -> Optional[Tuple[float, float]]:
+        """Estimates (vx, vy) in units per second by least squares over the window."""
+        with self.lock:
+            (indices, _) = self._window(window)
+            return _slopes([self.times[i] for i in indices],
+                           [self.xs[i] for i in indices], [self.ys[i] for i in indices])
+
+    def speed(self, window: float) -> Optional[float]:
+        v = self.velocity(window)
+        return hypot(*v) if v else None
+
+    def angularVelocity(self, window: float) -> Optional[float]:
+        """Estimates the angular velocity in degrees per second (clockwise positive) by least squares over the window."""
+        with self.lock:
+            (indices, _) = self._window(window)
+            if not indices:
+                return None
+            # Unwrap the angles so that crossing 0/360 does not look like a full turn
+            unwrapped = [self.angles[indices[0]]]
+            for (i0, i1) in zip(indices, indices[1:]):
+                unwrapped.append(unwrapped[-1] + angleDiff(self.angles[i1] - self.angles[i0]))
+            slopes = _slopes([self.times[i] for i in indices], unwrapped)
+            return slopes[0] if slopes else None
+
+    def isStalled(self, window: float, tolerance: float, since: Optional[float] = None) -> bool:
+        """Tells whether the position has stayed within tolerance on both axes for the whole window.
+
+        It is False until the samples (newer than since, if given) cover the window, which needs
+        a history large enough for it.
+        """
+        with self.lock:
+            (indices, covered) = self._window(window, since)
+            if not covered:
+                return False
+            xs = [self.xs[i] for i in indices]
+            ys = [self.ys[i] for i in indices]
+            return max(xs) - min(xs) < tolerance and max(ys) - min(ys) < tolerance
+
+
+def _slopes(ts: List[float], *series: List[float]) -> Optional[Tuple[float, ...]]:
+    n = len(ts)
+    if n < 2:
+        return None
+    mt = sum(ts) / n
+    stt = sum((t - mt) ** 2 for t in ts)
+    if stt == 0:
+        return None
+    return tuple(sum((t - mt) * v for (t, v) in zip(ts, vs)) / stt for vs in series)
@@ -1,68 +1,105 @@
 """Decoder/encoder functions for Toio BLE communication messages"""
 
-from struct import pack, unpack
-from typing import List, Union
+from struct import Struct, error as StructError
+from typing import Callable, Dict, List, Union
 import logging
 
 from .data import *
 
+# Precompiled layouts. unpack() is used rather than unpack_from() so that a message
+# of the wrong length is still rejected with struct.error.
+_positionID = Struct("<BHHHHHH")
+_standardID = Struct("<BIH")
+_motion = Struct("<BBBBB")
+_shortMotion = Struct("<BBB")
+_button = Struct("<BB")
+_battery = Struct("<B")
+_motor = Struct("<BBBBBBBB")
+_light = Struct("<BBBBBBB")
+
+_orientations = tuple(Orientation)
+
 
 def _wrongBytesError(data: bytes) -> ValueError:
     raise ValueError("Wrong bytes '%s'" % data)
 
 
+def _decodePositionID(data: bytes) -> PositionID:
+    # The fields follow the first byte in the same order as in the message
+    return PositionID._make(_positionID.unpack(data)[1:])
+
+
+def _decodeStandardID(data: bytes) -> StandardID:
+    return StandardID._make(_standardID.unpack(data)[1:])
+
+
+def _missedIDDecoder(fromType: ToioIDType) -> Callable[[bytes], MissedID]:
+    return lambda data: MissedID(fromType)
+
+
+# Indexed by the first byte of the message
+_toioIDDecoders: Dict[int, Callable[[bytes], Union[PositionID, StandardID, MissedID]]] = {
+    0x01: _decodePositionID,
+    0x02: _decodeStandardID,
+    0x03: _missedIDDecoder(ToioIDType.POSITION),
+    0x04: _missedIDDecoder(ToioIDType.STANDARD),
+    0xff: _missedIDDecoder(ToioIDType.INVALID),
+}
+
+
 def decodeToioID(data: bytes) -> Union[PositionID, StandardID, MissedID]:
-    if data[0] == 0x01:
-        (_, x, y, a, sx, sy, sa) = unpack("<BHHHHHH", data)
-        return PositionID(x, y, a, sx, sy, sa)
-    if data[0] == 0x02:
-        (_, value, angle) = unpack("<BIH", data)
-        return StandardID(value, angle)
-    if data[0] == 0x03:
-        return MissedID(ToioIDType.POSITION)
-    if data[0] == 0x04:
-        return MissedID(ToioIDType.STANDARD)
-    if data[0] == 0xff:
-        return MissedID(ToioIDType.INVALID)
+    decoder = _toioIDDecoders.get(data[0])
+    if decoder:
+        return decoder(data)
 
     raise _wrongBytesError(data)
 
 
+def _decodeOrientation(value: int) -> Orientation:
+    if value < len(_orientations):
+        return _orientations[value]
+    return Orientation(value)  # raises ValueError
+
+
 def decodeMotion(data: bytes) -> Motion:
     if data[0] == 0x01:
         if len(data) == 3:
-            (_, isLevel, collision) = unpack("<BBB", data)
+            (_, isLevel, collision) = _shortMotion.unpack(data)
             return Motion(isLevel != 0, collision != 0, False, Orientation.INVALID)
         else:
-            (_, isLevel, collision, doubleTap, orientation) = unpack("<BBBBB", data)
-            return Motion(isLevel != 0, collision != 0, doubleTap != 0, Orientation(orientation))
+            (_, isLevel, collision, doubleTap, orientation) = _motion.unpack(data)
+            return Motion(isLevel != 0, collision != 0, doubleTap != 0, _decodeOrientation(orientation))
 
     raise _wrongBytesError(data)
 
 
 def decodeButton(data: bytes) -> bool:
     if data[0] == 0x01:
-        (_, isPressed) = unpack("<BB", data)
+        (_, isPressed) = _button.unpack(data)
         return isPressed != 0
 
     raise _wrongBytesError(data)
 
 
 def decodeBattery(data: bytes) -> int:
-    return unpack("<B", data)[0]
+    return _battery.unpack(data)[0]
 
 
-def _motorDirection(value: int) -> int:
-    return 1 if value >= 0 else 2
+def _pack(layout: Struct, *values) -> bytes:
+    try:
+        return layout.pack(*values)
+    except StructError:
+        # Raise what bytes() does for the same values (ValueError when out of range), as before the layouts
+        return bytes(values)
 
 
 def encodeMotor(left: int, right: int, duration: float = 0) -> bytes:
-    d = min(int(duration * 100), 255)
-    return bytes([2, 1, _motorDirection(left), abs(left), 2, _motorDirection(right), abs(right), d])
+    return _pack(_motor, 2, 1, 1 if left >= 0 else 2, abs(left), 2, 1 if right >= 0 else 2, abs(right),
+                 min(int(duration * 100), 255))
 
 
 def encodeLight(r: int, g: int, b: int, duration: float = 0) -> bytes:
-    return bytes([3, min(int(duration * 100), 255), 1, 1, r, g, b])
+    return _pack(_light, 3, min(int(duration * 100), 255), 1, 1, r, g, b)
 
 
 def encodeLightPattern(lights: List[Light], repeat: int = 0) -> bytes:
@@ -0,0 +1,133 @@
+"""Per-cube performance metrics
+
+Enabled with Cube.enableMetrics(). The peer records the notification arrivals and the writes,
+the cube records how long its listeners take. When disabled, the only cost left is an
+"is None" check on each notification and write.
+"""
+from bisect import bisect_left
+from threading import Lock
+from time import monotonic
+from typing import Any, Dict, Hashable, Optional
+
+from bluepy.btle import UUID
+
+from .constants import UUIDs
+
+# Upper bounds of the histogram buckets in seconds; the last bucket counts everything above
+DEFAULT_BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+_MISSED_ID_KINDS = (0x03, 0x04, 0xff)
+
+_characteristicNames: Dict[UUID, str] = {v: k for (k, v) in vars(UUIDs).items() if isinstance(v, UUID)}
+
+
+def characteristicName(uuid: UUID) -> str:
+    """Returns the name in UUIDs (e.g. TOIO_ID), or the UUID string if unknown."""
+    return _characteristicNames.get(uuid) or str(uuid)
+
+
+class Histogram:
+    """Distribution of durations in fixed buckets. Not thread-safe by itself."""
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(count=self.count,
+                    mean=self.total / self.count if self.count else None,
+                    min=self.min if self.count else None,
+                    max=self.max if self.count else None,
+                    bounds=list(self.bounds),
+                    counts=list(self.counts))
+
+
+class CubeMetrics:
+    """Counters and histograms of one cube.
+
+    The record methods take a characteristic key, which is whatever the recorder finds cheapest
+    (e.g. the handle for BlePeer); setKeyName() gives it the name shown in the snapshot.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.startTime = monotonic()
+        self.keyNames: Dict[Hashable, str] = dict()
+        self.toioIDKey: Optional[Hashable] = None
+        self.lastNotificationTimes: Dict[Hashable, float] = dict()
+        self.notificationIntervals: Dict[Hashable, Histogram] = dict()
+        self.toioIDCount = 0
+        self.missedIDCount = 0
+        self.writeLatency = Histogram()
+        self.queueHighWater = 0
+        self.listenerTimes: Dict[Hashable, Histogram] = dict()
+
+    def setKeyName(self, key: Hashable, name: str):
+        with self.lock:
+            self.keyNames[key] = name
+            if name == 'TOIO_ID':
+                self.toioIDKey = key
+
+    def recordNotification(self, key: Hashable, data: bytes):
+        now = monotonic()
+        with self.lock:
+            last = self.lastNotificationTimes.get(key)
+            self.lastNotificationTimes[key] = now
+            if last is not None:
+                h = self.notificationIntervals.get(key)
+                if h is None:
+                    h = self.notificationIntervals[key] = Histogram()
+                h.add(now - last)
+            if data and self.toioIDKey is not None and key == self.toioIDKey:
+                self.toioIDCount += 1
+                if data[0] in _MISSED_ID_KINDS:
+                    self.missedIDCount += 1
+
+    def recordQueueDepth(self, depth: int):
+        with self.lock:
+            if depth > self.queueHighWater:
+                self.queueHighWater = depth
+
+    def recordWrite(self, enqueueTime: float):
+        """Records a write sent now that was queued at enqueueTime (by monotonic())."""
+        latency = monotonic() - enqueueTime
+        with self.lock:
+            self.writeLatency.add(latency)
+
+    def recordListener(self, key: Hashable, elapsed: float):
+        with self.lock:
+            h = self.listenerTimes.get(key)
+            if h is None:
+                h = self.listenerTimes[key] = Histogram()
+            h.add(elapsed)
+
+    def _name(self, key: Hashable) -> str:
+        name = self.keyNames.get(key)
+        if name:
+            return name
+        return characteristicName(key) if isinstance(key, UUID) else str(key)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns the metrics so far as plain dicts and lists (e.g. for json.dumps)."""
+        with self.lock:
+            return dict(
+                elapsed=monotonic() - self.startTime,
+                notificationIntervals={self._name(k): h.snapshot() for (k, h) in self.notificationIntervals.items()},
+                toioID=dict(count=self.toioIDCount, missed=self.missedIDCount,
+                            missedRatio=self.missedIDCount / self.toioIDCount if self.toioIDCount else None),
+                writeLatency=self.writeLatency.snapshot(),
+                queueHighWater=self.queueHighWater,
+                listenerTimes={self._name(k): h.snapshot() for (k, h) in self.listenerTimes.items()})
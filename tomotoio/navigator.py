@@ -2,16 +2,25 @@ import logging as log
 from enum import Enum
 from math import atan2, cos, degrees, hypot, radians, sin
 from threading import RLock
-from typing import Optional, Tuple, cast
+from time import monotonic
+from typing import TYPE_CHECKING, Optional, Tuple
 
 from .cube import Cube
 from .data import PositionID
 from .geo import *
+from .history import PositionHistory
+
+if TYPE_CHECKING:
+    from .estimator import PoseEstimator
 
 MILLIS_PER_UNIT = 560.0 / 410.0
 AXLE_TRACK_UNITS = 26.6 / MILLIS_PER_UNIT
 MOTOR_DURATION = 1.5
 
+# Approximate wheel speed for a motor speed value of 1, and the smallest value that turns the wheel
+MILLIS_PER_SECOND_PER_SPEED = 4.3
+MIN_MOTOR_SPEED = 8
+
 
 class MatType(Enum):
     TOIO_COLLECTION_1 = 0
@@ -53,11 +62,44 @@ def calcMoveSpeed(distance: float, da: float, currentSpeed: float, maxSpeed: flo
         return (s, r)
 
 
+def calcWheelSpeed(speed: float) -> float:
+    """Converts a motor speed value into the wheel speed in mat units per second."""
+    return 0 if abs(speed) < MIN_MOTOR_SPEED else speed * MILLIS_PER_SECOND_PER_SPEED / MILLIS_PER_UNIT
+
+
+def calcPoseAfter(x: float, y: float, angle: float, left: float, right: float, dt: float) -> Tuple[float, float, float]:
+    """Moves a pose by differential-drive kinematics.
+
+    Arguments:
+        x {float}, y {float}, angle {float} -- Starting pose in the Toio coordinate system
+        left {float}, right {float} -- Motor speed values
+        dt {float} -- Elapsed time in seconds
+
+    Returns:
+        Tuple[float, float, float] -- (x, y, angle) after dt seconds, angle in [0, 360)
+    """
+    (vl, vr) = (calcWheelSpeed(left), calcWheelSpeed(right))
+    v = (vl + vr) / 2
+    w = (vl - vr) / AXLE_TRACK_UNITS  # clockwise, as the Toio angle
+    a0 = radians(angle)
+
+    if abs(w) < 1e-9:
+        return (x + v * cos(a0) * dt, y + v * sin(a0) * dt, angle % 360)
+
+    a1 = a0 + w * dt
+    r = v / w
+    return (x + r * (sin(a1) - sin(a0)), y - r * (cos(a1) - cos(a0)), degrees(a1) % 360)
+
+
 class NavigatorBase:
     def __init__(self, cube: Cube):
         self.cube = cube
         self.mat = Mat()
 
+    def setMotor(self, left: float, right: float, duration: float = 0):
+        # The commands drive the motors through here so that a navigator can keep track of them
+        return self.cube.setMotor(left, right, duration)
+
 
 class NavigationCommandBase:
     def __init__(self, nav: NavigatorBase):
@@ -90,11 +132,11 @@ class RotateCommand(NavigationCommandBase):
             if not isinstance(e, PositionID):
                 return
 
-            da = angleDiff(self.targetAngle - cast(PositionID, e).angle)
+            da = angleDiff(self.targetAngle - e.angle)
             if abs(da) < self.tolerance:
                 self.complete = True
                 self.currentSpeed = 0.0
-                self.cube.setMotor(0, 0)
+                self.nav.setMotor(0, 0)
                 return
             else:
                 self.complete = False
@@ -104,10 +146,10 @@ class RotateCommand(NavigationCommandBase):
 
             if abs(da) < 10 and self.tolerance < 6:
                 # Precise mode (not always working well)
-                self.cube.setMotor(s, -s, 0.02)
+                self.nav.setMotor(s, -s, 0.02)
             else:
                 # Normal mode
-                self.cube.setMotor(s, -s, MOTOR_DURATION)
+                self.nav.setMotor(s, -s, MOTOR_DURATION)
 
 
 class MoveCommand(NavigationCommandBase):
@@ -124,7 +166,8 @@ class MoveCommand(NavigationCommandBase):
                      moveSpeed: float = None, rotateSpeedFactor: float = None,
                      moveRotateThreshold: float = None, fixedSpeed: bool = None):
         with self.lock:
-            self.target = Vector(targetX, targetY)
+            self.targetX = targetX
+            self.targetY = targetY
             self.tolerance = tolerance
             if moveSpeed is not None:
                 self.moveSpeed = moveSpeed
@@ -140,14 +183,14 @@ class MoveCommand(NavigationCommandBase):
             if not isinstance(e, PositionID):
                 return
 
-            v = self.target - Vector(e)
-            da = angleDiff(v.direction() - cast(PositionID, e).angle)
-            distance = v.magnitude()
+            (dx, dy) = (self.targetX - e.x, self.targetY - e.y)
+            da = angleDiff(direction(dx, dy) - e.angle)
+            distance = hypot(dx, dy)
 
             if distance < self.tolerance:
                 self.complete = True
                 self.currentSpeed = 0.0
-                self.cube.setMotor(0, 0)
+                self.nav.setMotor(0, 0)
                 return
             else:
                 self.complete = False
@@ -161,7 +204,7 @@ class MoveCommand(NavigationCommandBase):
 
                 (left, right) = calcMoveSpeed(distance, da, self.currentSpeed, self.moveSpeed, self.fixedSpeed)
                 self.currentSpeed = min(left, right)
-                self.cube.setMotor(left, right, MOTOR_DURATION)
+                self.nav.setMotor(left, right, MOTOR_DURATION)
             else:
                 # Rotate
                 if abs(da) < self.moveRotateThreshold:
@@ -171,7 +214,7 @@ class MoveCommand(NavigationCommandBase):
 
                 s = calcRotateSpeed(da, self.currentSpeed, self.rotateSpeedFactor)
                 self.currentSpeed = abs(s)
-                self.cube.setMotor(s, -s, MOTOR_DURATION)
+                self.nav.setMotor(s, -s, MOTOR_DURATION)
 
 
 class CircleCommand(NavigationCommandBase):
@@ -183,7 +226,8 @@ class CircleCommand(NavigationCommandBase):
         self.updateTarget(centerX, centerY, radius)
 
     def updateTarget(self, centerX: float, centerY: float, radius: float, moveSpeed: float = None):
-        self.center = Vector(centerX, centerY)
+        self.centerX = centerX
+        self.centerY = centerY
         self.radius = radius
         if moveSpeed is not None:
             self.moveSpeed = moveSpeed
@@ -193,30 +237,61 @@ class CircleCommand(NavigationCommandBase):
             if not isinstance(e, PositionID):
                 return
 
-            v = (Vector(e) - self.center).normalize()
-            d = self.rotateDirection
-            t = self.center + v.transform((1, -0.5 * d, 0.5 * d, 1)) * self.radius
-            self.moveCommand.updateTarget(t.x, t.y, 0, moveSpeed=self.moveSpeed)
+            # Aim ahead of the cube on the circle, i.e. rotate the radius vector by atan(0.5)
+            (vx, vy) = normalized(e.x - self.centerX, e.y - self.centerY)
+            k = 0.5 * self.rotateDirection
+            tx = self.centerX + (vx - k * vy) * self.radius
+            ty = self.centerY + (k * vx + vy) * self.radius
+            self.moveCommand.updateTarget(tx, ty, 0, moveSpeed=self.moveSpeed)
             self.moveCommand.handleNotification(e)
 
-            if self.nav.mat.margin(t.x, t.y) < 10:
+            if self.nav.mat.margin(tx, ty) < 10:
                 self.rotateDirection *= -1
 
 
 class Navigator(NavigatorBase):
-    def __init__(self, cube: Cube):
+    def __init__(self, cube: Cube, historySize: int = 128, estimator: Optional['PoseEstimator'] = None):
         super().__init__(cube)
         self.lastPosition: Optional[PositionID] = None
+        # Positions with their monotonic() times, for velocity estimates and stall detection
+        self.history = PositionHistory(historySize)
+        # If given, the commands steer on the predicted pose instead of the last measured one
+        self.estimator = estimator
         self.command: Optional[NavigationCommandBase] = None
 
         cube.toioID.addListener(self._handleNotification)
         cube.toioID.enableNotification()
 
+    def setMotor(self, left: float, right: float, duration: float = 0):
+        if self.estimator:
+            self.estimator.recordMotor(monotonic(), left, right, duration)
+        return self.cube.setMotor(left, right, duration)
+
+    def trySetMotor(self, left: float, right: float, duration: float = 0) -> bool:
+        if not self.cube.trySetMotor(left, right, duration):
+            return False
+        if self.estimator:
+            self.estimator.recordMotor(monotonic(), left, right, duration)
+        return True
+
+    def predictPosition(self) -> Optional[PositionID]:
+        """Returns the pose predicted for now by the estimator, or None if unavailable."""
+        if not self.estimator:
+            return None
+        p = self.estimator.predict(monotonic())
+        return PositionID(p[0], p[1], p[2], p[0], p[1], p[2]) if p else None
+
     def _handleNotification(self, e):
+        now = monotonic()
         if isinstance(e, PositionID):
             self.lastPosition = e
+            self.history.append(now, e.x, e.y, e.angle)
+            if self.estimator:
+                self.estimator.update(now, e.x, e.y, e.angle)
 
         if self.command:
+            if self.estimator:
+                e = self.estimator.predictPositionID(now, e)
             self.command.handleNotification(e)
 
     def move(self, targetX: float, targetY: float, tolerance: float, moveRotateThreshold: float = 30, fixedSpeed: bool = False):
@@ -0,0 +1,211 @@
+"""Recording and replay of the raw notification stream
+
+A recording is a header followed by fixed 8-byte record headers, each followed by its payload:
+
+    kind (uint8), microseconds since the previous record (uint32), characteristic index (uint8), length (uint16)
+
+A characteristic is defined by a DEFINE record carrying its 16-byte UUID the first time it appears,
+and is referred to by its index after that.
+"""
+from struct import Struct
+from threading import Lock, Thread
+from time import monotonic, sleep
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional
+
+from bluepy.btle import UUID
+
+from .cube import CharacteristicListenerFunc, Peer, PeerListenerFunc, WriteDropListenerFunc
+from .metrics import CubeMetrics
+
+MAGIC = b'TMTR\x01'
+
+DEFINE = 0
+NOTIFICATION = 1
+WRITE = 2
+WRITE_WITH_RESPONSE = 3
+
+_recordHeader = Struct("<BIBH")
+_MAX_DELTA = 0xFFFFFFFF
+
+
+class RecordedEvent(NamedTuple):
+    kind: int
+    time: float  # seconds since the start of the recording
+    uuid: UUID
+    data: bytes
+
+
+class Recorder:
+    def __init__(self, path: str):
+        self.file: BinaryIO = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.lock = Lock()
+        self.uuidIndices: Dict[UUID, int] = dict()
+        self.lastTime = monotonic()
+
+    def _writeRecord(self, kind: int, index: int, data: bytes):
+        now = monotonic()
+        delta = min(int((now - self.lastTime) * 1000000), _MAX_DELTA)
+        # Advance by what was recorded so that rounding errors do not accumulate
+        self.lastTime += delta / 1000000
+        self.file.write(_recordHeader.pack(kind, delta, index, len(data)))
+        self.file.write(data)
+
+    def record(self, kind: int, uuid: UUID, data: bytes):
+        with self.lock:
+            index = self.uuidIndices.get(uuid)
+            if index is None:
+                index = len(self.uuidIndices)
+                self.uuidIndices[uuid] = index
+                self._writeRecord(DEFINE, index, uuid.binVal)
+            self._writeRecord(kind, index, data)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def readRecording(path: str) -> Iterator[RecordedEvent]:
+    """Iterates the notifications and writes in a recording."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a recording" % path)
+
+        uuids: List[UUID] = list()
+        time = 0.0
+        while True:
+            header = f.read(_recordHeader.size)
+            if len(header) < _recordHeader.size:
+                return  # A truncated last record is expected if the recorder did not close cleanly
+            (kind, delta, index, length) = _recordHeader.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+
+            time += delta / 1000000
+            if kind == DEFINE:
+                uuids.append(UUID(data.hex()))
+            else:
+                yield RecordedEvent(kind, time, uuids[index], data)
+
+
+class RecordingPeer(Peer):
+    """Peer passing everything through to another peer while recording the notifications and writes."""
+
+    def __init__(self, peer: Peer, path: str):
+        self.peer = peer
+        self.recorder = Recorder(path)
+        self.listeners: List[PeerListenerFunc] = list()
+
+        peer.addListener(self._handleNotification)
+
+    def _handleNotification(self, uuid: UUID, data: bytes):
+        self.recorder.record(NOTIFICATION, uuid, data)
+        for listener in self.listeners:
+            listener(uuid, data)
+
+    def disconnect(self):
+        self.peer.disconnect()
+        self.recorder.close()
+
+    def read(self, uuid: UUID) -> bytes:
+        return self.peer.read(uuid)
+
+    def write(self, uuid: UUID, data: bytes, withResponse: bool = False) -> Optional[bool]:
+        self.recorder.record(WRITE_WITH_RESPONSE if withResponse else WRITE, uuid, data)
+        return self.peer.write(uuid, data, withResponse)
+
+    def tryWrite(self, uuid: UUID, data: bytes, withResponse: bool = False) -> bool:
+        if not self.peer.tryWrite(uuid, data, withResponse):
+            return False
+        self.recorder.record(WRITE_WITH_RESPONSE if withResponse else WRITE, uuid, data)
+        return True
+
+    def enableNotification(self, uuid: UUID, value: bool = True):
+        self.peer.enableNotification(uuid, value)
+
+    def addListener(self, listener: PeerListenerFunc):
+        self.listeners.append(listener)
+
+    def addCharacteristicListener(self, uuid: UUID, listener: CharacteristicListenerFunc):
+        # Every notification is recorded by _handleNotification anyway
+        self.peer.addCharacteristicListener(uuid, listener)
+
+    def setMetrics(self, metrics: Optional[CubeMetrics]):
+        self.peer.setMetrics(metrics)
+
+    def setProtocolVersion(self, version: str):
+        self.peer.setProtocolVersion(version)
+
+    def addWriteDropListener(self, listener: WriteDropListenerFunc):
+        self.peer.addWriteDropListener(listener)
+
+
+class ReplayPeer(Peer):
+    """Peer feeding the notifications of a recording to its listeners.
+
+    speed is relative to the recorded timing (e.g. 1.0 or 10.0); None replays as fast as possible.
+    The replay starts on its own thread when a notification is enabled, or synchronously with replay().
+    Writes are counted but otherwise ignored; a read returns the last notified value, or the first
+    recorded one before that.
+    """
+
+    def __init__(self, path: str, speed: Optional[float] = 1.0):
+        self.path = path
+        self.speed = speed
+        self.listeners: List[PeerListenerFunc] = list()
+        self.lastValues: Dict[UUID, bytes] = dict()
+        self.writeCount = 0
+        self.notificationCount = 0
+        self.thread: Optional[Thread] = None
+        self.running = False
+
+    def disconnect(self):
+        t = self.thread
+        self.running = False
+        if t:
+            t.join()
+            self.thread = None
+
+    def read(self, uuid: UUID) -> bytes:
+        data = self.lastValues.get(uuid)
+        if data is not None:
+            return data
+        for e in readRecording(self.path):
+            if e.kind == NOTIFICATION and e.uuid == uuid:
+                return e.data
+        raise ValueError("%s has no notification of %s to read" % (self.path, uuid))
+
+    def write(self, uuid: UUID, data: bytes, withResponse: bool = False):
+        self.writeCount += 1
+
+    def enableNotification(self, uuid: UUID, value: bool = True):
+        if value and not self.thread:
+            self.running = True
+            self.thread = Thread(name="Replay of %s" % self.path, target=self.replay)
+            self.thread.setDaemon(True)
+            self.thread.start()
+
+    def addListener(self, listener: PeerListenerFunc):
+        self.listeners.append(listener)
+
+    def replay(self):
+        """Delivers all the recorded notifications, waiting between them unless speed is None."""
+        self.running = True
+        start = monotonic()
+        for e in readRecording(self.path):
+            if not self.running:
+                break
+            if e.kind != NOTIFICATION:
+                continue
+
+            if self.speed:
+                delay = start + e.time / self.speed - monotonic()
+                if delay > 0:
+                    sleep(delay)
+
+            self.lastValues[e.uuid] = e.data
+            self.notificationCount += 1
+            for listener in self.listeners:
+                listener(e.uuid, e.data)
+        self.running = False
@@ -1,12 +1,22 @@
 import argparse
+import json
 import logging as log
+import os
 import sys
-from typing import List
+from time import monotonic, time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 from bluepy.btle import UUID, DefaultDelegate, Scanner
 
 from tomotoio.constants import UUIDs
 
+# How long Scanner.process() runs between the checks for the cubes found
+SCAN_SLICE = 0.1
+
+
+def _isCube(dev) -> bool:
+    return any(adtype == 0x07 and UUID(value) == UUIDs.SERVICE for (adtype, desc, value) in dev.getScanData())
+
 
 class DebugScanDelegate(DefaultDelegate):
     def __init__(self):
@@ -25,15 +35,102 @@ class DebugScanDelegate(DefaultDelegate):
             log.debug("  %s (%d): %s" % (desc, adtype, value))
 
 
+class _CubeScanDelegate(DebugScanDelegate):
+    def __init__(self):
+        super().__init__()
+        self.reported: Dict[str, int] = dict()
+        self.found: List[Tuple[str, int]] = list()
+
+    def handleDiscovery(self, dev, isNewDev, isNewData):
+        super().handleDiscovery(dev, isNewDev, isNewData)
+        # The service UUID may come in a later scan response, so check until found
+        if (isNewDev or isNewData) and dev.addr not in self.reported and _isCube(dev):
+            self.reported[dev.addr] = dev.rssi
+            self.found.append((dev.addr, dev.rssi))
+
+
+class ScanCache:
+    """When and how well each cube was last seen, kept in a JSON file.
+
+    It lets an application go straight to connecting to the cubes seen recently.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict[str, float]] = dict()
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    entries = json.load(f)
+                if isinstance(entries, dict):
+                    self.entries = {a: e for (a, e) in entries.items()
+                                    if isinstance(e, dict) and isinstance(e.get('lastSeen'), (int, float))}
+                else:
+                    log.warning("Ignoring the scan cache %s, which is not a JSON object", path)
+            except ValueError as ex:
+                log.warning("Ignoring the unreadable scan cache %s: %s", path, ex)
+
+    def update(self, address: str, rssi: int, seen: Optional[float] = None):
+        self.entries[address] = dict(lastSeen=seen if seen is not None else time(), rssi=rssi)
+
+    def recent(self, maxAge: float) -> List[str]:
+        """Returns the addresses seen within maxAge seconds, the latest first."""
+        now = time()
+        entries = [(e['lastSeen'], a) for (a, e) in self.entries.items() if now - e['lastSeen'] <= maxAge]
+        return [a for (_, a) in sorted(entries, reverse=True)]
+
+    def save(self):
+        # Replace the file at once so that an interrupted scan does not leave it half written
+        tmpPath = self.path + ".tmp"
+        with open(tmpPath, 'w') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmpPath, self.path)
+
+
+def streamCubes(timeout: float = 10, iface: int = 0, expectedCount: Optional[int] = None,
+                knownAddresses: Optional[Iterable[str]] = None,
+                cache: Optional[ScanCache] = None) -> Iterator[Tuple[str, int]]:
+    """Yields (address, RSSI) of each cube as soon as its advertisement arrives.
+
+    The scan ends after timeout seconds, or as soon as expectedCount cubes or all the knownAddresses
+    have been found, whichever comes first. The cubes found are recorded in the cache if given
+    (saving it is up to the caller).
+    """
+    known = set(a.lower() for a in knownAddresses) if knownAddresses else None
+    found = set()
+    delegate = _CubeScanDelegate()
+    scanner = Scanner(iface).withDelegate(delegate)
+    scanner.start()
+    try:
+        deadline = monotonic() + timeout
+        while True:
+            remain = deadline - monotonic()
+            if remain <= 0:
+                return
+            scanner.process(min(SCAN_SLICE, remain))
+
+            (newCubes, delegate.found) = (delegate.found, list())
+            for (address, rssi) in newCubes:
+                found.add(address)
+                if cache:
+                    cache.update(address, rssi)
+                yield (address, rssi)
+
+            if expectedCount is not None and len(found) >= expectedCount:
+                return
+            if known and known <= found:
+                return
+    finally:
+        scanner.stop()
+
+
+def scanCubesWithRSSI(timeout: float, iface: int = 0) -> Dict[str, int]:
+    """Scans the cubes through an interface and returns their RSSI in dB by address."""
+    return dict(streamCubes(timeout, iface))
+
+
 def scanCubes(timeout: float, iface: int = 0) -> List[str]:
-    result = list()
-    scanner = Scanner(iface).withDelegate(DebugScanDelegate())
-    devices = scanner.scan(timeout)
-    for dev in devices:
-        for (adtype, desc, value) in dev.getScanData():
-            if adtype == 0x07 and UUID(value) == UUIDs.SERVICE:
-                result.append(dev.addr)
-    return result
+    return list(scanCubesWithRSSI(timeout, iface))
 
 
 if __name__ == '__main__':
@@ -42,6 +139,12 @@ if __name__ == '__main__':
                         help="Bluetooth interface number", default=0)
     parser.add_argument('-t', dest='timeout', type=int,
                         help="Timeout in seconds", default=10)
+    parser.add_argument('-n', dest='count', type=int,
+                        help="Stop as soon as this many cubes are found")
+    parser.add_argument('-k', dest='knownFile',
+                        help="File of known addresses; stop as soon as all of them are found")
+    parser.add_argument('-c', dest='cacheFile',
+                        help="JSON file to record when and how well each cube was last seen")
     parser.add_argument('-v', dest='verbose',
                         action='store_true', help="Verbose logging")
 
@@ -50,8 +153,21 @@ if __name__ == '__main__':
     except:
         sys.exit(1)
 
+    known: List[str] = list()
+    if args.knownFile and os.path.exists(args.knownFile):
+        with open(args.knownFile) as f:
+            known = [s.strip().lower() for s in f.readlines() if s.strip()]
+    cache = ScanCache(args.cacheFile) if args.cacheFile else None
+
     log.basicConfig(level=log.DEBUG)
-    log.info("Scanning the cubes for %d seconds..." % args.timeout)
-    cubes = scanCubes(args.timeout, args.iface)
-    for cube in sorted(cubes):
+    log.info("Scanning the cubes for up to %d seconds..." % args.timeout)
+    cubes = set()
+    for (address, rssi) in streamCubes(args.timeout, args.iface, args.count, known, cache):
+        log.info("Found %s (RSSI=%ddB)" % (address, rssi))
+        cubes.add(address)
+    if cache:
+        cache.save()
+
+    # The known cubes keep their order (and so their numbers); new ones follow
+    for cube in [a for a in known if a in cubes] + sorted(cubes - set(known)):
         print(cube)
@@ -0,0 +1,179 @@
+"""Kinematic simulator of a cube for running without hardware"""
+from struct import pack
+from threading import RLock, Thread
+from time import monotonic, sleep
+from typing import List, Optional, Set, Tuple
+
+from bluepy.btle import UUID
+
+from .constants import UUIDs
+from .cube import Peer, PeerListenerFunc
+from .messages import encodeConfigProtocolVersionRequest
+from .navigator import Mat, calcPoseAfter
+
+SIM_PROTOCOL_VERSION = "2.1.0"
+
+
+def _encodePositionID(x: float, y: float, angle: float) -> bytes:
+    (x, y, a) = (int(round(x)), int(round(y)), int(round(angle)) % 360)
+    return pack("<BHHHHHH", 0x01, x, y, a, x, y, a)
+
+
+def _encodeMotion(collision: bool = False, doubleTap: bool = False) -> bytes:
+    return bytes([0x01, 1, int(collision), int(doubleTap), 1])
+
+
+def _decodeMotor(data: bytes) -> Tuple[float, float, float]:
+    def speed(direction: int, value: int) -> float:
+        return value if direction == 1 else -value
+
+    if data[0] == 0x01:
+        return (speed(data[2], data[3]), speed(data[5], data[6]), 0)
+    if data[0] == 0x02:
+        return (speed(data[2], data[3]), speed(data[5], data[6]), data[7] / 100)
+    raise ValueError("Unsupported motor command '%s'" % data)
+
+
+class SimPeer(Peer):
+    """Peer simulating a cube driving on a mat.
+
+    It understands the motor commands, moves the cube by differential-drive kinematics and notifies
+    the position every notificationInterval of simulated time. Leaving the mat notifies a missed ID.
+
+    With timeScale, a thread runs the simulation in real time (1.0) or faster (e.g. 10.0) once
+    a notification is enabled. With timeScale=None, the caller drives it with step() or run(),
+    which go as fast as possible and are deterministic.
+    """
+
+    def __init__(self, x: float = None, y: float = None, angle: float = 0, mat: Mat = None,
+                 notificationInterval: float = 0.01, timeScale: Optional[float] = 1.0):
+        self.mat = mat if mat else Mat()
+        self.x = x if x is not None else self.mat.center.x
+        self.y = y if y is not None else self.mat.center.y
+        self.angle = angle
+        self.notificationInterval = notificationInterval
+        self.timeScale = timeScale
+
+        self.lock = RLock()
+        self.listeners: List[PeerListenerFunc] = list()
+        self.notifyingUUIDs: Set[UUID] = set()
+        self.time = 0.0
+        self.nextNotificationTime = notificationInterval
+        self.motor = (0.0, 0.0)
+        self.motorExpiry: Optional[float] = None
+        self.lastToioID: Optional[bytes] = None
+        self.configResponse = bytes([0x81, 0x00])
+        self.thread: Optional[Thread] = None
+        self.running = False
+
+    def isOnMat(self) -> bool:
+        return self.mat.margin(self.x, self.y) >= 0
+
+    def _toioIDData(self) -> bytes:
+        return _encodePositionID(self.x, self.y, self.angle) if self.isOnMat() else bytes([0x03])
+
+    def disconnect(self):
+        t = self.thread
+        self.running = False
+        if t:
+            t.join()
+            self.thread = None
+
+    def read(self, uuid: UUID) -> bytes:
+        with self.lock:
+            if uuid == UUIDs.TOIO_ID:
+                return self._toioIDData()
+            if uuid == UUIDs.MOTION:
+                return _encodeMotion()
+            if uuid == UUIDs.BUTTON:
+                return bytes([0x01, 0x00])
+            if uuid == UUIDs.BATTERY:
+                return bytes([100])
+            if uuid == UUIDs.CONFIG:
+                return self.configResponse
+            raise ValueError("Unknown characteristic %s" % uuid)
+
+    def write(self, uuid: UUID, data: bytes, withResponse: bool = False):
+        with self.lock:
+            if uuid == UUIDs.MOTOR:
+                (left, right, duration) = _decodeMotor(data)
+                self.motor = (left, right)
+                self.motorExpiry = self.time + duration if duration else None
+            elif uuid == UUIDs.CONFIG and data == encodeConfigProtocolVersionRequest():
+                self.configResponse = bytes([0x81, 0x00]) + SIM_PROTOCOL_VERSION.encode()
+            # Light, sound and the other config writes do not affect the simulation
+
+    def enableNotification(self, uuid: UUID, value: bool = True):
+        with self.lock:
+            if value:
+                self.notifyingUUIDs.add(uuid)
+            else:
+                self.notifyingUUIDs.discard(uuid)
+
+            if value and self.timeScale and not self.thread:
+                self.running = True
+                self.thread = Thread(name="Simulation for %s" % self, target=self._runRealTime)
+                self.thread.setDaemon(True)
+                self.thread.start()
+
+    def addListener(self, listener: PeerListenerFunc):
+        self.listeners.append(listener)
+
+    def _notify(self, notifications: List[Tuple[UUID, bytes]]):
+        for (uuid, data) in notifications:
+            for listener in self.listeners:
+                listener(uuid, data)
+
+    def _move(self, dt: float):
+        if dt > 0 and self.motor != (0.0, 0.0):
+            (self.x, self.y, self.angle) = calcPoseAfter(self.x, self.y, self.angle,
+                                                         self.motor[0], self.motor[1], dt)
+        self.time += dt
+
+    def step(self, dt: float):
+        """Advances the simulation by dt seconds and delivers the notifications due in the meantime."""
+        notifications: List[Tuple[UUID, bytes]] = list()
+
+        with self.lock:
+            end = self.time + dt
+            while True:
+                t = min(end, self.nextNotificationTime)
+                if self.motorExpiry is not None and self.motorExpiry <= t:
+                    self._move(self.motorExpiry - self.time)
+                    self.motor = (0.0, 0.0)
+                    self.motorExpiry = None
+                self._move(t - self.time)
+
+                if t == end and t < self.nextNotificationTime:
+                    break
+
+                self.nextNotificationTime += self.notificationInterval
+                if UUIDs.TOIO_ID in self.notifyingUUIDs:
+                    data = self._toioIDData()
+                    # Like a real cube, a missed ID is notified only once when it leaves the mat
+                    if data[0] != 0x03 or data != self.lastToioID:
+                        notifications.append((UUIDs.TOIO_ID, data))
+                    self.lastToioID = data
+
+        self._notify(notifications)
+
+    def run(self, duration: float):
+        """Advances the simulation by duration seconds, one notification interval at a time, without waiting."""
+        end = self.time + duration
+        while self.time < end:
+            self.step(min(self.notificationInterval, end - self.time))
+
+    def collide(self, doubleTap: bool = False):
+        """Simulates a collision (or a double tap) by notifying the motion."""
+        if UUIDs.MOTION in self.notifyingUUIDs:
+            self._notify([(UUIDs.MOTION, _encodeMotion(not doubleTap, doubleTap))])
+
+    def _runRealTime(self):
+        interval = self.notificationInterval / self.timeScale
+        deadline = monotonic()
+        while self.running:
+            deadline += interval
+            delay = deadline - monotonic()
+            if delay > 0:
+                sleep(delay)
+            self.step(self.notificationInterval)
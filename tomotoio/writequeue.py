@@ -0,0 +1,120 @@
+from collections import deque
+from enum import Enum
+from queue import Full
+from threading import Condition, Lock
+from time import monotonic
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+WriteArgs = Tuple[int, bytes, bool]
+
+
+class OverflowPolicy(Enum):
+    """What a write does when the queue is full."""
+    BLOCK = 0  # Wait for room, up to the timeout of the queue, then raise queue.Full
+    DROP_OLDEST = 1  # Discard the oldest pending write to make room
+    DROP_NEWEST = 2  # Discard the new write
+    RAISE = 3  # Raise queue.Full at once
+
+
+class WriteQueue:
+    """Queue of writes waiting for the I/O thread.
+
+    Writes are sent in FIFO order, except for the handles given as coalescingHandles
+    (e.g. motor and light), where only the latest pending payload is kept: a new write
+    replaces the pending one in place, so stale commands are never sent and take no room.
+    When the queue is full, a write follows the policy (see OverflowPolicy); timeout (None for
+    no limit) applies to BLOCK. onEvict, if set, is called with the handle and data of each
+    pending write that DROP_OLDEST discards. With timed set, each entry is stamped with the time it was queued.
+    """
+
+    def __init__(self, maxsize: int = 100, coalescingHandles: Iterable[int] = (),
+                 policy: OverflowPolicy = OverflowPolicy.BLOCK, timeout: Optional[float] = None):
+        self.maxsize = maxsize
+        self.coalescingHandles = set(coalescingHandles)
+        self.policy = policy
+        self.timeout = timeout
+        self.coalescedCount = 0
+        self.droppedOldestCount = 0
+        self.droppedNewestCount = 0
+        self.rejectedCount = 0  # Raised queue.Full, either by RAISE or by the timeout of BLOCK
+        self.timed = False  # Set while the metrics need the write latency
+        self.onEvict: Optional[Callable[[int, bytes], Any]] = None
+        self.lock = Lock()
+        self.notFull = Condition(self.lock)
+        self.entries: Deque[List] = deque()
+        self.pendingEntries: Dict[int, List] = dict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def put(self, handle: int, data: bytes, withResponse: bool = False,
+            policy: Optional[OverflowPolicy] = None) -> bool:
+        """Queues a write, or replaces the pending one of a coalescing handle (which always has room).
+
+        policy overrides the one of the queue for this write. Returns False if the write was dropped
+        by DROP_NEWEST; raises queue.Full as the policy says.
+        """
+        with self.lock:
+            coalescing = handle in self.coalescingHandles
+            if coalescing:
+                entry = self.pendingEntries.get(handle)
+                if entry:
+                    entry[1] = data
+                    entry[2] = withResponse
+                    entry[3] = monotonic() if self.timed else 0.0
+                    self.coalescedCount += 1
+                    return True
+
+            if len(self.entries) >= self.maxsize and not self._makeRoom(policy if policy else self.policy):
+                return False
+
+            entry = [handle, data, withResponse, monotonic() if self.timed else 0.0]
+            self.entries.append(entry)
+            if coalescing:
+                self.pendingEntries[handle] = entry
+            return True
+
+    def tryPut(self, handle: int, data: bytes, withResponse: bool = False) -> bool:
+        """Queues a write only if it can be done without waiting. Returns whether it was queued."""
+        return self.put(handle, data, withResponse, OverflowPolicy.DROP_NEWEST)
+
+    def _makeRoom(self, policy: OverflowPolicy) -> bool:
+        # Must be called with the lock held
+        if policy == OverflowPolicy.BLOCK:
+            if not self.notFull.wait_for(lambda: len(self.entries) < self.maxsize, self.timeout):
+                self.rejectedCount += 1
+                raise Full()
+        elif policy == OverflowPolicy.DROP_OLDEST:
+            entry = self.entries.popleft()
+            if self.pendingEntries.get(entry[0]) is entry:
+                del self.pendingEntries[entry[0]]
+            self.droppedOldestCount += 1
+            if self.onEvict:
+                self.onEvict(entry[0], entry[1])
+        elif policy == OverflowPolicy.DROP_NEWEST:
+            self.droppedNewestCount += 1
+            return False
+        else:
+            self.rejectedCount += 1
+            raise Full()
+        return True
+
+    def get(self) -> Optional[WriteArgs]:
+        """Takes the next write without blocking. Returns None if there is none."""
+        timed = self.getTimed()
+        return timed[0] if timed else None
+
+    def getTimed(self) -> Optional[Tuple[WriteArgs, float]]:
+        """Same as get(), but also returns when the write (or its latest payload if coalesced) was queued.
+
+        The time is 0.0 if the queue was not timed then.
+        """
+        with self.lock:
+            if not self.entries:
+                return None
+
+            entry = self.entries.popleft()
+            if self.pendingEntries.get(entry[0]) is entry:
+                del self.pendingEntries[entry[0]]
+            self.notFull.notify()
+            return ((entry[0], entry[1], entry[2]), entry[3])